@@ -9,9 +9,10 @@
 # See the Mulan PSL v2 for more details.
 
 from .base_kit import NSUSoc, InitParamSet
+from .async_kit import AsyncNSUSoc
 
 
-__all__ = ['NSUSoc', 'InitParamSet']
+__all__ = ['NSUSoc', 'AsyncNSUSoc', 'InitParamSet']
 
 __version_pack__ = (0, 2, 0)
 
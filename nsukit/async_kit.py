@@ -0,0 +1,243 @@
+# Copyright (c) [2023] [NaiShu]
+# [NSUKit] is licensed under Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#          http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND,
+# EITHER EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT,
+# MERCHANTABILITY OR FIT FOR A PARTICULAR PURPOSE.
+# See the Mulan PSL v2 for more details.
+
+import asyncio
+import collections.abc as abc
+from typing import Any, Union, Iterable, Callable, Optional
+
+import numpy as np
+
+from .base_kit import KitMeta
+from .middleware.icd_parser import ICDRegMw
+from .interface import InitParamSet
+from .interface.async_tcp_interface import AsyncTCPCmdUItf, AsyncTCPStreamUItf
+from .tools.check_func import check_reg_schema, check_reg_u32, check_reg_array, reg_rows_u32
+
+
+class AsyncNSUSoc(metaclass=KitMeta):
+    """!
+    @anchor AsyncNSUKit_class
+    @brief 基于asyncio的板卡级交互接口
+    @details 与NSUSoc的用法一致，但收发相关的方法均为协程；一个事件循环即可同时驱动多张板卡，
+    指令的编解码复用ICDRegMw
+    """
+    CmdMiddleware = ICDRegMw
+
+    def __init__(self,
+                 cs_itf_class=AsyncTCPCmdUItf,
+                 ds_itf_class=AsyncTCPStreamUItf,
+                 link_param: InitParamSet = None):
+        """!
+        @brief 初始化接口
+        @param cs_itf_class: 异步指令类
+        @param ds_itf_class: 异步数据流类
+        @param link_param: 连接参数
+
+        ---
+        示例代码如下
+        @code
+        >>> import asyncio
+        >>> from nsukit import AsyncNSUSoc, InitParamSet
+        >>> async def main():
+        >>>     kit = AsyncNSUSoc(link_param=InitParamSet(cmd_ip='127.0.0.1'))
+        >>>     await kit.link_cmd()
+        >>>     await kit.execute('RF配置')
+        >>> asyncio.run(main())
+        @endcode
+        """
+        self.itf_cs: AsyncTCPCmdUItf = cs_itf_class()
+        self.itf_ds: AsyncTCPStreamUItf = ds_itf_class()
+        self.mw_cmd: ICDRegMw = self.CmdMiddleware(self)
+        self.link_param: InitParamSet = InitParamSet() if link_param is None else link_param
+
+    async def link_cmd(self) -> None:
+        """!
+        @brief 建立cmd连接并加载icd
+        @return: None
+        """
+        await self.itf_cs.accept(self.link_param)
+        self.mw_cmd.config(self.link_param)
+
+    async def link_stream(self) -> None:
+        """!
+        @brief 建立stream连接
+        @return: None
+        """
+        await self.itf_ds.accept(self.link_param)
+
+    async def unlink_cmd(self) -> None:
+        await self.itf_cs.close()
+
+    async def unlink_stream(self) -> None:
+        await self.itf_ds.close()
+
+    async def write(self, addr: Union[int, Iterable[int]], value: Union[bytes, Iterable[bytes]]) -> None:
+        """!
+        @brief 写寄存器
+        @details 同[NSUSoc.write](#nsukit.base_kit.NSUSoc.write)
+        @param addr: 寄存器地址
+        @param value: 要写入的值，为一len为4的bytes对象
+        @return: 无返回值，无报错即成功
+        """
+        check_reg_schema(addr, value)
+        if isinstance(value, np.ndarray):
+            await self.write_array(addr, reg_rows_u32(value))
+        elif isinstance(addr, int) and isinstance(value, bytes):
+            await self.itf_cs.write(addr, value)
+        elif isinstance(addr, abc.Iterable) and isinstance(value, abc.Iterable):
+            await self.itf_cs.multi_write(addr, value)
+
+    async def read(self, addr: Union[int, Iterable[int]]) -> Union[bytes, Iterable[bytes]]:
+        """!
+        @brief 读寄存器
+        @details 同[NSUSoc.read](#nsukit.base_kit.NSUSoc.read)
+        @param addr: 寄存器地址
+        @return: 读出的值，为一len为4的bytes对象
+        """
+        check_reg_schema(addr)
+        if isinstance(addr, int):
+            return await self.itf_cs.read(addr)
+        elif isinstance(addr, abc.Iterable):
+            return await self.itf_cs.multi_read(addr)
+
+    async def write_u32(self, addr: int, value: int) -> None:
+        """!
+        @brief 以整数写寄存器，同[NSUSoc.write_u32](#nsukit.base_kit.NSUSoc.write_u32)
+        """
+        check_reg_u32(addr, value)
+        await self.itf_cs.write_u32(addr, value)
+
+    async def read_u32(self, addr: int) -> int:
+        """!
+        @brief 以整数读寄存器，同[NSUSoc.read_u32](#nsukit.base_kit.NSUSoc.read_u32)
+        """
+        check_reg_u32(addr)
+        return await self.itf_cs.read_u32(addr)
+
+    async def write_array(self, addr: "Union[Iterable[int], np.ndarray]", value: "Union[Iterable[int], np.ndarray]") -> None:
+        """!
+        @brief 以数组写一组寄存器，同[NSUSoc.write_array](#nsukit.base_kit.NSUSoc.write_array)
+        """
+        await self.itf_cs.write_array(*check_reg_array(addr, value))
+
+    async def read_array(self, addr: "Union[Iterable[int], np.ndarray]") -> np.ndarray:
+        """!
+        @brief 以数组读一组寄存器，同[NSUSoc.read_array](#nsukit.base_kit.NSUSoc.read_array)
+        """
+        return await self.itf_cs.read_array(check_reg_array(addr)[0])
+
+    def set_param(self, name: str, value: Any) -> None:
+        """!
+        设置指令参数值，同[NSUSoc.set_param](#nsukit.base_kit.NSUSoc.set_param)
+        """
+        self.mw_cmd.set_param(name, value)
+
+    def get_param(self, name: str) -> Any:
+        """!
+        获取指令参数值，同[NSUSoc.get_param](#nsukit.base_kit.NSUSoc.get_param)
+        """
+        return self.mw_cmd.get_param(name)
+
+    async def execute(self, cmd: str, *, array: "Optional[np.ndarray]" = None, only_if_dirty: bool = False) -> None:
+        """!
+        执行指令
+
+        **把set_param配置的参数值打包发给板卡，并将相应的返回参数写入内存**
+
+        与[NSUSoc.execute](#nsukit.base_kit.NSUSoc.execute)一致：指令序列的各指令连续发送后一次接收全部反馈；
+        查询指令同时只有一个请求在途，并发的协程共享其结果，结果在ttl内有效
+        @param cmd: 指令名或指令序列名
+        @param array: 要随指令发送的numpy数组
+        @param only_if_dirty: 为True时，指令的参数自上次成功执行后未变化则不发送
+        @return: None,执行失败则报错
+        """
+        mw = self.mw_cmd
+        if only_if_dirty and array is None and not mw.is_dirty(cmd):
+            return
+        if array is None and mw.command.get(cmd, {}).get("query", False):
+            return await self.__execute_query(cmd)
+        if mw.is_command_sequence(cmd):
+            async with self.itf_cs.transaction_lock:
+                send_cmd, total_len, requests = mw.encode_sequence(cmd, array)
+                send_len = await self.itf_cs.send_buffers(send_cmd)
+                if total_len != send_len:
+                    raise RuntimeError(f"{cmd} total_len is {total_len}, but just send {send_len}!")
+                recv = await self.itf_cs.recv_bytes(sum(request[2] for request in requests))
+            mw.decode_sequence(requests, recv)
+            return
+        await self.__exchange(cmd, array)
+
+    async def __exchange(self, cmd: str, array=None) -> None:
+        async with self.itf_cs.transaction_lock:
+            send_cmd, total_len, recv_cmd, recv_length = self.mw_cmd.encode_request(cmd, array)
+            send_len = await self.itf_cs.send_buffers(send_cmd)
+            if total_len != send_len:
+                raise RuntimeError(f"{cmd} total_len is {total_len}, but just send {send_len}!")
+            recv = await self.itf_cs.recv_bytes(recv_length)
+        self.mw_cmd.decode_reply(cmd, recv_cmd, recv)
+
+    async def __execute_query(self, cmd: str) -> None:
+        flight, leader = self.mw_cmd.join_query(cmd, asyncio.Event)
+        if not leader:
+            await flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return
+        try:
+            await self.__exchange(cmd)
+        except BaseException as e:
+            self.mw_cmd.finish_query(cmd, flight, e)
+            raise
+        self.mw_cmd.finish_query(cmd, flight)
+
+    def alloc_buffer(self, length: int, buf: int = None) -> int:
+        """!
+        @brief 申请一块内存，同[NSUSoc.alloc_buffer](#nsukit.base_kit.NSUSoc.alloc_buffer)
+        """
+        return self.itf_ds.alloc_buffer(length, buf)
+
+    def free_buffer(self, fd: int) -> None:
+        return self.itf_ds.free_buffer(fd)
+
+    def get_buffer(self, fd: int, length: int) -> np.ndarray:
+        return self.itf_ds.get_buffer(fd, length)
+
+    async def open_recv(self, chnl: int, fd: int, length: int, offset: int = 0) -> None:
+        """!
+        @brief 数据上行开启，不等待完成
+        """
+        return await self.itf_ds.open_recv(chnl, fd, length, offset)
+
+    async def stream_recv(self, chnl: int, fd: int, length: int, offset: int = 0,
+                          stop_event: Callable = None, flag: int = 1) -> bool:
+        """!
+        @brief 数据流上行
+        @details 开启上行并等待数据全部写入内存
+        @param chnl: 通道号
+        @param fd: 内存标识
+        @param length: 上行数据大小
+        @param offset: 内存偏移量
+        @param stop_event: 外部停止信号
+        @param flag:
+        @return: True/False
+        """
+        return await self.itf_ds.stream_recv(chnl, fd, length, offset, stop_event, flag=flag)
+
+    async def wait_stream(self, fd: int, timeout: float = 0) -> int:
+        """!
+        @brief 等待完成一次上行
+        @param fd 内存标号
+        @param timeout 超时时间
+        @return 已经写入内存中数据的大小
+        """
+        return await self.itf_ds.wait_stream(fd, timeout)
+
+    async def break_stream(self, fd: int) -> None:
+        return await self.itf_ds.break_stream(fd)
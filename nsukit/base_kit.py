@@ -9,17 +9,26 @@
 # See the Mulan PSL v2 for more details.
 
 import enum
+import json
+import functools
+import struct
+import threading
+import contextlib
 import collections.abc as abc
-from typing import TYPE_CHECKING, Any, Union, Iterable, Callable, Optional
+from typing import TYPE_CHECKING, Any, Union, Iterable, Callable, Optional, Iterator
 
 import numpy as np
 
 from .middleware.icd_parser import ICDRegMw
 from .middleware.virtual_chnl import VirtualStreamMw
+from .middleware.reg_fields import RegFieldMw
+from .middleware.telemetry import TelemetryMw
 from .middleware.base import UMiddlewareMeta, BaseRegMw, BaseStreamMw
 from .interface import InitParamSet
 from .interface.base import UInterfaceMeta, UInterface, BaseStreamUItf, BaseCmdUItf
-from .tools.check_func import check_reg_schema
+from .tools.check_func import check_reg_schema, check_reg_u32, check_reg_array, reg_rows_u32, InvalidRegisterValueError
+from .tools.reg_shadow import RegShadow
+from .tools.reg_batch import RegWriteBatch
 
 
 def idp2dict(cs_path: str = None, cr_path=None, ds_path=None) -> dict:
@@ -80,6 +89,21 @@ def idp2dict(cs_path: str = None, cr_path=None, ds_path=None) -> dict:
     return {"cs_itf_class": cs_class, "cr_itf_class": cr_class, "ds_itf_class": ds_class, "link_param": param}
 
 
+def _hold_link(itf_name: str) -> Callable:
+    """!
+    装饰NSUSoc的寄存器读写方法，调用期间持有指令接口的transaction_lock；
+    ICD指令的收发由ICDRegMw在合并查询之后自行加锁
+    @param itf_name: 指令接口的属性名
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with getattr(self, itf_name).transaction_lock:
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
 class BulkMode(str, enum.Enum):
     """!
     用于NSUKit.bulk_xxx方法的枚举类
@@ -105,6 +129,8 @@ class NSUSoc(metaclass=KitMeta):
     """
     CmdMiddleware: UMiddlewareMeta = ICDRegMw
     ChnlMiddleware: UMiddlewareMeta = VirtualStreamMw
+    FieldMiddleware: UMiddlewareMeta = RegFieldMw
+    TelemetryMiddleware: UMiddlewareMeta = TelemetryMw
 
     def __init__(self,
                  cs_itf_class: UInterfaceMeta = None,
@@ -137,7 +163,22 @@ class NSUSoc(metaclass=KitMeta):
         self.itf_ds: BaseStreamUItf = ds_itf_class()
         self.mw_cmd: BaseRegMw = self.CmdMiddleware(self)
         self.mw_stream: BaseStreamMw = self.ChnlMiddleware(self)
+        self.fields: RegFieldMw = self.FieldMiddleware(self)
+        self.telemetry: TelemetryMw = self.TelemetryMiddleware(self)
         self.link_param: InitParamSet = link_param
+        self.reg_shadow: Optional[RegShadow] = None
+        self._batch_local = threading.local()
+
+    @property
+    def _write_batch(self) -> Optional[RegWriteBatch]:
+        """!
+        当前线程中正在收集写入的batch，各线程的batch互不可见
+        """
+        return getattr(self._batch_local, 'batch', None)
+
+    @_write_batch.setter
+    def _write_batch(self, batch: Optional[RegWriteBatch]) -> None:
+        self._batch_local.batch = batch
 
     @property
     def combined_cmd_itf(self) -> bool:
@@ -159,6 +200,10 @@ class NSUSoc(metaclass=KitMeta):
             self.itf_cr.accept(self.link_param)
         self.itf_cs.accept(self.link_param)
         self.mw_cmd.config(self.link_param)
+        reg_map_path = getattr(self.link_param, 'reg_map_path', None)
+        if reg_map_path is not None:
+            self.load_reg_map(reg_map_path)
+        self.invalidate()
 
     def link_stream(self) -> None:
         """!
@@ -174,9 +219,10 @@ class NSUSoc(metaclass=KitMeta):
     def unlink_cmd(self):
         """!
         @brief 断开链接
-        @details 断开当前cmd协议类的链接
+        @details 断开当前cmd协议类的链接，后台遥测采样会先停止
         @return:
         """
+        self.telemetry.stop()
         if not self.combined_cmd_itf:
             self.itf_cr.close()
         self.itf_cs.close()
@@ -189,13 +235,14 @@ class NSUSoc(metaclass=KitMeta):
         """
         self.itf_ds.close()
 
+    @_hold_link('itf_cr')
     def write(self, addr: Union[int, Iterable[int]], value: Union[bytes, Iterable[bytes]]) -> None:
         """!
         @brief 写寄存器
-        @details 按照输入的地址、值进行写寄存器
+        @details 按照输入的地址、值进行写寄存器；加载了寄存器表时，写入成功后同步更新影子缓存
         @anchor NSUKit_write
         @param addr: 寄存器地址
-        @param value: 要写入的值，为一len为4的bytes对象
+        @param value: 要写入的值，为一len为4的bytes对象；写一组寄存器时也可为每行一个寄存器值的二维字节数组
         @return: 无返回值，无报错即成功
 
         ---
@@ -214,15 +261,48 @@ class NSUSoc(metaclass=KitMeta):
         @endcode
         """
         check_reg_schema(addr, value)
+        if isinstance(value, np.ndarray):
+            return self.write_array(addr, reg_rows_u32(value))
+        if self._write_batch is not None:
+            if isinstance(addr, int) and isinstance(value, bytes):
+                self._write_batch.write(addr, value)
+            elif isinstance(addr, abc.Iterable) and isinstance(value, abc.Iterable):
+                for _a, _v in zip(addr, value):
+                    self._write_batch.write(_a, _v)
+            else:
+                raise InvalidRegisterValueError(f'Unsupported combination of parameter types '
+                                                f'value[{type(value)}, {value}], addr[{type(addr)}, {addr}]')
+            return
+        shadow = self.reg_shadow
         if isinstance(addr, int) and isinstance(value, bytes):
-            self.itf_cr.write(addr, value)
+            if shadow is None:
+                return self.itf_cr.write(addr, value)
+            try:
+                self.itf_cr.write(addr, value)
+            except BaseException:
+                shadow.invalidate(addr)
+                raise
+            shadow.on_write(addr, value)
         elif isinstance(addr, abc.Iterable) and isinstance(value, abc.Iterable):
-            self.itf_cr.multi_write(addr, value)
+            if shadow is None:
+                return self.itf_cr.multi_write(addr, value)
+            addr, value = list(addr), list(value)
+            try:
+                self.itf_cr.multi_write(addr, value)
+            except BaseException:
+                shadow.invalidate(addr)
+                raise
+            for _a, _v in zip(addr, value):
+                shadow.on_write(_a, _v)
+        else:
+            raise InvalidRegisterValueError(f'Unsupported combination of parameter types '
+                                            f'value[{type(value)}, {value}], addr[{type(addr)}, {addr}]')
 
+    @_hold_link('itf_cr')
     def read(self, addr: Union[int, Iterable[int]]) -> Union[bytes, Iterable[bytes]]:
         """!
         @brief 读寄存器
-        @details 按照输入的地址进行读寄存器
+        @details 按照输入的地址进行读寄存器；加载了寄存器表时，cacheable与write_only地址优先返回影子缓存中的值
         @anchor NSUKit_read
         @param addr: 寄存器地址
         @return: 读出的值，为一len为4的bytes对象
@@ -236,11 +316,30 @@ class NSUSoc(metaclass=KitMeta):
         @endcode
         """
         check_reg_schema(addr)
+        self.flush()
+        shadow = self.reg_shadow
         if isinstance(addr, int):
-            return self.itf_cr.read(addr)
+            if shadow is None:
+                return self.itf_cr.read(addr)
+            value = shadow.get(addr)
+            if value is None:
+                value = self.itf_cr.read(addr)
+                shadow.on_read(addr, value)
+            return value
         elif isinstance(addr, abc.Iterable):
-            return self.itf_cr.multi_read(addr)
-
+            if shadow is None:
+                return self.itf_cr.multi_read(addr)
+            addr = list(addr)
+            res = [shadow.get(_a) for _a in addr]
+            miss = [_n for _n, _v in enumerate(res) if _v is None]
+            if miss:
+                values = self.itf_cr.multi_read([addr[_n] for _n in miss])
+                for _n, _v in zip(miss, values):
+                    res[_n] = _v
+                    shadow.on_read(addr[_n], _v)
+            return res
+
+    @_hold_link('itf_cr')
     def bulk_write(self, base: int, value: bytes, mode: Union[str, BulkMode] = BulkMode.INCREMENT) -> None:
         """!
 
@@ -267,11 +366,30 @@ class NSUSoc(metaclass=KitMeta):
         """
         check_reg_schema(addr=base)
         e_mode = BulkMode(mode)
+        if self._write_batch is not None:
+            if e_mode is BulkMode.INCREMENT:
+                self._write_batch.increment_write(base, value)
+            elif e_mode is BulkMode.LOOP:
+                self._write_batch.loop_write(base, value)
+            return
+        shadow = self.reg_shadow
         if e_mode is BulkMode.INCREMENT:
-            self.itf_cr.increment_write(base, value)
+            try:
+                self.itf_cr.increment_write(base, value)
+            except BaseException:
+                self.invalidate(range(base, base + len(value), 4))
+                raise
+            if shadow is not None:
+                for _n in range(0, len(value), 4):
+                    shadow.on_write(base + _n, value[_n:_n + 4])
         elif e_mode is BulkMode.LOOP:
-            self.itf_cr.loop_write(base, value)
+            try:
+                self.itf_cr.loop_write(base, value)
+            finally:
+                # 循环写入的寄存器最终值取决于设备实现，不做缓存
+                self.invalidate(base)
 
+    @_hold_link('itf_cr')
     def bulk_read(self, base: int, length: int, mode: Union[str, BulkMode] = BulkMode.INCREMENT) -> bytes:
         """!
         @brief 片读寄存器
@@ -291,12 +409,171 @@ class NSUSoc(metaclass=KitMeta):
         @endcode
         """
         check_reg_schema(addr=base)
+        self.flush()
         e_mode = BulkMode(mode)
         if e_mode is BulkMode.INCREMENT:
             return self.itf_cr.increment_read(base, length)
         elif e_mode is BulkMode.LOOP:
             return self.itf_cr.loop_read(base, length)
 
+    @_hold_link('itf_cr')
+    def write_u32(self, addr: int, value: int) -> None:
+        """!
+        @brief 以整数写寄存器
+        @details 与write相同，值为uint32整数，协议层支持时不经过bytes的打包与解包
+        @anchor NSUKit_write_u32
+        @param addr: 寄存器地址
+        @param value: 要写入的值
+        @return: 无返回值，无报错即成功
+        """
+        check_reg_u32(addr, value)
+        if self._write_batch is not None or self.reg_shadow is not None:
+            return self.write(addr, struct.pack('=I', value))
+        self.itf_cr.write_u32(addr, value)
+
+    @_hold_link('itf_cr')
+    def read_u32(self, addr: int) -> int:
+        """!
+        @brief 以整数读寄存器
+        @anchor NSUKit_read_u32
+        @param addr: 寄存器地址
+        @return: 读出的值，uint32整数
+        """
+        check_reg_u32(addr)
+        if self._write_batch is not None or self.reg_shadow is not None:
+            return struct.unpack('=I', self.read(addr))[0]
+        return self.itf_cr.read_u32(addr)
+
+    @_hold_link('itf_cr')
+    def write_array(self, addr: "Union[Iterable[int], np.ndarray]", value: "Union[Iterable[int], np.ndarray]") -> None:
+        """!
+        @brief 以数组写一组寄存器
+        @details 地址与值均为uint32数组，不为每个寄存器生成bytes对象；连续的地址段以increment_write写入
+        @anchor NSUKit_write_array
+        @param addr: 寄存器地址数组
+        @param value: 要写入的值数组，长度与addr一致
+        @return: 无返回值，无报错即成功
+
+        ---
+        @code
+        >>> kit: NSUSoc
+        >>> kit.write_array(np.arange(0x1000, 0x2000, 4), np.zeros(1024, dtype=np.uint32))
+        @endcode
+        """
+        addr, value = check_reg_array(addr, value)
+        if self._write_batch is not None or self.reg_shadow is not None:
+            data = value.tobytes()
+            return self.write(addr.tolist(), [data[_n:_n + 4] for _n in range(0, len(data), 4)])
+        self.itf_cr.write_array(addr, value)
+
+    @_hold_link('itf_cr')
+    def read_array(self, addr: "Union[Iterable[int], np.ndarray]") -> np.ndarray:
+        """!
+        @brief 以数组读一组寄存器
+        @anchor NSUKit_read_array
+        @param addr: 寄存器地址数组
+        @return: 读出的值，uint32数组
+        """
+        addr, _ = check_reg_array(addr)
+        if self._write_batch is not None or self.reg_shadow is not None:
+            return np.frombuffer(b''.join(self.read(addr.tolist())), dtype=np.uint32)
+        return self.itf_cr.read_array(addr)
+
+    @contextlib.contextmanager
+    def batch(self, side_effects: Iterable[int] = (), min_run: int = 2) -> Iterator[RegWriteBatch]:
+        """!
+        @brief 延迟写寄存器
+        @details
+        1. with块内的write、bulk_write只做收集，退出with块时合并下发，合并规则见
+        [RegWriteBatch](#nsukit.tools.reg_batch.RegWriteBatch)
+        2. 块内的read、bulk_read、execute会先下发已收集的写入，保证读到的是写入后的值
+        3. 嵌套使用时并入最外层的批次
+        4. batch属于打开它的线程，其他线程的读写照常直接下发，也不会提前下发本线程收集的写入
+        @anchor NSUKit_batch
+        @param side_effects: 写入即产生动作的寄存器地址，对这些地址的每次写入都会按顺序下发
+        @param min_run: 以increment_write下发的连续寄存器最小个数
+        @return: 本次收集写入的RegWriteBatch
+
+        ---
+        256个相邻寄存器以一条指令写入，0x100的写入在它们之后下发
+        @code
+        >>> kit: NSUSoc
+        >>> with kit.batch(side_effects=[0x100]):
+        >>>     for i in range(256):
+        >>>         kit.write(0x1000 + 4 * i, i.to_bytes(4, 'little'))
+        >>>     kit.write(0x100, b'\x01\x00\x00\x00')
+        @endcode
+        """
+        if self._write_batch is not None:
+            self._write_batch.side_effects.update(side_effects)
+            yield self._write_batch
+            return
+        self._write_batch = RegWriteBatch(side_effects, min_run)
+        try:
+            yield self._write_batch
+        finally:
+            try:
+                self.flush()
+            finally:
+                self._write_batch = None
+
+    def flush(self) -> None:
+        """!
+        @brief 立即下发batch中已收集的寄存器写入
+        @anchor NSUKit_flush
+        @return:
+        """
+        batch = self._write_batch
+        if batch is None or not len(batch):
+            return
+        with self.itf_cr.transaction_lock:
+            self._write_batch = None
+            try:
+                for op, addr, value in batch.take():
+                    if op == 'write' or op == 'multi':
+                        self.write(addr, value)
+                    elif op == 'increment':
+                        self.bulk_write(addr, value, BulkMode.INCREMENT)
+                    elif op == 'loop':
+                        self.bulk_write(addr, value, BulkMode.LOOP)
+            finally:
+                self._write_batch = batch
+
+    def load_reg_map(self, reg_map: Union[str, dict]) -> None:
+        """!
+        @brief 加载寄存器表，开启寄存器影子缓存与位域读写
+        @details 寄存器表按地址段指定缓存策略，格式见[RegShadow](#nsukit.tools.reg_shadow.RegShadow)；
+        位域描述见[RegFieldMw](#nsukit.middleware.reg_fields.RegFieldMw)，加载后可通过kit.fields读写；
+        link_param.reg_map_path不为None时，link_cmd会自动加载
+        @anchor NSUKit_load_reg_map
+        @param reg_map: 寄存器表文件路径，或已解析的寄存器表
+        @return:
+
+        ---
+        @code
+        >>> kit: NSUSoc
+        >>> kit.load_reg_map({'ranges': [{'base': '0x1000', 'length': '0x100', 'policy': 'cacheable'}]})
+        >>> kit.write(0x1000, b'\x01\x00\x00\x00')
+        >>> kit.read(0x1000)    # 不访问设备
+        @endcode
+        """
+        if isinstance(reg_map, str):
+            with open(reg_map, 'r', encoding='utf-8') as fp:
+                reg_map = json.load(fp)
+        self.reg_shadow = RegShadow(reg_map)
+        self.fields.load(reg_map)
+
+    def invalidate(self, addr: Union[int, Iterable[int], None] = None) -> None:
+        """!
+        @brief 使寄存器影子缓存失效
+        @details 板卡复位、或执行了会改变寄存器的指令后调用，之后的读取重新访问设备；重新连接时自动清空
+        @anchor NSUKit_invalidate
+        @param addr: 寄存器地址或地址列表，为None时清空全部缓存
+        @return:
+        """
+        if self.reg_shadow is not None:
+            self.reg_shadow.invalidate(addr)
+
     def set_param(self, name: str, value: Any) -> None:
         """!
         设置指令参数值
@@ -343,7 +620,7 @@ class NSUSoc(metaclass=KitMeta):
         """
         return self.mw_cmd.get_param(name)
 
-    def execute(self, cmd: str, *, array: "Optional[np.ndarray]" = None) -> None:
+    def execute(self, cmd: str, *, array: "Optional[np.ndarray]" = None, only_if_dirty: bool = False) -> None:
         """!
         执行指令
 
@@ -351,6 +628,7 @@ class NSUSoc(metaclass=KitMeta):
         @anchor NSUKit_execute
         @param cmd: 指令名
         @param array: 要随指令发送的numpy数组
+        @param only_if_dirty: 为True时，指令的参数自上次成功执行后未变化则不发送，需开启link_param.dirty_tracking
         @return: None,执行失败则报错
 
         ---
@@ -358,9 +636,73 @@ class NSUSoc(metaclass=KitMeta):
         @code
         >>> kit: NSUSoc
         >>> kit.execute('RF配置')
+        >>> kit.execute('RF配置', only_if_dirty=True)  # 参数未变化，不发送
+        @endcode
+        """
+        self.flush()
+        self.mw_cmd.execute(cmd, array=array, only_if_dirty=only_if_dirty)
+
+    def sync(self, window: int = 8) -> None:
+        """!
+        @brief 同步参数
+        @details 发送所有引用了被set_param修改过的参数的指令，参数值未变化的指令不发送，
+        反馈的结果参数为0时清除脏标记。需开启link_param.dirty_tracking
+        @anchor NSUKit_sync
+        @param window: 最大在途指令数
+        @return: None,执行失败则报错
+
+        ---
+        示例:
+        @code
+        >>> kit: NSUSoc
+        >>> kit.set_param('RF参数', 1)
+        >>> kit.sync()
+        @endcode
+        """
+        self.flush()
+        self.mw_cmd.sync(window=window)
+
+    def execute_batch(self, cmds: "Iterable[Union[str, tuple]]", window: int = 8) -> None:
+        """!
+        批量执行指令
+
+        **按顺序执行多条指令，指令接口支持时以流水线方式发送，最多保持window条指令在途**
+        @anchor NSUKit_execute_batch
+        @param cmds: 指令名列表，需要随指令发送数组时元素为(指令名, numpy数组)
+        @param window: 最大在途指令数，为1时逐条执行
+        @return: None,执行失败则报错
+
+        ---
+        示例:
+        @code
+        >>> kit: NSUSoc
+        >>> kit.execute_batch(['RF配置', 'QMC配置', 'NCO频率配置'])
+        @endcode
+        """
+        self.flush()
+        self.mw_cmd.execute_many(cmds, window=window)
+
+    def sweep(self, cmd: str, params: dict, window: int = 8) -> np.ndarray:
+        """!
+        @brief 参数扫描
+        @details 以指令的预编译格式一次性生成所有扫描点的指令帧并连续发送，返回各点的反馈。
+        扫描结束后扫描参数保持为最后一个点的值
+        @anchor NSUKit_sweep
+        @param cmd: 指令名
+        @param params: 参数名 -> 各扫描点的参数值，一维numpy数组
+        @param window: 最大在途指令数
+        @return: 各扫描点的反馈，结构化数组，字段名为反馈中的参数名
+
+        ---
+        示例:
+        @code
+        >>> kit: NSUSoc
+        >>> result = kit.sweep('RF配置', {'RF频率': np.linspace(1000, 2000, 10001)})
+        >>> result['RF状态']
         @endcode
         """
-        self.mw_cmd.execute(cmd, array=array)
+        self.flush()
+        return self.mw_cmd.sweep(cmd, params, window=window)
 
     def alloc_buffer(self, length: int, buf: int = None) -> int:
         """!
@@ -11,9 +11,11 @@ from .base import BaseStreamUItf, BaseCmdUItf, InitParamSet, VirtualRegCmdMixin
 from .tcp_interface import TCPCmdUItf, TCPStreamUItf
 from .serial_interface import SerialCmdUItf
 from .pcie_interface import PCIECmdUItf, PCIEStreamUItf
+from .async_tcp_interface import AsyncTCPCmdUItf, AsyncTCPStreamUItf
 
 __all__ = [
     'InitParamSet',
     'BaseCmdUItf', 'BaseStreamUItf', 'VirtualRegCmdMixin',
-    'TCPStreamUItf', 'PCIEStreamUItf', 'TCPCmdUItf', 'SerialCmdUItf', 'PCIECmdUItf'
+    'TCPStreamUItf', 'PCIEStreamUItf', 'TCPCmdUItf', 'SerialCmdUItf', 'PCIECmdUItf',
+    'AsyncTCPCmdUItf', 'AsyncTCPStreamUItf'
 ]
@@ -0,0 +1,306 @@
+# Copyright (c) [2023] [NaiShu]
+# [NSUKit] is licensed under Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#          http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND,
+# EITHER EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT,
+# MERCHANTABILITY OR FIT FOR A PARTICULAR PURPOSE.
+# See the Mulan PSL v2 for more details.
+
+import asyncio
+import struct
+from typing import Union, Iterable, Optional, Dict
+
+import numpy as np
+
+from .base import UInterface, VirtualRegCmdMixin, InitParamSet
+from .tcp_interface import TCPStreamUItf, get_port
+from ..tools.check_func import head_check
+from ..tools.logging import logging
+
+
+class AsyncTCPCmdUItf(UInterface):
+    """!
+    @brief 基于asyncio的网络指令接口
+    @details 与TCPCmdUItf使用相同的指令格式，所有收发方法均为协程，供AsyncNSUSoc使用
+    """
+    _timeout = 15
+
+    def __init__(self):
+        self.addr = 'xxx.xxx.xxx.xxx'
+        self.timeout = self._timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def transaction_lock(self) -> asyncio.Lock:
+        """!
+        一次完整的请求/反馈交互期间需持有的锁，保证并发协程的请求与反馈一一对应
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def accept(self, param: InitParamSet) -> None:
+        """!
+        @brief 初始化网络指令接口
+        @param param InitParamSet或其子类的对象，需包含cmd_ip、cmd_tcp_port属性
+        @return
+        """
+        if self._writer is not None:
+            await self.close()
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(param.cmd_ip, param.cmd_tcp_port), self.timeout)
+        self.addr = param.cmd_ip
+
+    async def close(self) -> None:
+        """!
+        @brief 关闭连接
+        @return
+        """
+        if self._writer is None:
+            return
+        try:
+            self._writer.close()
+            await self._writer.wait_closed()
+        except Exception as e:
+            logging.error(msg=e)
+        self._reader, self._writer = None, None
+
+    def set_timeout(self, s: float = 1.) -> None:
+        """!
+        @brief 设置超时时间
+        @param s 秒
+        @return
+        """
+        self.timeout = s
+
+    async def send_bytes(self, data: bytes) -> int:
+        """!
+        @brief 发送数据
+        @param data 要发送的数据
+        @return 发送完成的数据长度
+        """
+        return await self.send_buffers((data, ))
+
+    async def send_buffers(self, buffers: Iterable[Union[bytes, bytearray, memoryview]]) -> int:
+        """!
+        @brief 聚集发送数据
+        @details 各缓冲区直接交给transport，不在用户态拼接
+        @param buffers 缓冲区列表
+        @return 发送完成的数据长度
+        """
+        views = [memoryview(buffer).cast('B') for buffer in buffers]
+        self._writer.writelines(views)
+        await asyncio.wait_for(self._writer.drain(), self.timeout)
+        return sum(len(view) for view in views)
+
+    async def recv_bytes(self, size: int) -> bytes:
+        """!
+        @brief 接收数据
+        @param size 接收数据的长度
+        @return 接收到的数据
+        """
+        try:
+            return await asyncio.wait_for(self._reader.readexactly(size), self.timeout)
+        except asyncio.IncompleteReadError:
+            raise RuntimeError("Connection interruption")
+
+    async def _transaction(self, cmd: bytes) -> bytes:
+        async with self.transaction_lock:
+            if len(cmd) != await self.send_bytes(cmd):
+                raise RuntimeError(f"Fail in send")
+            recv = await self.recv_bytes(16)
+            result_len = head_check(cmd, recv)
+            return await self.recv_bytes(result_len - 16)
+
+    async def write(self, addr: int, value: bytes) -> None:
+        """!
+        @brief 写寄存器
+        @details 以地址值的方式发送一条约定好的特殊指令
+        @param addr 要修改的地址
+        @param value 地址中要赋的值
+        @return 无
+        """
+        result = await self._transaction(VirtualRegCmdMixin._fmt_reg_write(addr, value))
+        if struct.unpack('=I', result)[0] != 0:
+            raise RuntimeError(f'{self.__class__.__name__}.{self.write.__name__}: '
+                               f'Failed to write to register {hex(addr)} on board {self.addr}')
+
+    async def read(self, addr: int) -> bytes:
+        """!
+        @brief 读寄存器
+        @details 以地址的方式发送一条约定好的特殊指令
+        @param addr 要读取的地址
+        @return 返回读取到的结果
+        """
+        result = await self._transaction(VirtualRegCmdMixin._fmt_reg_read(addr))
+        if struct.unpack('=I', result[:4])[0] != 0:
+            raise RuntimeError(f'{self.__class__.__name__}.{self.read.__name__}: '
+                               f'Failed to read to register {hex(addr)} on board {self.addr}')
+        return result[4:]
+
+    async def multi_write(self, addr: Iterable[int], value: Iterable[bytes]) -> None:
+        for _a, _v in zip(addr, value):
+            await self.write(_a, _v)
+
+    async def multi_read(self, addr: Iterable[int]) -> Iterable[bytes]:
+        return [await self.read(_a) for _a in addr]
+
+    async def write_u32(self, addr: int, value: int) -> None:
+        await self.write(addr, struct.pack('=I', value))
+
+    async def read_u32(self, addr: int) -> int:
+        return struct.unpack('=I', await self.read(addr))[0]
+
+    async def write_array(self, addr: np.ndarray, value: np.ndarray) -> None:
+        for _a, _v in zip(addr.tolist(), value.tolist()):
+            await self.write_u32(_a, _v)
+
+    async def read_array(self, addr: np.ndarray) -> np.ndarray:
+        return np.array([await self.read_u32(_a) for _a in addr.tolist()], dtype=np.uint32)
+
+
+class AsyncTCPStreamUItf(TCPStreamUItf):
+    """!
+    @brief 基于asyncio的网络数据流接口
+    @details 内存管理与TCPStreamUItf相同，连接、接收与等待均为协程，板卡作为客户端连接到本机监听的端口
+    """
+
+    def __init__(self):
+        super(AsyncTCPStreamUItf, self).__init__()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connected: Optional[asyncio.Event] = None
+        self._recv_tasks: "Dict[int, asyncio.Task]" = {}
+
+    async def accept(self, param: InitParamSet) -> None:
+        """!
+        @brief 监听数据流端口
+        @param param InitParamSet或其子类的对象，需包含stream_ip、stream_tcp_port属性
+        @return
+        """
+        if self.open_flag:
+            await self.close()
+        self._local_port = get_port(ip=param.stream_ip) if param.stream_tcp_port == 0 else param.stream_tcp_port
+        self._connected = asyncio.Event()
+        self._server = await asyncio.start_server(self._on_connect, '0.0.0.0', self._local_port, reuse_address=True)
+        logging.info(msg='TCP connection established')
+        self.open_flag = True
+
+    def _on_connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader, self._writer = reader, writer
+        self._connected.set()
+        logging.info(msg=f"{self.__class__.__name__} Client connection")
+
+    async def close(self) -> None:
+        """!
+        @brief 关闭连接
+        @details 关闭server以及用于传输数据的子链接
+        @return
+        """
+        for task in self._recv_tasks.values():
+            task.cancel()
+        self._recv_tasks.clear()
+        if self._writer is not None:
+            self._writer.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._server, self._reader, self._writer = None, None, None
+        self.open_flag = False
+
+    async def open_recv(self, chnl: int, fd: int, length: int, offset: int = 0) -> None:
+        """!
+        @brief 数据上行开启
+        @details 创建接收任务后立即返回，可通过wait_stream等待完成
+        @param chnl 未使用
+        @param fd 内存标号(key)
+        @param length 要接收数据的长度，单位byte
+        @param offset 内存偏移量，单位byte
+        @return
+        """
+        if not self.open_flag:
+            raise RuntimeError("You must use open_board first")
+        if fd not in self.memory_dict:
+            raise RuntimeError(f"没有此内存块")
+        task = self._recv_tasks.get(fd, None)
+        if task is not None and not task.done():
+            raise RuntimeError("内存正在被使用")
+        memory = self.memory_dict[fd]
+        if length % 4 != 0:
+            raise RuntimeError(f"数据不能被4整除")
+        if (length + offset) // 4 > memory.size:
+            raise RuntimeError(f"数据大小超过内存大小")
+        self._recv_tasks[fd] = asyncio.ensure_future(self._recv(memory, length, offset))
+
+    async def _recv(self, memory: TCPStreamUItf.Memory, length: int, offset: int) -> int:
+        await self._connected.wait()
+        view = memoryview(memory.memory.view(np.uint8))[offset:offset + length]
+        memory.using_size = 0
+        received = 0
+        while received < length:
+            data = await self._reader.read(min(length - received, 1024 ** 2))
+            if not data:
+                logging.info("Recv complete")
+                break
+            view[received:received + len(data)] = data
+            received += len(data)
+            memory.using_size = (offset + received) // 4
+        return received
+
+    async def wait_stream(self, fd: int, timeout: float = 0.) -> int:
+        """!
+        @brief 等待完成一次上行
+        @param fd 内存标号(key)
+        @param timeout 超时时间，为0时一直等待
+        @return 已经写入内存中数据的大小
+        """
+        if fd not in self.memory_dict:
+            raise RuntimeError(f"没有此内存块")
+        task = self._recv_tasks.get(fd, None)
+        if task is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(task), timeout or None)
+            except asyncio.TimeoutError:
+                pass
+        return self.memory_dict[fd].using_size * 4
+
+    async def break_stream(self, fd: int) -> None:
+        """!
+        @brief 终止本次上行
+        @param fd 内存标号(key)
+        @return
+        """
+        task = self._recv_tasks.pop(fd, None)
+        if task is not None:
+            task.cancel()
+
+    async def stream_recv(self, chnl: int, fd: int, length: int, offset: int = 0,
+                          stop_event=None, time_out: float = 1., flag: int = 1) -> bool:
+        """!
+        @brief 数据流上行
+        @details 开启上行并等待完成，stop_event返回True时终止
+        @param chnl 未使用
+        @param fd 内存标号(key)
+        @param length 数据长度
+        @param offset 内存偏移量
+        @param stop_event 外部停止信号
+        @param time_out 每次等待的超时时间
+        @param flag 1
+        @return True/False
+        """
+        await self.open_recv(chnl, fd, length, offset)
+        while True:
+            if stop_event is not None and stop_event():
+                await self.break_stream(fd)
+                return False
+            if await self.wait_stream(fd, time_out) >= length + offset:
+                return True
+            if self._recv_tasks[fd].done():
+                return False
@@ -10,12 +10,20 @@
 
 import struct
 import math
-from typing import List, Iterable, Union, Callable, Any
+import threading
+from typing import List, Iterable, Union, Callable, Any, Optional
 from dataclasses import dataclass
 
 import numpy as np
 
 from ..tools.check_func import head_check
+from ..tools.reg_batch import split_runs
+from ..tools.logging import logging
+
+REG_BATCH_WRITE = 0x31001030    # 批量写寄存器：个数 + (地址, 值)*个数
+REG_BATCH_READ = 0x31001031     # 批量读寄存器：个数 + 地址*个数
+REG_CAPS_QUERY = 0x31001040     # 查询设备支持的寄存器指令
+REG_CAP_BATCH = 0x1             # 能力位：支持批量读写寄存器
 
 
 @dataclass
@@ -26,6 +34,9 @@ class InitParamSet:
     cmd_serial_port: str = ''
     cmd_baud_rate: int = -1
 
+    # 建立TCP/串口指令连接时是否查询设备支持的批量寄存器指令，不识别该查询的旧设备保持False
+    cmd_reg_caps: bool = False
+
     cmd_board: int = -1
     cmd_sent_base: int = 0
     cmd_recv_base: int = 0
@@ -40,6 +51,10 @@ class InitParamSet:
     # ICDMw所需参数
     icd_path: str = None
     check_recv_head: bool = True
+    dirty_tracking: bool = False
+
+    # 寄存器影子缓存所需参数
+    reg_map_path: str = None
 
     stream_mode: str = 'real'
 
@@ -61,6 +76,9 @@ class UInterface(metaclass=UInterfaceMeta):
     def set_timeout(self, s: float) -> None:
         raise NotImplementedError(f'Please overload the {self.__class__.__name__}.{self.set_timeout.__name__} method')
 
+    def get_timeout(self) -> Optional[float]:
+        raise NotImplementedError(f'Please overload the {self.__class__.__name__}.{self.get_timeout.__name__} method')
+
 
 class RegOperationMixin:
     """!
@@ -74,12 +92,53 @@ class RegOperationMixin:
 
 
 class BaseCmdUItf(UInterface):
+    send_chunk_size = 64 * 1024     # send_buffers每次调用send_bytes的数据块大小
+    pipelined = False               # 是否支持连续发送多条指令后再按顺序接收反馈
+    reg_min_run = 8                 # multi_write/multi_read中改用increment方式读写的连续寄存器最小个数，为0时不检测
+
+    @property
+    def transaction_lock(self) -> threading.RLock:
+        """!
+        一组完整的请求/反馈交互期间需持有的锁，NSUSoc的读写方法在调用期间持有，ICDRegMw在指令编码到反馈解析期间持有，
+        使后台线程与调用者的交互不会在链路上交错
+        """
+        lock = self.__dict__.get('_transaction_lock', None)
+        if lock is None:
+            lock = self.__dict__.setdefault('_transaction_lock', threading.RLock())
+        return lock
+
     def send_bytes(self, data: bytes) -> int:
         raise NotImplementedError(f'Please overload the {self.__class__.__name__}.{self.send_bytes.__name__} method')
 
     def recv_bytes(self, size: int) -> bytes:
         raise NotImplementedError(f'Please overload the {self.__class__.__name__}.{self.recv_bytes.__name__} method')
 
+    def send_buffers(self, buffers: Iterable[Union[bytes, bytearray, memoryview]]) -> int:
+        """!
+        以分散/聚集的方式发送一条由多个缓冲区组成的数据
+
+        默认实现将各缓冲区依次按send_chunk_size拼成定长的块后调用send_bytes，
+        额外占用的内存不超过一个块，协议层可重载以使用原生的聚集发送
+        @param buffers: 缓冲区列表，元素为任意支持buffer协议的对象
+        @return: 发送完成的数据长度
+        """
+        chunk_size = self.send_chunk_size
+        chunk = bytearray()
+        sent = 0
+        for buffer in buffers:
+            view = memoryview(buffer).cast('B')
+            offset = 0
+            while offset < len(view):
+                take = min(chunk_size - len(chunk), len(view) - offset)
+                chunk += view[offset:offset+take]
+                offset += take
+                if len(chunk) == chunk_size:
+                    sent += self.send_bytes(bytes(chunk))
+                    chunk.clear()
+        if chunk:
+            sent += self.send_bytes(bytes(chunk))
+        return sent
+
     def send_down(self):
         ...
 
@@ -94,25 +153,130 @@ class BaseCmdUItf(UInterface):
 
     def multi_write(self, addr: Iterable[int], value: Iterable[bytes]) -> None:
         """!
+        写一组寄存器
 
+        协议层重载了increment_write时，按给定顺序中地址连续、不少于reg_min_run个的寄存器以increment_write写入，
+        其余寄存器交给_write_each，各段按原有顺序执行
         @param addr:
         @param value:
         @return:
         """
-        for _a, _v in zip(addr, value):
-            self.write(_a, _v)
+        addr, value = list(addr), list(value)
+        length = min(len(addr), len(value))
+        addr, value = addr[:length], value[:length]
+        for is_run, start, end in self._reg_segments(addr, 'increment_write'):
+            if is_run:
+                self.increment_write(addr[start], b''.join(_v.ljust(4, b'\x00') for _v in value[start:end]))
+            else:
+                self._write_each(addr[start:end], value[start:end])
 
     def multi_read(self, addr: Iterable[int]) -> Iterable[bytes]:
         """!
+        读一组寄存器
 
+        协议层重载了increment_read时，按给定顺序中地址连续、不少于reg_min_run个的寄存器以increment_read读取，
+        其余寄存器交给_read_each，结果按给定地址的顺序返回
         @param addr:
         @return:
         """
+        addr = list(addr)
+        res = []
+        for is_run, start, end in self._reg_segments(addr, 'increment_read'):
+            if is_run:
+                data = self.increment_read(addr[start], 4 * (end - start))
+                res.extend(data[_n:_n + 4] for _n in range(0, len(data), 4))
+            else:
+                res.extend(self._read_each(addr[start:end]))
+        return res
+
+    def _reg_segments(self, addr: Union[List[int], np.ndarray], method: str) -> list:
+        """!
+        按连续性切分multi_write/multi_read的寄存器地址
+        @param addr: 寄存器地址列表
+        @param method: 连续段使用的方法名，协议层未重载该方法时不做切分
+        @return: (是否连续段, 起始序号, 结束序号)的列表
+        """
+        if not len(addr):
+            return []
+        if self.reg_min_run <= 0 or getattr(type(self), method) is getattr(BaseCmdUItf, method):
+            return [(False, 0, len(addr))]
+        return split_runs(addr, self.reg_min_run)
+
+    def _write_each(self, addr: List[int], value: List[bytes]) -> None:
+        """!
+        逐个写寄存器，协议层可重载以使用更高效的方式
+        """
+        for _a, _v in zip(addr, value):
+            self.write(_a, _v)
+
+    def _read_each(self, addr: List[int]) -> List[bytes]:
+        """!
+        逐个读寄存器，协议层可重载以使用更高效的方式
+        """
         res = []
         for _a in addr:
             res.append(self.read(_a))
         return res
 
+    def write_u32(self, addr: int, value: int) -> None:
+        """!
+        以整数写寄存器，协议层可重载以省去bytes的打包
+        @param addr: 寄存器地址
+        @param value: 要写入的值，uint32
+        @return:
+        """
+        self.write(addr, struct.pack('=I', value))
+
+    def read_u32(self, addr: int) -> int:
+        """!
+        以整数读寄存器，协议层可重载以省去bytes的解包
+        @param addr: 寄存器地址
+        @return: 读出的值，uint32
+        """
+        return struct.unpack('=I', self.read(addr))[0]
+
+    def write_array(self, addr: np.ndarray, value: np.ndarray) -> None:
+        """!
+        以数组写一组寄存器
+        @details 与multi_write一样检测连续的地址段，连续段的值以数组内存直接交给increment_write，
+        其余寄存器交给_write_array_each
+        @param addr: 寄存器地址，uint32数组
+        @param value: 要写入的值，uint32数组
+        @return:
+        """
+        for is_run, start, end in self._reg_segments(addr, 'increment_write'):
+            if is_run:
+                self.increment_write(int(addr[start]), value[start:end].tobytes())
+            else:
+                self._write_array_each(addr[start:end], value[start:end])
+
+    def read_array(self, addr: np.ndarray) -> np.ndarray:
+        """!
+        以数组读一组寄存器
+        @param addr: 寄存器地址，uint32数组
+        @return: 读出的值，uint32数组
+        """
+        res = np.empty(len(addr), dtype=np.uint32)
+        for is_run, start, end in self._reg_segments(addr, 'increment_read'):
+            if is_run:
+                res[start:end] = np.frombuffer(self.increment_read(int(addr[start]), 4 * (end - start)), dtype=np.uint32)
+            else:
+                res[start:end] = self._read_array_each(addr[start:end])
+        return res
+
+    def _write_array_each(self, addr: np.ndarray, value: np.ndarray) -> None:
+        """!
+        逐个以整数写寄存器，协议层可重载以使用更高效的方式
+        """
+        for _a, _v in zip(addr.tolist(), value.tolist()):
+            self.write_u32(_a, _v)
+
+    def _read_array_each(self, addr: np.ndarray) -> np.ndarray:
+        """!
+        逐个以整数读寄存器，协议层可重载以使用更高效的方式
+        """
+        return np.fromiter((self.read_u32(_a) for _a in addr.tolist()), dtype=np.uint32, count=len(addr))
+
     def increment_write(self, addr: int, value: bytes, reg_len: int = 4) -> None:
         """!
         从一个基地址开始，将value的内容依次写入后续寄存器
@@ -124,9 +288,9 @@ class BaseCmdUItf(UInterface):
         length = len(value)
         num = length // reg_len
         for _n in range(num):
-            self.write(addr+reg_len*_n, value[_n:_n*reg_len])
+            self.write(addr+reg_len*_n, value[_n*reg_len:(_n+1)*reg_len])
         if (length - num*reg_len) > 0:
-            _data = value[num:]
+            _data = value[num*reg_len:]
             _data += b'\x00'*(reg_len-len(_data))
             self.write(addr+reg_len*num, _data)
 
@@ -156,9 +320,9 @@ class BaseCmdUItf(UInterface):
         length = len(value)
         num = length // reg_len
         for _n in range(num):
-            self.write(addr, value[_n:_n * reg_len])
+            self.write(addr, value[_n * reg_len:(_n + 1) * reg_len])
         if length - num * reg_len > 0:
-            _data = value[num:]
+            _data = value[num * reg_len:]
             _data += b'\x00' * (reg_len - len(_data))
             self.write(addr, _data)
 
@@ -171,7 +335,7 @@ class BaseCmdUItf(UInterface):
         @return 无返回值
         """
         cache = []
-        ceil_len = math.ceil(length/reg_len)*length
+        ceil_len = math.ceil(length/reg_len)*reg_len
         num = ceil_len//reg_len
         for _n in range(num):
             cache.append(self.read(addr))
@@ -188,14 +352,24 @@ class VirtualRegCmdMixin:
         2. [BaseCmdUItf.increment_read](#nsukit.interface.base.BaseCmdUItf.increment_read)
         3. [BaseCmdUItf.loop_write](#nsukit.interface.base.BaseCmdUItf.loop_write)
         4. [BaseCmdUItf.loop_read](#nsukit.interface.base.BaseCmdUItf.loop_read)
-        5. [BaseCmdUItf.multi_write](#nsukit.interface.base.BaseCmdUItf.multi_write)
-        6. [BaseCmdUItf.multi_read](#nsukit.interface.base.BaseCmdUItf.multi_read)
-
-    3. 使用方式
+        5. BaseCmdUItf._write_each、BaseCmdUItf._write_array_each
+        6. BaseCmdUItf._read_each、BaseCmdUItf._read_array_each
+
+    3. link_param.cmd_reg_caps为True时，建立连接后调用negotiate_reg_caps查询设备能力，设备支持批量寄存器指令时，
+    multi_write/multi_read中地址不连续的寄存器以一帧完成最多reg_batch_max个的读写，否则逐个读写；
+    查询失败时调用_discard_reply丢弃旧设备可能迟到的反馈
+    4. reg_window大于1时，逐个读写的寄存器连续发出最多reg_window条指令后再按序接收反馈，
+    高延时链路上不必每个寄存器等待一次往返；子类可按链路特点调整窗口，为1时退化为逐条收发
+    5. 使用方式
     @code
     >>> class ExampleUItf(VirtualRegCmdMixin, BaseCmdUItf):
     >>>    ...
     """
+    reg_caps = 0                    # 设备支持的寄存器指令能力位，由negotiate_reg_caps设置
+    reg_batch_max = 1024            # 一帧批量寄存器指令的最大寄存器个数
+    reg_caps_timeout = 0.5          # 查询设备能力时的超时时间，单位s
+    reg_window = 1                  # 流水线读写寄存器时同时在途的最大指令数
+
     @staticmethod
     def _fmt_reg_write(reg: int = 0, value: bytes = b'') -> bytes:
         """!
@@ -221,6 +395,187 @@ class VirtualRegCmdMixin:
         pack = (0x5F5F5F5F, 0x31001001, 0x00000000, 20, reg)
         return struct.pack('=IIIII', *pack)
 
+    @staticmethod
+    def _fmt_reg_batch_write(addr: np.ndarray, value: np.ndarray) -> bytes:
+        """!
+        @brief 格式化批量写寄存器的icd
+        @param addr: 寄存器地址，uint32数组
+        @param value: 寄存器值，uint32数组
+        @return 格式化好的icd指令
+        """
+        body = np.empty((len(addr), 2), dtype=np.uint32)
+        body[:, 0] = addr
+        body[:, 1] = value
+        return struct.pack('=IIIII', 0x5F5F5F5F, REG_BATCH_WRITE, 0x00000000, 20 + body.nbytes, len(addr)) + body.tobytes()
+
+    @staticmethod
+    def _fmt_reg_batch_read(addr: np.ndarray) -> bytes:
+        """!
+        @brief 格式化批量读寄存器的icd
+        @param addr: 寄存器地址，uint32数组
+        @return 格式化好的icd指令
+        """
+        addr = np.ascontiguousarray(addr, dtype=np.uint32)
+        return struct.pack('=IIIII', 0x5F5F5F5F, REG_BATCH_READ, 0x00000000, 20 + addr.nbytes, len(addr)) + addr.tobytes()
+
+    def _transaction(self: Union[BaseCmdUItf, "VirtualRegCmdMixin"], cmd: bytes) -> bytes:
+        """!
+        @brief 发送一条寄存器指令并接收反馈
+        @param cmd: 格式化好的指令
+        @return 反馈中包头之后的内容
+        """
+        if len(cmd) != self.send_bytes(cmd):
+            raise RuntimeError(f"Fail in send")
+        self.send_down()
+        recv = self.recv_bytes(16)
+        result_len = head_check(cmd, recv)
+        result = self.recv_bytes(result_len - 16)
+        self.recv_down()
+        return result
+
+    def negotiate_reg_caps(self: Union[BaseCmdUItf, "VirtualRegCmdMixin"]) -> int:
+        """!
+        @brief 查询设备支持的寄存器指令
+        @details 在建立连接时调用；设备在reg_caps_timeout内未正确应答时视为不支持任何扩展指令，
+        并丢弃链路上可能迟到的反馈。查询结束后恢复查询前的超时时间
+        @return 能力位
+        """
+        self.reg_caps = 0
+        cmd = struct.pack('=IIII', 0x5F5F5F5F, REG_CAPS_QUERY, 0x00000000, 16)
+        timeout = self.get_timeout()
+        self.set_timeout(self.reg_caps_timeout)
+        try:
+            result = self._transaction(cmd)
+            if len(result) >= 8 and struct.unpack('=I', result[:4])[0] == 0:
+                self.reg_caps = struct.unpack('=I', result[4:8])[0]
+        except Exception as e:
+            logging.info(msg=f'{self.__class__.__name__}: register capability query unsupported, {e}')
+            # 不识别查询指令的设备可能在超时后才应答，迟到的反馈不能被下一条指令当作自己的反馈
+            self._discard_reply()
+        finally:
+            self.set_timeout(timeout)
+        return self.reg_caps
+
+    def _discard_reply(self) -> None:
+        """!
+        @brief 丢弃链路上尚未接收的反馈
+        @details 能力查询或流水线收发中途失败后调用，协议层按链路特点重载(重新连接或清空接收缓冲)，默认不做处理
+        """
+        ...
+
+    def _pipeline(self: Union[BaseCmdUItf, "VirtualRegCmdMixin"], cmds: List[bytes]) -> List[bytes]:
+        """!
+        @brief 流水线方式发送一组寄存器指令并按序接收反馈
+        @details
+        1. 最多reg_window条指令同时在途，每收到半个窗口的反馈便补发同样数量的指令，链路延时只在每个窗口计一次
+        2. 设备按收到的顺序逐条应答，反馈与指令一一对应
+        3. 只在收发出错时中途报错，指令执行失败由调用者根据各条反馈判断；
+        中途出错时窗口内其余指令的反馈无法再按序对应，报错前以_discard_reply丢弃链路上的残留反馈
+        @param cmds: 格式化好的指令列表
+        @return 各条反馈中包头之后的内容
+        """
+        window = max(int(self.reg_window), 1)
+        step = max(window // 2, 1)
+        results = []
+        sent = 0
+        try:
+            while len(results) < len(cmds):
+                if sent < len(cmds) and sent - len(results) <= window - step:
+                    chunk = cmds[sent:sent + (window if sent == 0 else step)]
+                    sent += len(chunk)
+                    if sum(len(_c) for _c in chunk) != self.send_buffers(chunk):
+                        raise RuntimeError(f"Fail in send")
+                    self.send_down()
+                    continue
+                cmd = cmds[len(results)]
+                recv = self.recv_bytes(16)
+                result_len = head_check(cmd, recv)
+                results.append(self.recv_bytes(result_len - 16))
+                self.recv_down()
+        except BaseException:
+            self._discard_reply()
+            raise
+        return results
+
+    @staticmethod
+    def _split_frames(frames: np.ndarray) -> List[memoryview]:
+        """!
+        @brief 将按行排列的一组定长指令切分为各条指令的视图，不复制数据
+        """
+        view = memoryview(frames).cast('B')
+        size = frames.itemsize * frames.shape[1]
+        return [view[_n:_n + size] for _n in range(0, len(view), size)]
+
+    def _pipeline_write(self: Union[BaseCmdUItf, "VirtualRegCmdMixin"], addr: np.ndarray, value: np.ndarray) -> None:
+        """!
+        @brief 流水线方式逐个写寄存器
+        @details 全部反馈接收完毕后才报告失败，错误信息列出所有写入失败的地址
+        """
+        frames = np.empty((len(addr), 6), dtype=np.uint32)
+        frames[:, :4] = (0x5F5F5F5F, 0x31001000, 0x00000000, 24)
+        frames[:, 4] = addr
+        frames[:, 5] = value
+        results = self._pipeline(self._split_frames(frames))
+        status = np.frombuffer(b''.join(_r[:4] for _r in results), dtype=np.uint32)
+        if status.any():
+            raise RuntimeError(f'{self.__class__.__name__}.{self.multi_write.__name__}: '
+                               f'Failed to write to register {", ".join(hex(_a) for _a in addr[status != 0].tolist())} '
+                               f'on board {self._reg_board()}')
+
+    def _pipeline_read(self: Union[BaseCmdUItf, "VirtualRegCmdMixin"], addr: np.ndarray) -> np.ndarray:
+        """!
+        @brief 流水线方式逐个读寄存器
+        @return 各寄存器的值，uint32数组
+        """
+        frames = np.empty((len(addr), 5), dtype=np.uint32)
+        frames[:, :4] = (0x5F5F5F5F, 0x31001001, 0x00000000, 20)
+        frames[:, 4] = addr
+        results = self._pipeline(self._split_frames(frames))
+        data = np.frombuffer(b''.join(_r[:8] for _r in results), dtype=np.uint32).reshape(-1, 2)
+        if data[:, 0].any():
+            raise RuntimeError(f'{self.__class__.__name__}.{self.multi_read.__name__}: '
+                               f'Failed to read to register '
+                               f'{", ".join(hex(_a) for _a in addr[data[:, 0] != 0].tolist())} '
+                               f'on board {self._reg_board()}')
+        return data[:, 1]
+
+    def _batch_write(self: Union[BaseCmdUItf, "VirtualRegCmdMixin"], addr: np.ndarray, value: np.ndarray) -> None:
+        """!
+        @brief 以批量写寄存器指令写入一组寄存器
+        @details 每reg_batch_max个寄存器一帧，各帧流水线发送；反馈中包含执行结果与第一个失败的寄存器序号，
+        失败时该帧中此寄存器之后的寄存器不会被写入
+        """
+        step = self.reg_batch_max
+        starts = range(0, len(addr), step)
+        results = self._pipeline([self._fmt_reg_batch_write(addr[_s:_s + step], value[_s:_s + step])
+                                  for _s in starts])
+        for start, result in zip(starts, results):
+            status, index = struct.unpack('=II', result[:8])
+            if status != 0:
+                raise RuntimeError(f'{self.__class__.__name__}.{self.multi_write.__name__}: '
+                                   f'Failed to write to register {hex(addr[start + index])} '
+                                   f'on board {self._reg_board()}')
+
+    def _batch_read(self: Union[BaseCmdUItf, "VirtualRegCmdMixin"], addr: np.ndarray) -> np.ndarray:
+        """!
+        @brief 以批量读寄存器指令读取一组寄存器
+        @details 每reg_batch_max个寄存器一帧，各帧流水线发送
+        @return 各寄存器的值，uint32数组
+        """
+        step = self.reg_batch_max
+        starts = range(0, len(addr), step)
+        results = self._pipeline([self._fmt_reg_batch_read(addr[_s:_s + step]) for _s in starts])
+        res = np.empty(len(addr), dtype=np.uint32)
+        for start, result in zip(starts, results):
+            status, index = struct.unpack('=II', result[:8])
+            if status != 0:
+                raise RuntimeError(f'{self.__class__.__name__}.{self.multi_read.__name__}: '
+                                   f'Failed to read to register {hex(addr[start + index])} '
+                                   f'on board {self._reg_board()}')
+            count = min(step, len(addr) - start)
+            res[start:start + count] = np.frombuffer(result, dtype=np.uint32, count=count, offset=8)
+        return res
+
     def _common_write(self: Union[BaseCmdUItf, "VirtualRegCmdMixin"], addr: int, value: bytes, board: Any) -> None:
         """!
         @brief 通用的写寄存器方法
@@ -261,22 +616,54 @@ class VirtualRegCmdMixin:
                                f'Failed to read to register {hex(addr)} on board {board}')
         return result[4:]
 
-    def multi_write(self: BaseCmdUItf, addr: Iterable[int], value: Iterable[bytes]) -> None:
+    def _write_each(self: Union[BaseCmdUItf, "VirtualRegCmdMixin"], addr: List[int], value: List[bytes]) -> None:
         """!
-        重载：[BaseCmdUItf.multi_write](#nsukit.interface.base.BaseCmdUItf.multi_write)
-        @param addr:
-        @param value:
-        @return:
+        重载：BaseCmdUItf._write_each
+
+        设备支持批量寄存器指令时，每reg_batch_max个寄存器以一帧写入，否则以reg_window为窗口流水线逐个写入
         """
-        return BaseCmdUItf.multi_write(self, addr, value)
+        if not self.reg_caps & REG_CAP_BATCH and self.reg_window <= 1:
+            return BaseCmdUItf._write_each(self, addr, value)
+        value = np.frombuffer(b''.join(_v.ljust(4, b'\x00') for _v in value), dtype=np.uint32)
+        self._write_array_each(np.array(addr, dtype=np.uint32), value)
 
-    def multi_read(self: BaseCmdUItf, addr: Iterable[int]) -> Iterable[bytes]:
+    def _read_each(self: Union[BaseCmdUItf, "VirtualRegCmdMixin"], addr: List[int]) -> List[bytes]:
         """!
-        重载：[BaseCmdUItf.multi_read](#nsukit.interface.base.BaseCmdUItf.multi_read)
-        @param addr:
-        @return:
+        重载：BaseCmdUItf._read_each
+
+        设备支持批量寄存器指令时，每reg_batch_max个寄存器以一帧读取，否则以reg_window为窗口流水线逐个读取
+        """
+        if not self.reg_caps & REG_CAP_BATCH and self.reg_window <= 1:
+            return BaseCmdUItf._read_each(self, addr)
+        data = self._read_array_each(np.array(addr, dtype=np.uint32)).tobytes()
+        return [data[_n:_n + 4] for _n in range(0, len(data), 4)]
+
+    def _write_array_each(self: Union[BaseCmdUItf, "VirtualRegCmdMixin"], addr: np.ndarray, value: np.ndarray) -> None:
+        """!
+        重载：BaseCmdUItf._write_array_each
+        """
+        if self.reg_caps & REG_CAP_BATCH:
+            self._batch_write(addr, value)
+        elif self.reg_window > 1:
+            self._pipeline_write(addr, value)
+        else:
+            BaseCmdUItf._write_array_each(self, addr, value)
+
+    def _read_array_each(self: Union[BaseCmdUItf, "VirtualRegCmdMixin"], addr: np.ndarray) -> np.ndarray:
+        """!
+        重载：BaseCmdUItf._read_array_each
         """
-        return BaseCmdUItf.multi_read(self, addr)
+        if self.reg_caps & REG_CAP_BATCH:
+            return self._batch_read(addr)
+        if self.reg_window > 1:
+            return self._pipeline_read(addr)
+        return BaseCmdUItf._read_array_each(self, addr)
+
+    def _reg_board(self) -> Any:
+        """!
+        @brief 错误信息中的板卡标识
+        """
+        return getattr(self, 'addr', None) or getattr(self, 'serial_port', None)
 
     def increment_write(self: BaseCmdUItf, addr: int, value: bytes, reg_len: int = 4) -> None:
         """!
@@ -290,7 +677,7 @@ class VirtualRegCmdMixin:
         """
         length = len(value)
         padding_len = int(math.ceil(length/reg_len)*reg_len)
-        padding = b'/x00'*(padding_len-length)
+        padding = b'\x00'*(padding_len-length)
         pack = (0x5F5F5F5F, 0x31001010, 0x00000000, padding_len+6*4, addr, padding_len)
         head = struct.pack('=IIIIII', *pack)
         cmd = b''.join((head, value, padding))   # 格式化完成指令
@@ -301,7 +688,7 @@ class VirtualRegCmdMixin:
         result_len = head_check(cmd, recv)
         result = self.recv_bytes(result_len - 16)
         self.recv_down()
-        if struct.unpack('=I', result) != 0:
+        if struct.unpack('=I', result[:4])[0] != 0:
             raise RuntimeError(f'{self.__class__.__name__}.{self.write.__name__}: '
                                f'Failed to increment_write to base register {hex(addr)}')
 
@@ -325,7 +712,7 @@ class VirtualRegCmdMixin:
         result_len = head_check(cmd, recv)
         result = self.recv_bytes(result_len - 16)
         self.recv_down()
-        if struct.unpack('=I', result[:4]) != 0:
+        if struct.unpack('=I', result[:4])[0] != 0:
             raise RuntimeError(f'{self.__class__.__name__}.{self.write.__name__}: '
                                f'Failed to increment_write to base register {hex(addr)}')
         return result[4:length+4]
@@ -342,7 +729,7 @@ class VirtualRegCmdMixin:
         """
         length = len(value)
         padding_len = int(math.ceil(length / reg_len) * reg_len)
-        padding = b'/x00' * (padding_len - length)
+        padding = b'\x00' * (padding_len - length)
         pack = (0x5F5F5F5F, 0x31001020, 0x00000000, padding_len + 6 * 4, addr, padding_len)
         head = struct.pack('=IIIIII', *pack)
         cmd = b''.join((head, value, padding))  # 格式化完成指令
@@ -353,7 +740,7 @@ class VirtualRegCmdMixin:
         result_len = head_check(cmd, recv)
         result = self.recv_bytes(result_len - 16)
         self.recv_down()
-        if struct.unpack('=I', result) != 0:
+        if struct.unpack('=I', result[:4])[0] != 0:
             raise RuntimeError(f'{self.__class__.__name__}.{self.write.__name__}: '
                                f'Failed to increment_write to base register {hex(addr)}')
 
@@ -377,7 +764,7 @@ class VirtualRegCmdMixin:
         result_len = head_check(cmd, recv)
         result = self.recv_bytes(result_len - 16)
         self.recv_down()
-        if struct.unpack('=I', result[:4]) != 0:
+        if struct.unpack('=I', result[:4])[0] != 0:
             raise RuntimeError(f'{self.__class__.__name__}.{self.write.__name__}: '
                                f'Failed to increment_write to base register {hex(addr)}')
         return result[4:length + 4]
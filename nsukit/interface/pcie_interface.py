@@ -10,7 +10,7 @@
 import struct
 import time
 from threading import Lock, Event
-from typing import Callable
+from typing import Callable, Union
 
 import numpy as np
 
@@ -18,6 +18,16 @@ from .base import BaseCmdUItf, BaseStreamUItf, RegOperationMixin, InitParamSet
 from ..tools.xdma import Xdma
 
 
+def _lite_words(data: Union[bytes, bytearray, memoryview]) -> np.ndarray:
+    """!
+    将字节数据按4Bytes补齐后视为uint32数组，已对齐时不复制
+    """
+    padding = -len(data) % 4
+    if padding:
+        data = bytes(data) + b'\x00' * padding
+    return np.frombuffer(data, dtype=np.uint32)
+
+
 class PCIECmdUItf(BaseCmdUItf):
     """!
     @brief PCIE指令接口
@@ -86,7 +96,14 @@ class PCIECmdUItf(BaseCmdUItf):
         """
         self.timeout = s
 
-    def write(self, addr: int, value: int):
+    def get_timeout(self) -> float:
+        """!
+        @brief 获取当前的超时时间
+        @return 秒
+        """
+        return self.timeout
+
+    def write(self, addr: int, value: bytes):
         """!
         @brief pcie写寄存器
         @details 按照输入的地址、值，使用fpga_wr_lite写入目标寄存器
@@ -94,19 +111,37 @@ class PCIECmdUItf(BaseCmdUItf):
         @param value 要写入的值
         @return True/False
         """
+        self.write_u32(addr, struct.unpack('=I', value)[0])
+
+    def read(self, addr: int) -> bytes:
+        """!
+        @brief pcie读寄存器
+        @details 按照输入的地址，使用fpga_rd_lite查询该地址的值并返回
+        @param addr 寄存器地址
+        @return 该寄存的值
+        """
+        return struct.pack('=I', self.read_u32(addr))
+
+    def write_u32(self, addr: int, value: int) -> None:
+        """!
+        @brief pcie以整数写寄存器
+        @details 重载：[BaseCmdUItf.write_u32](#nsukit.interface.base.BaseCmdUItf.write_u32)，值直接交给fpga_wr_lite
+        @param addr 寄存器地址
+        @param value 要写入的值
+        @return
+        """
         if not self.open_flag:
             raise RuntimeError(f'{self.__class__.__name__}.{self.write.__name__}: '
                                f'Not connected to the board {self.board}.')
-        value = struct.unpack('=I', value)[0]
         if not self.xdma.alite_write(addr, value, self.board):
             self.open_flag = False
             raise RuntimeError(f'{self.__class__.__name__}.{self.write.__name__}: '
                                f'Failed to write to register {hex(addr)} on board {self.board}')
 
-    def read(self, addr: int) -> bytes:
+    def read_u32(self, addr: int) -> int:
         """!
-        @brief pcie读寄存器
-        @details 按照输入的地址，使用fpga_rd_lite查询该地址的值并返回
+        @brief pcie以整数读寄存器
+        @details 重载：[BaseCmdUItf.read_u32](#nsukit.interface.base.BaseCmdUItf.read_u32)
         @param addr 寄存器地址
         @return 该寄存的值
         """
@@ -117,7 +152,66 @@ class PCIECmdUItf(BaseCmdUItf):
         if not res[0]:
             raise RuntimeError(f'{self.__class__.__name__}.{self.read.__name__}: '
                                f'Failed to read from register {hex(addr)} on board {self.board}')
-        return struct.pack('=I', res[1])
+        return res[1]
+
+    def _write_array_each(self, addr: np.ndarray, value: np.ndarray) -> None:
+        """!
+        @brief 重载：BaseCmdUItf._write_array_each，逐个调用fpga_wr_lite，不经过bytes
+        """
+        if not self.open_flag:
+            raise RuntimeError(f'{self.__class__.__name__}.{self.write.__name__}: '
+                               f'Not connected to the board {self.board}.')
+        alite_write, board = self.xdma.alite_write, self.board
+        for _a, _v in zip(addr.tolist(), value.tolist()):
+            if not alite_write(_a, _v, board):
+                self.open_flag = False
+                raise RuntimeError(f'{self.__class__.__name__}.{self.write.__name__}: '
+                                   f'Failed to write to register {hex(_a)} on board {board}')
+
+    def _read_array_each(self, addr: np.ndarray) -> np.ndarray:
+        """!
+        @brief 重载：BaseCmdUItf._read_array_each，逐个调用fpga_rd_lite，结果直接写入数组
+        """
+        if not self.open_flag:
+            raise RuntimeError(f'{self.__class__.__name__}.{self.read.__name__}: '
+                               f'Not connected to the board {self.board}.')
+        alite_read, board = self.xdma.alite_read, self.board
+        res = np.empty(len(addr), dtype=np.uint32)
+        for _n, _a in enumerate(addr.tolist()):
+            ok, res[_n] = alite_read(_a, board)
+            if not ok:
+                raise RuntimeError(f'{self.__class__.__name__}.{self.read.__name__}: '
+                                   f'Failed to read from register {hex(_a)} on board {board}')
+        return res
+
+    def increment_write(self, addr: int, value: bytes, reg_len: int = 4) -> None:
+        """!
+        @brief 重载：BaseCmdUItf.increment_write，整段数据以一次alite_write_block写入
+        """
+        if reg_len != 4:
+            return super(PCIECmdUItf, self).increment_write(addr, value, reg_len)
+        if not self.open_flag:
+            raise RuntimeError(f'{self.__class__.__name__}.{self.increment_write.__name__}: '
+                               f'Not connected to the board {self.board}.')
+        if not self.xdma.alite_write_block(addr, _lite_words(value), self.board):
+            self.open_flag = False
+            raise RuntimeError(f'{self.__class__.__name__}.{self.increment_write.__name__}: '
+                               f'Failed to write to base register {hex(addr)} on board {self.board}')
+
+    def increment_read(self, addr: int, length: int, reg_len: int = 4) -> bytes:
+        """!
+        @brief 重载：BaseCmdUItf.increment_read，整段数据以一次alite_read_block读取
+        """
+        if reg_len != 4:
+            return super(PCIECmdUItf, self).increment_read(addr, length, reg_len)
+        if not self.open_flag:
+            raise RuntimeError(f'{self.__class__.__name__}.{self.increment_read.__name__}: '
+                               f'Not connected to the board {self.board}.')
+        ok, res = self.xdma.alite_read_block(addr, -(-length // 4), self.board)
+        if not ok:
+            raise RuntimeError(f'{self.__class__.__name__}.{self.increment_read.__name__}: '
+                               f'Failed to read from base register {hex(addr)} on board {self.board}')
+        return res.tobytes()[:length]
 
     def send_down(self):
         self.sent_ptr = 0
@@ -182,32 +276,35 @@ class PCIECmdUItf(BaseCmdUItf):
     def _send(self, data):
         """!
         @brief 指令发送
-        @details 数据不满足4Bytes整倍数的，被自动补齐为4Bytes整倍数，使用wr_lite写入数据
+        @details 数据不满足4Bytes整倍数的，被自动补齐为4Bytes整倍数，以一次alite_write_block写入数据
         @param data 要发送的数据
         @return 已经发送的数据长度
         """
+        data = _lite_words(data)
         with self.multi_board_lock:
-            data += b'\x00' * (len(data) % 4)
-            data = np.frombuffer(data, dtype=np.uint32)
-            for value in data:
-                self.xdma.alite_write(self.sent_base + self.sent_ptr, value, self.board)
-                self.sent_ptr += 4
+            addr = self.sent_base + self.sent_ptr
+            if not self.xdma.alite_write_block(addr, data, self.board):
+                self.open_flag = False
+                raise RuntimeError(f'{self.__class__.__name__}.{self.send_bytes.__name__}: '
+                                   f'Failed to write to base register {hex(addr)} on board {self.board}')
+            self.sent_ptr += data.nbytes
             return int(data.nbytes)
 
     def _recv(self, size):
         """!
         @brief 指令接收
-        @details 使用rd_lite读取数据
+        @details 以一次alite_read_block读取数据
         @param size 要接收的数据大小
         @return 接收的数据
         """
+        recv_size = -(-size // 4)
         with self.multi_board_lock:
-            recv_size = size + size % 4
-            recv_size //= 4
-            res = np.zeros((recv_size,), dtype=np.uint32)
-            for idx in range(recv_size):
-                res[idx] = self.xdma.alite_read(self.recv_base + self.recv_ptr, self.board)[1]
-                self.recv_ptr += 4
+            addr = self.recv_base + self.recv_ptr
+            ok, res = self.xdma.alite_read_block(addr, recv_size, self.board)
+            if not ok:
+                raise RuntimeError(f'{self.__class__.__name__}.{self.recv_bytes.__name__}: '
+                                   f'Failed to read from base register {hex(addr)} on board {self.board}')
+            self.recv_ptr += recv_size * 4
             return res.tobytes()[:size]
 
     @property
@@ -10,6 +10,7 @@
 
 import struct
 from threading import Lock
+from typing import Optional
 
 import serial
 
@@ -27,6 +28,7 @@ class SerialCmdUItf(VirtualRegCmdMixin, BaseCmdUItf):
     _target = 'COM0'
     _target_baud_rate = 9600
     _timeout = 15
+    reg_window = 8      # 流水线读写寄存器的窗口，受设备端串口接收缓冲限制取值较小
 
     def __init__(self):
         self.serial_port = self._target
@@ -37,7 +39,7 @@ class SerialCmdUItf(VirtualRegCmdMixin, BaseCmdUItf):
     def accept(self, param: InitParamSet) -> None:
         """!
         @brief 初始化串口指令接口
-        @details 初始化串口指令接口，获取串口id，波特率等参数
+        @details 初始化串口指令接口，获取串口id，波特率等参数，cmd_reg_caps为True时查询设备支持的寄存器指令
         @param param InitParamSet或其子类的对象，需包含cmd_serial_port、cmd_baud_rate属性
         @return
         """
@@ -51,6 +53,19 @@ class SerialCmdUItf(VirtualRegCmdMixin, BaseCmdUItf):
                                                 timeout=self._timeout)
             self.serial_port = _target
             self.baud_rate = _target_baud_rate
+        self.reg_caps = 0
+        if param.cmd_reg_caps:
+            self.negotiate_reg_caps()
+
+    def _discard_reply(self) -> None:
+        """!
+        @brief 重载：VirtualRegCmdMixin._discard_reply，读空接收缓冲，直到reg_caps_timeout内不再收到数据
+        """
+        with self.busy_lock:
+            self._device_serial.timeout = self.reg_caps_timeout
+            while self._device_serial.read(4096):
+                pass
+            self._device_serial.reset_input_buffer()
 
     def recv_bytes(self, size) -> bytes:
         """!
@@ -64,7 +79,9 @@ class SerialCmdUItf(VirtualRegCmdMixin, BaseCmdUItf):
             recv_size = 0
             while True:
                 if recv_size != size:
-                    data = self._device_serial.read(size)
+                    data = self._device_serial.read(size - recv_size)
+                    if not data:
+                        raise TimeoutError(f'{self.serial_port} recv timeout, {recv_size}/{size} bytes received')
                     recv_data += data
                     recv_size += len(data)
                 if recv_size >= size:
@@ -127,6 +144,13 @@ class SerialCmdUItf(VirtualRegCmdMixin, BaseCmdUItf):
         """
         self._device_serial.timeout = s
 
+    def get_timeout(self) -> Optional[float]:
+        """!
+        @brief 获取当前的超时时间
+        @return 秒，为None时不超时
+        """
+        return self._device_serial.timeout
+
 
 class SerialStreamUItf(BaseStreamUItf):
     """!
@@ -16,7 +16,7 @@ import ctypes
 import time
 from threading import Lock, Event
 from dataclasses import dataclass, field
-from typing import Union, Dict, Iterable, Callable
+from typing import Union, Dict, Iterable, Callable, Optional
 
 import numpy as np
 
@@ -31,6 +31,9 @@ class TCPCmdUItf(VirtualRegCmdMixin, BaseCmdUItf):
     @image html professional_tcp_cmd.png
     """
     _timeout = 15
+    _iov_max = 512  # 单次sendmsg的最大缓冲区数量
+    pipelined = True
+    reg_window = 64     # 流水线读写寄存器的窗口
 
     def __init__(self):
         self.addr = 'xxx.xxx.xxx.xxx'
@@ -42,16 +45,35 @@ class TCPCmdUItf(VirtualRegCmdMixin, BaseCmdUItf):
     def accept(self, param: InitParamSet):
         """!
         @brief 初始化网络指令接口
-        @details 初始化网络指令接口，获取IP地址，端口号等参数
+        @details 初始化网络指令接口，获取IP地址，端口号等参数，cmd_reg_caps为True时查询设备支持的寄存器指令
         @param param InitParamSet或其子类的对象，需包含cmd_ip、cmd_tcp_port属性
         @return
         """
         with self.busy_lock:
-            self._tcp_server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self._tcp_server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.set_timeout(self._timeout)
-            self._tcp_server.connect((param.cmd_ip, param.cmd_tcp_port))
+            self._connect((param.cmd_ip, param.cmd_tcp_port))
             self.addr = param.cmd_ip
+        self.reg_caps = 0
+        if param.cmd_reg_caps:
+            self.negotiate_reg_caps()
+
+    def _connect(self, address: tuple) -> None:
+        self._tcp_server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._tcp_server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.set_timeout(self._timeout)
+        self._tcp_server.connect(address)
+
+    def _discard_reply(self) -> None:
+        """!
+        @brief 重载：VirtualRegCmdMixin._discard_reply，重新建立连接，迟到的反馈随旧连接一起丢弃
+        """
+        with self.busy_lock:
+            address = self._tcp_server.getpeername()
+            try:
+                self._tcp_server.shutdown(socket.SHUT_RDWR)
+                self._tcp_server.close()
+            except OSError as e:
+                logging.error(msg=e)
+            self._connect(address)
 
     def recv_bytes(self, size: int) -> bytes:
         """!
@@ -90,6 +112,34 @@ class TCPCmdUItf(VirtualRegCmdMixin, BaseCmdUItf):
                 if send_len == 0:
                     raise RuntimeError("Connection interruption")
 
+    def send_buffers(self, buffers: Iterable[Union[bytes, bytearray, memoryview]]) -> int:
+        """!
+        @brief      聚集发送数据
+        @details    使用socket.sendmsg将多个缓冲区一次性交给内核发送，不在用户态拼接；
+                    平台不支持sendmsg时退回BaseCmdUItf.send_buffers
+        @param buffers 缓冲区列表
+        @return     发送完成的数据长度
+        """
+        if not hasattr(self._tcp_server, 'sendmsg'):
+            return super().send_buffers(buffers)
+        views = [memoryview(buffer).cast('B') for buffer in buffers]
+        views = [view for view in views if len(view)]
+        total_len = sum(len(view) for view in views)
+        with self.busy_lock:
+            total_sendlen, start = 0, 0
+            while start < len(views):
+                send_len = self._tcp_server.sendmsg(views[start:start + self._iov_max])
+                if send_len == 0:
+                    raise RuntimeError("Connection interruption")
+                total_sendlen += send_len
+                # 跳过已发完的缓冲区，只对部分发送的首个缓冲区切片
+                while start < len(views) and send_len >= len(views[start]):
+                    send_len -= len(views[start])
+                    start += 1
+                if send_len:
+                    views[start] = views[start][send_len:]
+            return total_sendlen
+
     def write(self, addr: int, value: bytes) -> None:
         """!
         @brief 发送数据
@@ -130,6 +180,13 @@ class TCPCmdUItf(VirtualRegCmdMixin, BaseCmdUItf):
         """
         self._tcp_server.settimeout(s)
 
+    def get_timeout(self) -> Optional[float]:
+        """!
+        @brief 获取当前的超时时间
+        @return 秒，为None时不超时
+        """
+        return self._tcp_server.gettimeout()
+
 
 def get_port(ip):
     """!
@@ -10,5 +10,7 @@
 from .base import BaseRegMw, BaseStreamMw
 from .icd_parser import ICDRegMw
 from .virtual_chnl import VirtualStreamMw
+from .reg_fields import RegFieldMw
+from .telemetry import TelemetryMw
 
-__all__ = ["BaseStreamMw", "BaseRegMw", "ICDRegMw", "VirtualStreamMw"]
+__all__ = ["BaseStreamMw", "BaseRegMw", "ICDRegMw", "VirtualStreamMw", "RegFieldMw", "TelemetryMw"]
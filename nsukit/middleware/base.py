@@ -42,18 +42,33 @@ class BaseRegMw(UMiddleware):
     def set_param(self, param_name: str, value):
         ...
 
-    def execute(self, cname: str, array=None) -> None:
+    def execute(self, cname: str, array=None, only_if_dirty: bool = False) -> None:
+        ...
+
+    def sync(self, window: int = 8) -> None:
+        ...
+
+    def sweep(self, cname: str, params: dict, window: int = 8):
+        ...
+
+    def execute_many(self, commands, window: int = 8) -> None:
         ...
 
     def fmt_command(self, command_name, command_type: str = "send", file_name=None, arrays=None) -> bytes:
         ...
 
+    def fmt_command_parts(self, command_name, command_type: str = "send", file_name=None, arrays=None) -> tuple:
+        ...
+
     def exec_with_bytes(self, data: bytes, check_feedback=True, need_feedback=False) -> Optional[bytes]:
         ...
 
     def execute_from_pname(self, parm_name: str) -> list:
         ...
 
+    def execute_from_pnames(self, parm_names, window: int = 8) -> None:
+        ...
+
 
 class BaseStreamMw(UMiddleware):
     def open_send(self, chnl: int, fd: int, length: int, offset: int = 0):
@@ -10,7 +10,11 @@
 
 import json
 import struct
-from typing import TYPE_CHECKING, Optional
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import TYPE_CHECKING, Optional, Callable, Any, Tuple, Iterable, Union
 
 try:
     import numpy as np
@@ -22,6 +26,9 @@ import nsukit
 from .base import BaseRegMw
 from ..interface.base import InitParamSet
 from ..tools.logging import logging
+from ..tools.expr_eval import compile_expr
+from ..tools.file_cache import FileCache
+from ..tools.icd_cache import ICDCache
 
 if TYPE_CHECKING:
     from .. import NSUSoc
@@ -79,6 +86,291 @@ feedback_value_fmt = {
 }
 
 
+SLOT_VALUE = 0              # 参数值字段
+SLOT_FILE_LENGTH = 1        # file_length类型字段
+SLOT_CTX_FILE_LENGTH = 2    # __filelength__字段
+SLOT_ARRAY_LENGTH = 3       # __arraylength__字段
+
+SEG_FILE = 0                # file类型字段
+SEG_CTX_FILE = 1            # __file__字段
+SEG_ARRAY = 2               # __array__字段
+SEG_SUB_COMMAND = 3         # {{指令名}}字段
+
+_UNSET = object()
+file_types = ("file", "file_length")
+
+
+def normalize_value(ptype: str, value):
+    """!
+    @brief 将参数值转换为其类型对应的python值
+    @details 0x/0b开头的字符串按16/2进制整数解析，带小数点的字符串按浮点数解析，文件类参数保持原值
+    @param ptype: 参数类型
+    @param value: 原始参数值
+    @return: 转换后的值
+    """
+    if ptype in file_types:
+        return value
+    if isinstance(value, str):
+        if value.startswith('0x'):
+            value = int(value, 16)
+        elif value.startswith('0b'):
+            value = int(value, 2)
+        elif '.' in value:
+            value = float(value)
+    cast = value_python.get(ptype, None)
+    return value if cast is None else cast(value)
+
+
+class ParamRecord:
+    """!
+    @brief 一个已规范化的icd参数
+    @details value在加载与设置时已按type转换，读取时无需再解析；version在值被设置为不同的值时递增，用于脏标记。
+    为兼容原有的fpack列表用法，支持按 [type, value(, expr)] 下标访问
+    """
+    __slots__ = ('type', 'value', 'expr', 'version')
+
+    def __init__(self, ptype: str, value, expr: Optional[str] = None):
+        self.type = ptype
+        self.value = value
+        self.expr = expr
+        self.version = 0
+
+    def update(self, value) -> bool:
+        """!
+        @brief 设置参数值
+        @param value: 已规范化的参数值
+        @return: 值是否发生变化
+        """
+        old = self.value
+        if value.__class__ is old.__class__ and value == old:
+            return False
+        self.value = value
+        self.version += 1
+        return True
+
+    @classmethod
+    def from_fpack(cls, name: str, fpack, t_idx: int = 0, v_idx: int = 1) -> "ParamRecord":
+        if isinstance(fpack, ParamRecord):
+            return fpack
+        ptype, value = fpack[t_idx], fpack[v_idx]
+        expr = fpack[-1] if len(fpack) > v_idx + 1 else None
+        try:
+            value = normalize_value(ptype, value)
+        except (ValueError, TypeError) as e:
+            # 保留原值，发送时按字段打包失败处理
+            logging.error(msg=f'{e},参数({name})的值({value})有误')
+        return cls(ptype, value, expr)
+
+    def __iter__(self):
+        yield self.type
+        yield self.value
+        if self.expr is not None:
+            yield self.expr
+
+    def __len__(self) -> int:
+        return 2 if self.expr is None else 3
+
+    def __getitem__(self, index):
+        return tuple(self)[index]
+
+    def __setitem__(self, index: int, value) -> None:
+        index = range(3)[index]
+        if index == 0:
+            self.type = value
+        elif index == 1:
+            self.update(normalize_value(self.type, value))
+        else:
+            self.expr = value
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (ParamRecord, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}{tuple(self)!r}'
+
+
+class ParamStore(MutableMapping):
+    """!
+    @brief icd参数表
+    @details 包装icd中的param段，每个参数在首次访问时转换为ParamRecord并缓存于records中，
+    同时替换param段中的原始条目，之后的读写只是属性访问，保存icd时序列化的也是记录中的当前值。
+    新增或替换参数时调用on_change，供中间件丢弃已编译的指令
+    """
+
+    def __init__(self, raw=None, t_idx: int = 0, v_idx: int = 1, on_change: Optional[Callable] = None):
+        self._raw = {} if raw is None else raw
+        self._t_idx = t_idx
+        self._v_idx = v_idx
+        self.on_change = on_change
+        self.records = {}
+
+    def record(self, name: str) -> Optional[ParamRecord]:
+        """!
+        @brief 获取参数记录
+        @param name: 参数名
+        @return: ParamRecord，参数不存在时返回None
+        """
+        record = self.records.get(name, None)
+        if record is None and name in self._raw:
+            record = ParamRecord.from_fpack(name, self._raw[name], self._t_idx, self._v_idx)
+            self.records[name] = self._raw[name] = record
+        return record
+
+    def __getitem__(self, name: str) -> ParamRecord:
+        record = self.record(name)
+        if record is None:
+            raise KeyError(name)
+        return record
+
+    def __setitem__(self, name: str, fpack) -> None:
+        record = ParamRecord.from_fpack(name, fpack, self._t_idx, self._v_idx)
+        self.records[name] = record
+        self._raw[name] = record
+        if self.on_change is not None:
+            self.on_change()
+
+    def __delitem__(self, name: str) -> None:
+        del self._raw[name]
+        self.records.pop(name, None)
+        if self.on_change is not None:
+            self.on_change()
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.records or name in self._raw
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def __len__(self) -> int:
+        return len(self._raw)
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({len(self)} params)'
+
+
+def _json_default(obj):
+    if isinstance(obj, ParamRecord):
+        return list(obj)
+    return dict(obj)
+
+
+def array_buffer(array) -> memoryview:
+    """!
+    @brief 获取数组内容的字节视图
+    @details C连续的数组直接返回memoryview，不复制数据；非连续数组需先复制为连续数组
+    @param array: numpy.ndarray或numpy标量
+    @return: 按字节排列的memoryview
+    """
+    array = np.asarray(array)
+    if not array.flags.c_contiguous:
+        array = np.ascontiguousarray(array)
+    return memoryview(array.reshape(-1).view(np.uint8))
+
+
+def array_buffers(array, row_min_bytes: int = 4096) -> list:
+    """!
+    @brief 获取数组内容的字节视图列表
+    @details C连续的数组返回一个memoryview；非连续数组若每行(最后一维)连续且行足够长，
+    则逐行返回memoryview，由聚集发送拼接，不复制数据；其余情况复制为连续数组
+    @param array: numpy.ndarray或numpy标量
+    @param row_min_bytes: 按行返回视图时每行的最小字节数，行过短时复制比逐行发送更快
+    @return: 按字节排列的memoryview列表
+    """
+    array = np.asarray(array)
+    if array.flags.c_contiguous:
+        return [memoryview(array.reshape(-1).view(np.uint8))]
+    if array.ndim >= 2 and array.strides[-1] == array.itemsize and array.shape[-1] * array.itemsize >= row_min_bytes:
+        return [memoryview(array[index].view(np.uint8)) for index in np.ndindex(*array.shape[:-1])]
+    return [array_buffer(array)]
+
+
+class PackSlot:
+    """!
+    @brief 定长字段段中的一个可变字段
+    @details 记录字段在PackBlock中的偏移与打包方式，last缓存上次打包时的原始参数值，值未变化时跳过打包
+    """
+    __slots__ = ('kind', 'name', 'record', 'arg', 'expr', 'cast', 'code', 'offset', 'pack_into', 'last')
+
+    def __init__(self, kind: int, name: Optional[str] = None, arg: Any = None,
+                 expr: Optional[Callable] = None, cast: Callable = int, record: Optional["ParamRecord"] = None):
+        self.kind = kind
+        self.name = name
+        self.record = record
+        self.arg = arg
+        self.expr = expr
+        self.cast = cast
+        self.code = 'I'
+        self.offset = 0
+        self.pack_into: Optional[Callable] = None
+        self.last = _UNSET
+
+
+class PackBlock:
+    """!
+    @brief 指令中一段连续的定长字段
+    @details 以一个struct.Struct描述整段布局，常量字段在编译时已写入buffer，执行时只对slots做pack_into
+    """
+    __slots__ = ('layout', 'buffer', 'slots')
+
+    def __init__(self, layout: struct.Struct, buffer: bytearray, slots: list):
+        self.layout = layout
+        self.buffer = buffer
+        self.slots = slots
+
+
+class CommandPlan:
+    """!
+    @brief 预编译的指令
+    @details 由PackBlock与变长段(文件、数组等)按顺序组成，head为包含指令长度字段的首个PackBlock；
+    records/versions用于判断指令的输入参数自上次打包后是否变化
+    """
+    __slots__ = ('name', 'segments', 'static_size', 'head', 'lock', 'records', 'versions')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.segments: list = []
+        self.static_size = 0
+        self.head: Optional[PackBlock] = None
+        self.lock = threading.Lock()
+        self.records: list = []         # 指令引用的参数记录
+        self.versions: tuple = ()       # 最近一次打包时各参数记录的version
+
+
+class ReplyLayout:
+    """!
+    @brief 预编译的反馈格式
+    @details 以一个struct.Struct描述整条反馈，fields为(反馈中的值序号, 参数记录)，解析时一次unpack后批量写入参数
+    """
+    __slots__ = ('layout', 'fields', 'codes', 'names')
+
+    def __init__(self, layout: struct.Struct, fields: list, codes: tuple = (), names: tuple = ()):
+        self.layout = layout
+        self.fields = fields
+        self.codes = codes      # 各字段的struct格式符
+        self.names = names      # 各字段对应的参数名，常量字段为None
+
+    @property
+    def size(self) -> int:
+        return self.layout.size
+
+
+class QueryFlight:
+    """!
+    @brief 一次查询指令的执行
+    @details 并发执行同一查询指令的调用方共享同一个QueryFlight，done前为在途请求，done后在ttl内作为缓存；
+    versions为发起请求时指令输入参数的version，参数变化后的调用不共享此前的请求
+    """
+    __slots__ = ('event', 'error', 'time', 'versions')
+
+    def __init__(self, versions: tuple = (), event_class: Callable = threading.Event):
+        self.event = event_class()
+        self.error: Optional[BaseException] = None
+        self.time = 0.
+        self.versions = versions
+
+
 class ICDRegMw(BaseRegMw):
     """!
     @brief ICD控制
@@ -88,15 +380,32 @@ class ICDRegMw(BaseRegMw):
     fmt_mode = "="   # pack/unpack 大小端模式
     FPack_TIdx = 0  # fpack格式中type描述的索引号
     FPack_VIdx = 1  # fpack格式中value描述的索引号
+    file_cache_entries = 16                     # 文件缓存的最大条目数
+    file_cache_bytes = 256 * 1024 ** 2          # 文件缓存的最大字节数
+    file_mmap_threshold = 16 * 1024 ** 2        # 超过此大小的文件以mmap方式映射
+    icd_cache_dir = None                        # icd解析缓存目录，为None时使用默认目录，为False时不使用缓存
+    query_ttl = 0.                              # 查询指令结果的默认缓存时间，单位s，为0时只合并并发请求
+    dirty_tracking = False                      # 是否记录指令的确认状态，为False时指令总是视为脏，sync不可用
 
     def __init__(self, kit: "NSUSoc", file_name='icd.json'):
         super(ICDRegMw, self).__init__(kit)
         self._file_name = file_name
         self.icd_data = {}
-        self.param = {}
+        self.param = ParamStore(on_change=self.__drop_plans)
         self.command = {}
         self.sequence = {}
         self.check_recv_head = False
+        self._plans = {}
+        self._replies = {}
+        self._param_index = None
+        self._acked = {}
+        self._dirty_params = set()
+        self._queries = {}
+        self._query_lock = threading.Lock()
+        self._seq = 0
+        self._seq_lock = threading.Lock()
+        self.file_cache = FileCache(self.file_cache_entries, self.file_cache_bytes, self.file_mmap_threshold)
+        self.icd_cache = None if self.icd_cache_dir is False else ICDCache(self.icd_cache_dir)
 
     def config(self, param: InitParamSet) -> None:
         """!
@@ -112,6 +421,7 @@ class ICDRegMw(BaseRegMw):
             icd_path = param.icd_path
         self._file_name = icd_path
         self.check_recv_head = param.check_recv_head
+        self.dirty_tracking = param.dirty_tracking
         self.load()
 
     def load(self):
@@ -119,25 +429,35 @@ class ICDRegMw(BaseRegMw):
         从文件中加载数据，并相应地设置实例变量。
         此方法从指定的文件中读取数据，通常文件采用JSON格式存储，并将读取的数据设置为相关实例变量。
         文件中包含了与接口控制文档 (ICD) 相关的信息。
+        解析结果按文件内容哈希缓存，指令在首次使用时才编译。
 
         @return: 若数据成功加载，则返回True；否则返回False。
         @rtype: bool
         """
         file_path = self._file_name
-        # 使用utf-8编码打开文件并以读取模式
-        with open(file_path, 'r', encoding='utf-8') as fp:
-            try:
-                # 尝试将JSON数据从文件加载到 'icd_data' 实例变量中
-                self.icd_data = json.load(fp)
-            except json.decoder.JSONDecodeError as e:
-                # 如果出现JSON解码错误，记录错误消息并返回False表示加载失败
-                logging.error(msg=f'{e}, {self._file_name} unavailable')
-                return False
+        try:
+            # 尝试将JSON数据从文件(或其解析缓存)加载到 'icd_data' 实例变量中
+            if self.icd_cache is None:
+                with open(file_path, 'r', encoding='utf-8') as fp:
+                    self.icd_data = json.load(fp)
+            else:
+                self.icd_data = self.icd_cache.load(file_path)
+        except (json.decoder.JSONDecodeError, UnicodeDecodeError) as e:
+            # 如果出现JSON解码错误，记录错误消息并返回False表示加载失败
+            logging.error(msg=f'{e}, {self._file_name} unavailable')
+            return False
         try:
             # 从 'icd_data' 字典中提取特定数据并将其设置为实例变量
-            self.param = self.icd_data['param']
+            self.param = ParamStore(self.icd_data['param'], self.FPack_TIdx, self.FPack_VIdx, self.__drop_plans)
             self.command = self.icd_data['command']
             self.sequence = self.icd_data['sequence']
+            # 丢弃旧的编译结果，指令在首次使用时重新编译
+            self._plans = {}
+            self._replies = {}
+            self._param_index = None
+            self._acked = {}
+            self._dirty_params = set()
+            self._queries = {}
             # 记录成功消息，表示ICD参数加载成功
             logging.debug(msg='ICD Parameters loaded successfully')
         except Exception as e:
@@ -158,77 +478,72 @@ class ICDRegMw(BaseRegMw):
         path = path + '\\' if path else path
         with open(path + self._file_name.split('.')[0] + '_run.json', 'w', encoding='utf-8') as fp:
             # 按utf-8的格式格式化并写入文件
-            json.dump(self.icd_data, fp, ensure_ascii=False, indent=4)
+            json.dump(self.icd_data, fp, ensure_ascii=False, indent=4, default=_json_default)
             logging.info(msg='参数保存成功')
         return True
 
     def get_param(self, param_name: str, default=0):
         """!
         @brief 获取icd参数
-        @details 根据参数名称获取参数值
+        @details 根据参数名称获取参数值，参数不存在时返回默认值，不新增参数，已编译的指令不受影响
         @param param_name: 参数名称
         @param default: 默认值
-        @param fmt_type: 参数值格式化类型
         @return: 格式化后的参数值
         """
-        v_idx = self.FPack_VIdx
-        t_idx = self.FPack_TIdx
-        param = self.param.get(param_name, None)
-        if isinstance(param[v_idx], str) and param[v_idx].startswith('0x'):
-            return int(param[v_idx], 16)
-        elif isinstance(param[v_idx], str) and param[v_idx].startswith('0b'):
-            return int(param[v_idx], 2)
-        elif param[t_idx] == "file" or param[t_idx] == "file_length":
-            return param[v_idx]
-        elif param is None:
+        record = self.param.record(param_name)
+        if record is None:
             logging.warning(msg=f'未找到参数：{param_name}')
-            self.param.update({param_name: ['uint32', default]})
             return int(default)
-        return value_python[param[t_idx]](param[v_idx])
+        return record.value
 
     def set_param(self, param_name: str, value):
         """!
         @brief 设置参数值
-        @details 根据参数名称设置相应的值
+        @details 根据参数名称设置相应的值，值按参数类型转换后保存
         @param param_name: 参数名称
         @param value: 参数值
-        @param fmt_type: 参数值格式化类型
         @return:
         """
-        v_idx = self.FPack_VIdx
-        t_idx = self.FPack_TIdx
-        if v_idx == 1:
-            param = self.param.get(param_name, ['uint32', value])
-        elif v_idx == 2:
-            param = self.param.get(param_name, ['', 'uint32', value])
-        else:
-            raise RuntimeError(f'The value of class attribute fpack_v_idx should not be {v_idx}')
-
-        if isinstance(value, str) and value.startswith('0x'):
-            param[v_idx] = int(value, 16)
-        elif isinstance(value, str) and value.startswith('0b'):
-            param[v_idx] = int(value, 2)
-        elif param[t_idx] == "file" or param[t_idx] == "file_length":
-            param[v_idx] = value
-        elif isinstance(value, str) and '.' in value and param[t_idx] != 'file':
-            param[v_idx] = float(value)
-        else:
-            param[v_idx] = value_python[param[t_idx]](value)
-        self.param.update({param_name: param})
+        record = self.param.record(param_name)
+        if record is None:
+            # 新增参数可能被已编译的指令引用，由参数表通知丢弃已编译的指令
+            self.param[param_name] = ParamRecord('uint32', normalize_value('uint32', value))
+        elif record.update(normalize_value(record.type, value)) and self.dirty_tracking:
+            self._dirty_params.add(param_name)
+
+    def __drop_plans(self):
+        self._plans.clear()
+        self._replies.clear()
+        # 参数记录可能已被替换，此前的确认记录与查询结果不再可信
+        self._acked.clear()
+        self.invalidate_query()
 
     def fmt_command(self, command_name, command_type: Optional[str] = "send", file_name=None, arrays=None) -> bytes:
         """!
         @brief 格式化指令
-        @details 根据指令名、指令类型和文件名组合成指令
+        @details 根据指令名、指令类型和文件名组合成指令，指令结构取自load时预编译的CommandPlan
         @param command_name: 指令名称
         @param command_type: 指令类型(发送接收)
         @param file_name: 文件名
         @param arrays: 数组
         @return: 格式化好的指令
         """
-        v_idx = self.FPack_VIdx
+        parts, _ = self.fmt_command_parts(command_name, command_type, file_name, arrays)
+        return b''.join(parts)
+
+    def fmt_command_parts(self, command_name, command_type: Optional[str] = "send",
+                          file_name=None, arrays=None) -> Tuple[list, int]:
+        """!
+        @brief 以缓冲区列表的形式格式化指令
+        @details 与fmt_command相同，但不拼接整条指令：文件与数组内容以bytes/mmap/memoryview的形式原样给出，
+        可直接交给BaseCmdUItf.send_buffers发送，避免大数据量指令被复制
+        @param command_name: 指令名称
+        @param command_type: 指令类型(发送接收)
+        @param file_name: 文件名
+        @param arrays: 数组
+        @return: (缓冲区列表, 指令总长度)
+        """
         file_data = b''
-        command = []
         __array__ = []
         file_length = 0
         if arrays is not None and not EnableNumpy:
@@ -236,105 +551,839 @@ class ICDRegMw(BaseRegMw):
         if isinstance(file_name, str):
             file_data, file_length = self.__get_file(file_name)
         elif isinstance(file_name, np.ndarray):
-            file_data = file_name.tobytes()
-        if isinstance(arrays, np.ndarray):
-            __array__ = [array.tobytes() for array in arrays]
+            file_data = array_buffer(file_name)
+        if arrays is not None:
+            # 每行数组以一个或多个memoryview表示，长度字段按nbytes计算
+            if isinstance(arrays, np.ndarray) and arrays.ndim == 1:
+                # 一维数组的每个元素各为一行，以切片代替标量避免复制
+                arrays = [arrays[index:index + 1] for index in range(len(arrays))]
+            __array__ = [array_buffers(array) for array in arrays]
         try:
-            target_bytes = []
-            if command_name in self.sequence:
-                raise ValueError(f'Sequence mode is not supported temporarily')
+            if self.is_command_sequence(command_name):
+                parts, total = [], 0
+                for member in self.sequence[command_name]:
+                    member_parts, member_total = self.fmt_command_parts(member, command_type, file_name, arrays)
+                    parts.extend(member_parts)
+                    total += member_total
+                return parts, total
+            plan = self.get_plan(command_name, command_type)
+            return self._encode(plan, file_data, file_length, __array__)
+        except Exception as e:
+            import traceback
+            traceback.print_exception(e)
+            logging.error(msg=f'{e},指令转码失败')
+        return [struct.pack(self.fmt_mode + 'I', 0)], 4
+
+    def is_command_sequence(self, name: str) -> bool:
+        """!
+        @brief 判断sequence组中的name是否为由指令组成的指令序列
+        @details sequence组的成员全部为command组中的指令名时为指令序列，可作为一条指令执行；
+        否则为字段序列，通过"{{name}}"字段展开到指令中
+        @param name: sequence名称
+        @return: True/False
+        """
+        members = self.sequence.get(name, None)
+        return bool(members) and all(isinstance(member, str) and member in self.command for member in members)
+
+    def get_plan(self, command_name, command_type: Optional[str] = "send") -> CommandPlan:
+        """!
+        @brief 获取指令的预编译计划
+        @details 计划在首次使用时编译，新增参数或重新加载icd后会被清空并在下次使用时重新编译
+        @param command_name: 指令名称
+        @param command_type: 指令类型(发送接收)
+        @return: 指令计划
+        """
+        key = (command_name, command_type)
+        plan = self._plans.get(key, None)
+        if plan is None:
+            plan = self._compile(command_name, command_type)
+            self._plans[key] = plan
+        return plan
 
-            cpack = self.command[command_name] if command_type is None else self.command[command_name][command_type]
-            for register in cpack:
+    def get_reply_layout(self, command_name) -> ReplyLayout:
+        """!
+        @brief 获取指令反馈的预编译格式
+        @param command_name: 指令名称
+        @return: 反馈格式
+        """
+        layout = self._replies.get(command_name, None)
+        if layout is None:
+            layout = self._compile_reply(command_name)
+            self._replies[command_name] = layout
+        return layout
+
+    def _compile_reply(self, command_name) -> ReplyLayout:
+        """!
+        @brief 编译指令的recv列表
+        @details 常量字段只占位不解析，参数字段记录其在unpack结果中的序号与参数记录；
+        未定义的参数按uint32占位并丢弃其值
+        @param command_name: 指令名称
+        @return: 反馈格式
+        """
+        t_idx = self.FPack_TIdx
+        codes, fields, names = [], [], []
+        for fpack in self.command[command_name]["recv"]:
+            record = None
+            if isinstance(fpack, str):
+                record = self.param.record(fpack)
+                if record is None:
+                    logging.warning(msg=f'指令({command_name})的反馈字段({fpack})不存在')
+                ftype = 'uint32' if record is None else record.type
+            else:
+                ftype = fpack[t_idx]
+            if ftype not in value_type:
+                logging.error(msg=f'{ftype},指令({command_name})的反馈字段({fpack})有误')
+                ftype = 'uint32'
+            if record is not None:
+                fields.append((len(codes), record))
+            names.append(None if record is None else fpack)
+            codes.append(value_type[ftype])
+        return ReplyLayout(struct.Struct(self.fmt_mode + ''.join(codes)), fields, tuple(codes), tuple(names))
+
+    def _compile(self, command_name, command_type: Optional[str] = "send") -> CommandPlan:
+        """!
+        @brief 编译指令
+        @details 将send/recv列表编译为若干定长字段段(PackBlock)与变长段，常量字段在此时一次性打包
+        @param command_name: 指令名称
+        @param command_type: 指令类型(发送接收)
+        @return: 指令计划
+        """
+        t_idx = self.FPack_TIdx
+        v_idx = self.FPack_VIdx
+        cpack = self.command[command_name] if command_type is None else self.command[command_name][command_type]
+        plan = CommandPlan(command_name)
+        codes, values, slots = [], [], []
+        offset = 0
+
+        def close_block():
+            nonlocal codes, values, slots, offset
+            if codes:
+                layout = struct.Struct(self.fmt_mode + ''.join(codes))
+                block = PackBlock(layout, bytearray(layout.pack(*values)), slots)
+                if not plan.segments and layout.size >= 16:
+                    plan.head = block
+                plan.segments.append(block)
+                plan.static_size += layout.size
+            codes, values, slots, offset = [], [], [], 0
+
+        def add_field(code, value=0, slot=None):
+            nonlocal offset
+            if slot is not None:
+                slot.offset = offset
+                slot.code = code
+                slot.pack_into = struct.Struct(self.fmt_mode + code).pack_into
+                slots.append(slot)
+            codes.append(code)
+            values.append(value)
+            offset += struct.calcsize(self.fmt_mode + code)
+
+        def add_registers(registers, expanding):
+            for register in registers:
                 if isinstance(register, list):
-                    value, _fmt = self.__fmt_register(register, register[v_idx])
-                    if _fmt == 'file':
-                        command.append(value)
-                    else:
-                        command.append(struct.pack(self.fmt_mode + _fmt, value))
+                    record = None
+                    ftype, value = register[t_idx], register[v_idx]
+                    expr = register[-1] if len(register) > v_idx + 1 else None
+                elif isinstance(register, str) and register in self.param:
+                    record = self.param[register]
+                    ftype, value, expr = record.type, record.value, record.expr
+                    plan.records.append(record)
                 elif isinstance(register, str):
                     if register == file_context_flag:
-                        command.append(file_data)
+                        close_block()
+                        plan.segments.append((SEG_CTX_FILE, None))
                     elif register == file_length_flag:
-                        command.append(struct.pack(self.fmt_mode + 'I', file_length))
+                        add_field('I', slot=PackSlot(SLOT_CTX_FILE_LENGTH))
                     elif register.startswith(array_context_flag):
-                        command.append(eval(register))
+                        close_block()
+                        plan.segments.append((SEG_ARRAY, self.__array_index(command_name, register)))
                     elif register.startswith(array_length_flag):
-                        index = register[15:]
-                        length = 0
-                        if index == '[all]':
-                            for one in __array__:
-                                length += len(one)
-                        else:
-                            length = len(eval(f'__array__{index}'))
-                        command.append(struct.pack(self.fmt_mode + 'I', length))
-                    elif register in self.param:
-                        value, _fmt = self.__fmt_register(self.param[register], self.param[register][v_idx])
-                        if _fmt == 'file':
-                            command.append(value)
+                        add_field('I', slot=PackSlot(SLOT_ARRAY_LENGTH,
+                                                     arg=self.__array_index(command_name, register)))
+                    elif register.startswith('{{') and register.endswith('}}'):
+                        sub_name = register[2:-2]
+                        if sub_name in self.sequence and sub_name not in expanding \
+                                and not self.is_command_sequence(sub_name):
+                            # 由字段组成的sequence，展开到指令中
+                            add_registers(self.sequence[sub_name], expanding | {sub_name})
                         else:
-                            command.append(struct.pack(self.fmt_mode + _fmt, value))
-                    elif register == f'{{{{{command_name}}}}}':
-                        command.extend(target_bytes)
+                            close_block()
+                            plan.segments.append((SEG_SUB_COMMAND, sub_name))
                     else:
                         logging.warning(msg=f'指令({command_name})的({register})不存在')
+                    continue
                 else:
                     logging.warning(msg=f'指令({command_name})的({register})格式不正确')
-        except Exception as e:
-            import traceback
-            traceback.print_exception(e)
-            logging.error(msg=f'{e},指令转码失败')
+                    continue
+
+                if expr is not None:
+                    expr = self.__compile_expr(register, expr)
+                if ftype == 'file':
+                    close_block()
+                    plan.segments.append((SEG_FILE, (record, value)))
+                elif ftype == 'file_length':
+                    add_field('I', slot=PackSlot(SLOT_FILE_LENGTH, arg=value, record=record))
+                elif ftype not in value_type:
+                    logging.error(msg=f'{ftype},寄存器({register})有误')
+                    add_field('I')
+                elif record is None:
+                    add_field(value_type[ftype], self.__fmt_value(register, value, expr))
+                else:
+                    add_field(value_type[ftype], slot=PackSlot(SLOT_VALUE, register, expr=expr,
+                                                               cast=value_python[ftype], record=record))
 
-        command = b''.join(command)
-        return b''.join((command[0: 12], struct.pack(self.fmt_mode + 'I', len(command)), command[16:]))
+        add_registers(cpack, frozenset())
+        close_block()
+        return plan
 
-    def __fmt_register(self, register: list, value):
-        t_idx = self.FPack_TIdx
+    def _encode(self, plan: CommandPlan, file_data=b'', file_length=0, arrays=()) -> Tuple[list, int]:
+        """!
+        @brief 按指令计划打包指令
+        @details 只有值发生变化的参数会被重新pack_into到可复用的缓冲区中，指令长度字段在最后回填
+        @param plan: 指令计划
+        @param file_data: 填充__file__字段的数据
+        @param file_length: 填充__filelength__字段的值
+        @param arrays: 填充__array__字段的数据，每项为一行数组的memoryview列表
+        @return: (缓冲区列表, 指令总长度)，定长段为快照，变长段为原始缓冲区
+        """
+        with plan.lock:
+            if plan.records:
+                plan.versions = tuple([record.version for record in plan.records])
+            parts = []
+            total = plan.static_size
+            for segment in plan.segments:
+                if segment.__class__ is PackBlock:
+                    buffer = segment.buffer
+                    for slot in segment.slots:
+                        kind = slot.kind
+                        if kind == SLOT_VALUE:
+                            raw = slot.record.value
+                            last = slot.last
+                            if raw is last or (raw.__class__ is last.__class__ and raw == last):
+                                continue
+                            slot.pack_into(buffer, slot.offset, self.__fmt_value(slot, raw, slot.expr))
+                            slot.last = raw
+                            continue
+                        if kind == SLOT_FILE_LENGTH:
+                            path = slot.arg if slot.record is None else slot.record.value
+                            value = self.__get_file_length(path)
+                        elif kind == SLOT_CTX_FILE_LENGTH:
+                            value = file_length
+                        elif slot.arg is None:
+                            value = sum(len(chunk) for chunks in arrays for chunk in chunks)
+                        else:
+                            value = sum(len(chunk) for chunk in arrays[slot.arg])
+                        slot.pack_into(buffer, slot.offset, value)
+                    parts.append(buffer)
+                    continue
+                kind, arg = segment
+                if kind == SEG_FILE:
+                    record, path = arg
+                    data = self.__get_file(path if record is None else record.value)[0]
+                elif kind == SEG_CTX_FILE:
+                    data = file_data
+                elif kind == SEG_ARRAY:
+                    chunks = arrays[arg]
+                    total += sum(len(chunk) for chunk in chunks)
+                    parts.extend(chunks)
+                    continue
+                else:
+                    data = b''
+                total += len(data)
+                parts.append(data)
+            if plan.head is not None:
+                struct.pack_into(self.fmt_mode + 'I', plan.head.buffer, 12, total)
+                return [bytes(part) if part.__class__ is bytearray else part for part in parts], total
+            command = b''.join(parts)
+        command = b''.join((command[0: 12], struct.pack(self.fmt_mode + 'I', len(command)), command[16:]))
+        return [command], len(command)
+
+    @staticmethod
+    def __compile_expr(name, source) -> Callable:
+        """!
+        @brief 编译字段的计算表达式
+        @details 表达式不合法时记录错误，该字段在发送时按0打包
+        @param name: 参数名或字段描述
+        @param source: 计算表达式
+        @return: 函数 f(x)
+        """
+        try:
+            return compile_expr(source)
+        except ValueError as e:
+            logging.error(msg=f'{e},寄存器({name})有误')
+            return lambda x: 0
+
+    @staticmethod
+    def __array_index(command_name, register: str) -> Optional[int]:
+        """!
+        @brief 解析__array__[n]/__arraylength__[n]字段中的下标
+        @param command_name: 指令名称
+        @param register: 字段字符串
+        @return: 下标，[all]时返回None
+        """
+        flag = array_length_flag if register.startswith(array_length_flag) else array_context_flag
+        index = register[len(flag):]
+        if index == '[all]':
+            return None
+        try:
+            return int(index.strip()[1:-1], 0)
+        except ValueError:
+            raise ValueError(f'指令({command_name})的({register})下标不正确')
+
+    def __fmt_value(self, fpack, value, expr=None):
+        """!
+        @brief 按字段类型转换参数值
+        @param fpack: 字段描述，PackSlot或fpack列表
+        @param value: 原始参数值
+        @param expr: 发送时的参数计算表达式
+        @return: 转换后的值，转换失败时返回0
+        """
         try:
-            if register[t_idx] == "file":
-                file_data, file_length = self.__get_file(value)
-                return file_data, "file_data"
-            if register[t_idx] == "file_length":
-                file_data, file_length = self.__get_file(value)
-                return file_length, 'I'
             if isinstance(value, str) and value.startswith('0x'):
                 value = int(value, 16)
             if isinstance(value, str) and value.startswith('0b'):
                 value = int(value, 2)
-            if len(register) > self.FPack_VIdx+1:
+            if expr is not None:
                 # 发送时做参数计算
-                x = value
-                value = eval(register[-1])
-            fmt_str = value_type[register[t_idx]]
-            return value_python[register[t_idx]](value), fmt_str
+                value = expr(value)
+            cast = fpack.cast if isinstance(fpack, PackSlot) else value_python[fpack[self.FPack_TIdx]]
+            return cast(value)
         except Exception as e:
-            logging.error(msg=f'{e},寄存器({register[0]})有误')
-        return 0, 'I'
+            name = fpack.name if isinstance(fpack, PackSlot) else fpack
+            logging.error(msg=f'{e},寄存器({name})有误')
+        return 0
 
-    @staticmethod
-    def __get_file(file_name):
+    def __get_file(self, file_name):
         try:
-            with open(file_name, 'rb') as fp:
-                data = fp.read()
-            return data, len(data)
+            return self.file_cache.get(file_name)
         except Exception as e:
             logging.error(msg=f'{e},文件读取失败')
         return b'', 0
 
-    def execute(self, cname: str, array=None) -> None:
+    def __get_file_length(self, file_name):
+        try:
+            return self.file_cache.size(file_name)
+        except Exception as e:
+            logging.error(msg=f'{e},文件读取失败')
+        return 0
+
+    def execute(self, cname: str, array=None, only_if_dirty: bool = False) -> None:
         """!
         执行指令
         @param cname: 指令名称
         @param array: 传入要发送的数组
+        @param only_if_dirty: 为True时，若指令的输入参数自上次成功执行后未变化且未传入数组，则不发送
+        @return None
+        """
+        if only_if_dirty and array is None and not self.is_dirty(cname):
+            return
+        if array is None and self.command.get(cname, {}).get("query", False):
+            return self.__execute_query(cname)
+        if self.is_command_sequence(cname):
+            return self.execute_sequence(cname, array=array)
+        if cname not in self.command:
+            raise ValueError(
+                f'Unsupported command {cname}. The current list of available commands includes: {self.command.keys()}')
+        return self.__exchange(cname, array=array)
+
+    def __exchange(self, cname: str, array=None) -> None:
+        """!
+        @brief 按check_recv_head收发一条指令
+        @details 不经过查询合并，可在已持有self.kit.itf_cs.transaction_lock时调用
+        @param cname: 指令名称
+        @param array: 传入要发送的数组
+        @return None
+        """
+        if self.check_recv_head:
+            self.send_and_check(cname, array=array)
+        else:
+            self.send_and_not_check(cname, array=array)
+
+    def __execute_query(self, cname: str) -> None:
+        """!
+        @brief 执行查询指令
+        @details 同一查询指令同时只有一个请求在途，其余调用方等待并共享其结果；
+        结果在ttl秒内有效，有效期内的调用不发送请求。执行失败的结果不缓存。
+        指令的输入参数被set_param修改后，不再共享修改前发起的请求及其结果。
+        合并在获取指令接口的transaction_lock之前完成，等待链路的调用方不会各自再发一次请求
+        @param cname: 指令名称
+        @return None
+        """
+        flight, leader = self.join_query(cname)
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return
+        try:
+            self.__exchange(cname)
+        except BaseException as e:
+            self.finish_query(cname, flight, e)
+            raise
+        self.finish_query(cname, flight)
+
+    def join_query(self, cname: str, event_class: Callable = threading.Event) -> Tuple[QueryFlight, bool]:
+        """!
+        @brief 加入查询指令的在途请求或有效的缓存结果
+        @details 没有可共享的请求时新建一个，由调用方发送请求后调用finish_query；
+        供execute与AsyncNSUSoc复用查询合并
+        @param cname: 指令名称
+        @param event_class: 新建请求时使用的事件类，协程中使用asyncio.Event
+        @return (QueryFlight, 调用方是否需要发送请求)
+        """
+        ttl = self.command[cname].get("ttl", self.query_ttl)
+        versions = self.input_versions(cname)
+        with self._query_lock:
+            flight = self._queries.get(cname, None)
+            if flight is not None and (flight.versions != versions or
+                                       flight.event.is_set() and time.monotonic() - flight.time >= ttl):
+                flight = None
+            if flight is not None:
+                return flight, False
+            flight = self._queries[cname] = QueryFlight(versions, event_class)
+            return flight, True
+
+    def finish_query(self, cname: str, flight: QueryFlight, error: Optional[BaseException] = None) -> None:
+        """!
+        @brief 结束join_query新建的请求，唤醒等待的调用方
+        @param cname: 指令名称
+        @param flight: join_query返回的QueryFlight
+        @param error: 请求失败时的错误，失败的结果不缓存
+        @return None
+        """
+        flight.error = error
+        flight.time = time.monotonic()
+        if error is not None:
+            with self._query_lock:
+                if self._queries.get(cname, None) is flight:
+                    del self._queries[cname]
+        flight.event.set()
+
+    def invalidate_query(self, cname: Optional[str] = None) -> None:
+        """!
+        @brief 清除查询指令的缓存结果
+        @param cname: 指令名称，为None时清除全部
+        @return None
+        """
+        with self._query_lock:
+            if cname is None:
+                self._queries = {k: v for k, v in self._queries.items() if not v.event.is_set()}
+            elif cname in self._queries and self._queries[cname].event.is_set():
+                del self._queries[cname]
+
+    def is_dirty(self, cname: str) -> bool:
+        """!
+        @brief 判断指令是否需要重新发送
+        @details 指令从未成功执行过，或其引用的参数自上次成功执行后被set_param设置为不同的值时为脏；
+        指令序列中任一指令为脏则序列为脏。文件参数只比较文件路径，不检查文件内容。
+        未开启dirty_tracking时总是为脏
+        @param cname: 指令名称
+        @return True/False
+        """
+        if not self.dirty_tracking:
+            return True
+        if self.is_command_sequence(cname):
+            return any(self.is_dirty(member) for member in self.sequence[cname])
+        acked = self._acked.get(cname, None)
+        if acked is None:
+            return True
+        return acked != self.input_versions(cname)
+
+    def input_versions(self, cname: str) -> tuple:
+        """!
+        @brief 指令引用的各输入参数当前的version
+        @param cname: 指令名称
+        @return version元组，参数被设置为不同的值后随之变化
+        """
+        return tuple([record.version for record in self.get_plan(cname, "send").records])
+
+    def sync(self, window: int = 8) -> None:
+        """!
+        @brief 发送所有输入参数发生变化的指令
+        @details 只考虑引用了被set_param修改过的参数的指令，从未执行过且参数未被修改的指令不会被发送；
+        执行失败的指令保持为脏，下次sync时重新发送。需开启dirty_tracking
+        @param window: 最大在途指令数，同execute_many
         @return None
         """
+        if not self.dirty_tracking:
+            raise RuntimeError(f'{self.__class__.__name__}.sync requires dirty_tracking to be enabled')
+        commands = {}
+        for parm_name in tuple(self._dirty_params):
+            for cname in self.commands_of_param(parm_name):
+                if cname not in commands and self.is_dirty(cname):
+                    commands[cname] = None
+        try:
+            self.execute_many(commands, window=window)
+        finally:
+            self._dirty_params = {
+                parm_name for parm_name in self._dirty_params
+                if any(self.is_dirty(cname) for cname in self.commands_of_param(parm_name))
+            }
+
+    def encode_request(self, cname: str, array=None) -> Tuple[list, int, bytes, int]:
+        """!
+        @brief 编码一条待执行的指令
+        @details 供不经过self.kit.itf_cs收发的调用方(如AsyncNSUSoc)复用指令的编解码
+        @param cname: 指令名称
+        @param array: 传入要发送的数组
+        @return (send缓冲区列表, send总长度, 格式化好的recv指令, 反馈长度)
+        """
         if cname not in self.command:
             raise ValueError(
                 f'Unsupported command {cname}. The current list of available commands includes: {self.command.keys()}')
+        if self.check_recv_head and len(self.command[cname]["recv"]) < 5:
+            raise RuntimeError(f"The {cname} recv register is not define, or recv register<5.")
+        send_cmd, total_len = self.fmt_command_parts(command_name=cname, command_type="send", arrays=array)
+        recv_cmd = self.fmt_command(command_name=cname, command_type="recv")
+        return send_cmd, total_len, recv_cmd, self.__recv_length(cname, recv_cmd)
+
+    def decode_reply(self, cname: str, recv_cmd: bytes, recv: bytes) -> None:
+        """!
+        @brief 解码一条指令的反馈
+        @details 按check_recv_head检查反馈包头，并将反馈中的参数写入内存
+        @param cname: 指令名称
+        @param recv_cmd: encode_request返回的recv指令
+        @param recv: 接收到的反馈数据
+        @return None
+        """
         if self.check_recv_head:
-            return self.send_and_check(cname, array=array)
+            self.check_recv(recv_cmd, recv, cname)
+        self.enable_param(cname, recv)
+
+    def execute_many(self, commands: Iterable[Union[str, Tuple[str, Any]]], window: int = 8) -> None:
+        """!
+        @brief 流水线方式执行多条指令
+        @details 为每条指令的序号字段(8~11字节)写入唯一的序号，保持最多window条指令在途，
+        按指令ID与序号匹配反馈；反馈序号为0的设备按同ID指令的发送顺序匹配。
+        指令接口不支持流水线(pipelined为False)、window<=1，或指令没有反馈包头时，退化为逐条执行。
+        流水线期间持有指令接口的transaction_lock，其中的查询指令直接发送，不与其他调用方合并
+        @param commands: 指令名，或(指令名, 数组)的列表
+        @param window: 最大在途指令数
+        @return None，任一指令失败时在收完所有在途反馈后抛出第一个错误；
+        发送或接收本身出错时同样先收完在途反馈，收不完时丢弃链路上的残留数据后再抛出
+        """
+        items = [(command, None) if isinstance(command, str) else tuple(command) for command in commands]
+        for cname, _ in items:
+            if cname not in self.command and not self.is_command_sequence(cname):
+                raise ValueError(f'Unsupported command {cname}. '
+                                 f'The current list of available commands includes: {self.command.keys()}')
+        itf = self.kit.itf_cs
+        if not itf.pipelined or window <= 1:
+            for cname, array in items:
+                self.execute(cname, array=array)
+            return
+        with itf.transaction_lock:
+            pending = OrderedDict()
+            error = None
+            try:
+                for cname, array in items:
+                    if self.is_command_sequence(cname):
+                        while pending:
+                            error = self.__recv_pipelined(pending, error)
+                        self.execute_sequence(cname, array=array)
+                        continue
+                    recv_cmd = self.fmt_command(command_name=cname, command_type="recv")
+                    recv_length = self.__recv_length(cname, recv_cmd)
+                    send_cmd, total_len = self.fmt_command_parts(command_name=cname, command_type="send", arrays=array)
+                    if recv_length < 16 or len(recv_cmd) < 16 or len(send_cmd[0]) < 16:
+                        # 没有反馈包头的指令无法匹配，等在途指令完成后逐条执行
+                        while pending:
+                            error = self.__recv_pipelined(pending, error)
+                        self.__exchange(cname, array=array)
+                        continue
+                    seq = self.__next_seq()
+                    send_cmd[0] = head = bytearray(send_cmd[0])
+                    struct.pack_into(self.fmt_mode + 'I', head, 8, seq)
+                    send_len = itf.send_buffers(send_cmd)
+                    itf.send_down()
+                    if total_len != send_len:
+                        raise RuntimeError(f"{cname} total_len is {total_len}, but just send {send_len}!")
+                    pending[(bytes(recv_cmd[4:8]), seq)] = (cname, recv_cmd, recv_length)
+                    if len(pending) >= window:
+                        error = self.__recv_pipelined(pending, error)
+                while pending:
+                    error = self.__recv_pipelined(pending, error)
+            except BaseException:
+                # 发送不完整、超时或收到无法匹配的反馈时，先处理在途指令的反馈，避免残留在链路上
+                self.__drain_pipelined(pending)
+                raise
+        if error is not None:
+            raise error
+
+    def sweep(self, cname: str, params: dict, window: int = 8) -> "np.ndarray":
+        """!
+        @brief 参数扫描
+        @details 按指令的预编译格式一次性生成所有扫描点的指令帧：先以当前参数值打包一帧作为模板，
+        再将各扫描参数的数组按字段偏移整列写入。指令接口支持流水线且指令带反馈包头时，
+        保持最多window帧在途连续发送，否则逐帧收发。扫描结束后扫描参数保持为最后一个点的值
+        @param cname: 指令名称，不支持含文件、数组等变长字段的指令
+        @param params: 参数名 -> 各扫描点的参数值(一维数组或标量)
+        @param window: 最大在途指令数
+        @return 各扫描点的反馈，结构化数组，字段名为recv中的参数名
+        """
+        if cname not in self.command:
+            raise ValueError(f'Unsupported command {cname}. '
+                             f'The current list of available commands includes: {self.command.keys()}')
+        names = list(params)
+        columns = np.broadcast_arrays(*[np.asarray(params[name]) for name in names])
+        if not columns or columns[0].ndim != 1:
+            raise ValueError('sweep parameters should be one-dimensional arrays of the same length')
+        points = len(columns[0])
+        # 以当前参数值打包模板帧，并定位各扫描参数在帧中的偏移
+        itf = self.kit.itf_cs
+        with itf.transaction_lock:
+            parts, size = self.fmt_command_parts(cname, "send")
+            template = b''.join(parts)
+        plan = self.get_plan(cname, "send")
+        if any(segment.__class__ is not PackBlock for segment in plan.segments):
+            raise ValueError(f'{cname} has variable-length fields and can not be swept')
+        offsets, base = {}, 0
+        for block in plan.segments:
+            for slot in block.slots:
+                if slot.kind == SLOT_VALUE:
+                    offsets.setdefault(slot.name, []).append((base + slot.offset, slot))
+            base += block.layout.size
+        for name in names:
+            if name not in offsets:
+                raise ValueError(f'{name} is not a parameter of {cname}')
+        frames = np.empty((points, size), dtype=np.uint8)
+        frames[:] = np.frombuffer(template, dtype=np.uint8)
+        for name, column in zip(names, columns):
+            for offset, slot in offsets[name]:
+                dtype = np.dtype(self.fmt_mode + slot.code)
+                values = self.__sweep_check(slot, self.__sweep_values(slot, column, dtype), dtype)
+                frames[:, offset:offset + dtype.itemsize] = values.astype(dtype).view(np.uint8).reshape(points, -1)
+
+        with itf.transaction_lock:
+            recv_cmd = self.fmt_command(command_name=cname, command_type="recv")
+            recv_length = self.__recv_length(cname, recv_cmd)
+            reply = self.get_reply_layout(cname)
+            replies = np.zeros((points, recv_length), dtype=np.uint8)
+            pipelined = itf.pipelined and window > 1 and self.check_recv_head and size >= 16 and recv_length >= 16
+            if pipelined:
+                seqs = np.array([self.__next_seq() for _ in range(points)], dtype=self.fmt_mode + 'u4')
+                frames[:, 8:12] = seqs.view(np.uint8).reshape(points, 4)
+                step = max(window // 2, 1)
+                chunks = [(start, min(start + step, points)) for start in range(0, points, step)]
+                for index, (start, stop) in enumerate(chunks):
+                    self.__sweep_send(cname, frames[start:stop])
+                    if index >= 1:
+                        self.__sweep_recv(replies, *chunks[index - 1])
+                if chunks:
+                    self.__sweep_recv(replies, *chunks[-1])
+            else:
+                for point in range(points):
+                    self.__sweep_send(cname, frames[point:point + 1])
+                    self.__sweep_recv(replies, point, point + 1)
+        if self.check_recv_head and points:
+            expect = np.frombuffer(recv_cmd[:16], dtype=np.uint8)
+            bad = (replies[:, 0:8] != expect[0:8]).any(axis=1)
+            if pipelined:
+                bad |= (replies[:, 8:12] != frames[:, 8:12]).any(axis=1) & (replies[:, 8:12] != 0).any(axis=1)
+            else:
+                bad |= (replies[:, 8:12] != expect[8:12]).any(axis=1)
+            if bad.any():
+                point = int(np.argmax(bad))
+                raise RuntimeError(f'The {cname} Recv head of point {point} should be {expect[0:12].tobytes().hex()}, '
+                                   f'recv is {replies[point, 0:12].tobytes().hex()}')
+
+        for name, column in zip(names, columns):
+            if points:
+                self.set_param(name, column[-1].item())
+        if points:
+            self.enable_param(cname, replies[-1].tobytes())
+        fields, formats, field_offsets, offset = [], [], [], 0
+        for code, name in zip(reply.codes, reply.names):
+            if name is not None and name not in fields:
+                fields.append(name)
+                formats.append(self.fmt_mode + code)
+                field_offsets.append(offset)
+            offset += struct.calcsize(self.fmt_mode + code)
+        dtype = np.dtype({'names': fields, 'formats': formats, 'offsets': field_offsets,
+                          'itemsize': max(recv_length, offset)})
+        if not recv_length:
+            return np.zeros(points, dtype=dtype)
+        return replies.view(dtype).reshape(points)
+
+    def __sweep_values(self, slot: PackSlot, column: "np.ndarray", dtype: "np.dtype") -> "np.ndarray":
+        """!
+        @brief 计算扫描参数各点的打包值
+        @details 参数带计算表达式时先尝试整列计算，表达式不支持数组运算时逐点计算
+        """
+        if slot.expr is None:
+            return column
+        try:
+            values = np.asarray(slot.expr(column))
+            if values.shape == column.shape:
+                return values
+        except Exception:
+            pass
+        return np.array([self.__fmt_value(slot, value, slot.expr) for value in column.tolist()], dtype=object)
+
+    def __sweep_check(self, slot: PackSlot, values: "np.ndarray", dtype: "np.dtype") -> "np.ndarray":
+        """!
+        @brief 检查扫描参数各点的打包值是否在字段类型的范围内
+        @details 整数字段的非整数值按逐点执行时的方式(__fmt_value)转换，保证与execute发送的字节一致；
+        超出字段类型范围的值与逐点执行一样报错，不做截断或回绕
+        @return 可直接astype(dtype)的数组
+        """
+        values = np.asarray(values)
+        if dtype.kind in 'iu':
+            if values.dtype.kind not in 'biu':
+                values = np.array([self.__fmt_value(slot, value) for value in values.tolist()], dtype=object)
+            info = np.iinfo(dtype)
+            bad = (values < info.min) | (values > info.max)
         else:
-            return self.send_and_not_check(cname, array=array)
+            values = values.astype(np.float64)
+            bad = np.isfinite(values) & (np.abs(values) > np.finfo(dtype).max)
+        bad = np.asarray(bad, dtype=bool)
+        if bad.any():
+            point = int(np.argmax(bad))
+            raise ValueError(f'The value {values[point]} of {slot.name} at point {point} '
+                             f'is out of range for {dtype.name}')
+        return values
+
+    def __sweep_send(self, cname: str, frames: "np.ndarray") -> None:
+        itf = self.kit.itf_cs
+        send_len = itf.send_buffers([memoryview(frames).cast('B')])
+        itf.send_down()
+        if frames.nbytes != send_len:
+            raise RuntimeError(f"{cname} total_len is {frames.nbytes}, but just send {send_len}!")
+
+    def __sweep_recv(self, replies: "np.ndarray", start: int, stop: int) -> None:
+        itf = self.kit.itf_cs
+        view = replies[start:stop].reshape(-1)
+        data = itf.recv_bytes(view.size)
+        itf.recv_down()
+        view[:len(data)] = np.frombuffer(data, dtype=np.uint8)
+
+    def execute_sequence(self, name: str, array=None) -> None:
+        """!
+        @brief 以一次交互执行一个指令序列
+        @details 序列中所有指令先全部编码并写入各自的序号，再一次性连续发送，之后一次接收全部反馈并依次解析。
+        指令接口不支持流水线(pipelined为False)时逐条执行
+        @param name: sequence组中的指令序列名
+        @param array: 传入要随各指令发送的数组
+        @return None，任一指令失败时在解析完所有反馈后抛出第一个错误
+        """
+        members = self.sequence[name]
+        itf = self.kit.itf_cs
+        if not itf.pipelined:
+            for cname in members:
+                self.execute(cname, array=array)
+            return
+        with itf.transaction_lock:
+            send_cmd, total_len, requests = self.encode_sequence(name, array)
+            send_len = itf.send_buffers(send_cmd)
+            itf.send_down()
+            if total_len != send_len:
+                raise RuntimeError(f"{name} total_len is {total_len}, but just send {send_len}!")
+            recv = itf.recv_bytes(sum(request[2] for request in requests))
+            itf.recv_down()
+            self.decode_sequence(requests, recv)
+
+    def encode_sequence(self, name: str, array=None) -> Tuple[list, int, list]:
+        """!
+        @brief 编码一个指令序列
+        @details 逐条编码序列中的指令并写入各自的序号，供execute_sequence与AsyncNSUSoc复用
+        @param name: sequence组中的指令序列名
+        @param array: 传入要随各指令发送的数组
+        @return (send缓冲区列表, send总长度, [(指令名, recv指令, 反馈长度)])
+        """
+        send_cmd, total_len, requests = [], 0, []
+        for cname in self.sequence[name]:
+            parts, length, recv_cmd, recv_length = self.encode_request(cname, array)
+            if len(parts[0]) >= 12:
+                seq = self.__next_seq()
+                parts[0] = head = bytearray(parts[0])
+                struct.pack_into(self.fmt_mode + 'I', head, 8, seq)
+            send_cmd.extend(parts)
+            total_len += length
+            requests.append((cname, recv_cmd, recv_length))
+        return send_cmd, total_len, requests
+
+    def decode_sequence(self, requests: list, recv: bytes) -> None:
+        """!
+        @brief 依次解码一个指令序列的全部反馈
+        @param requests: encode_sequence返回的请求列表
+        @param recv: 接收到的全部反馈
+        @return None，任一指令失败时在解析完所有反馈后抛出第一个错误
+        """
+        error, offset = None, 0
+        for cname, recv_cmd, recv_length in requests:
+            reply = recv[offset:offset + recv_length]
+            offset += recv_length
+            try:
+                self.decode_reply(cname, recv_cmd[:8] + reply[8:12] + recv_cmd[12:], reply)
+            except Exception as e:
+                logging.error(msg=f'{e}')
+                error = error or e
+        if error is not None:
+            raise error
+
+    def __next_seq(self) -> int:
+        with self._seq_lock:
+            self._seq = (self._seq % 0xFFFFFFFF) + 1
+            return self._seq
+
+    def __recv_pipelined(self, pending: OrderedDict, error: Optional[Exception]) -> Optional[Exception]:
+        """!
+        @brief 接收一条流水线指令的反馈
+        @param pending: 在途指令，(指令ID, 序号) -> (指令名, recv指令, 反馈长度)
+        @param error: 已发生的错误
+        @return 已发生的第一个错误
+        """
+        itf = self.kit.itf_cs
+        head = itf.recv_bytes(16)
+        key = (bytes(head[4:8]), struct.unpack(self.fmt_mode + 'I', head[8:12])[0])
+        if key not in pending and key[1] == 0:
+            # 不回填序号的设备按同ID指令的发送顺序匹配
+            key = next((_key for _key in pending if _key[0] == key[0]), None)
+        if key not in pending:
+            length = struct.unpack("=I", head[12:16])[0]
+            if 16 < length <= max(request[2] for request in pending.values()):
+                # 收完这条反馈，保持后续反馈的边界
+                itf.recv_bytes(length - 16)
+            itf.recv_down()
+            raise RuntimeError(f"Unexpected feedback {head.hex()}, {len(pending)} commands still pending")
+        cname, recv_cmd, recv_length = pending.pop(key)
+        recv = head + itf.recv_bytes(recv_length - 16)
+        itf.recv_down()
+        try:
+            if self.check_recv_head:
+                self.check_recv(recv_cmd[:8] + recv[8:12], recv, cname)
+            self.enable_param(cname, recv)
+        except Exception as e:
+            logging.error(msg=f'{e}')
+            return error or e
+        return error
+
+    def __drain_pipelined(self, pending: OrderedDict) -> None:
+        """!
+        @brief 出错后接收剩余在途指令的反馈
+        @details 接收失败时调用指令接口的_discard_reply(若有)丢弃链路上的残留数据
+        @param pending: 在途指令，同__recv_pipelined
+        @return None
+        """
+        try:
+            while pending:
+                self.__recv_pipelined(pending, None)
+        except Exception as e:
+            logging.error(msg=f'{e}')
+            pending.clear()
+            discard = getattr(self.kit.itf_cs, '_discard_reply', None)
+            if discard is not None:
+                discard()
+
+    def __recv_length(self, cname, recv_cmd: bytes) -> int:
+        """!
+        @brief 计算指令反馈的长度
+        @param cname: 指令名称
+        @param recv_cmd: 格式化好的recv指令
+        @return 反馈长度
+        """
+        if self.check_recv_head:
+            return struct.unpack("=I", recv_cmd[12:16])[0]
+        return self.get_reply_layout(cname).size
 
     def execute_from_pname(self, parm_name: str):
         """!
@@ -343,26 +1392,66 @@ class ICDRegMw(BaseRegMw):
         @param parm_name: 参数名/指令名
         @return 结果列表
         """
-        # 筛选所有要发送的指令名
-        command_list = []
+        self.execute_from_pnames((parm_name, ))
+
+    def execute_from_pnames(self, parm_names: Iterable[str], window: int = 8):
+        """!
+        @brief 查找多个参数涉及的指令并执行
+        @details 各参数涉及的指令去重后按首次出现的顺序执行，每条指令只执行一次
+        @param parm_names: 参数名/指令名列表
+        @param window: 最大在途指令数，同execute_many
+        @return None
+        """
+        commands = {}
+        for parm_name in parm_names:
+            for cname in self.commands_of_param(parm_name):
+                commands.setdefault(cname, None)
+        self.execute_many(commands, window=window)
+
+    def commands_of_param(self, parm_name: str) -> tuple:
+        """!
+        @brief 查找参数涉及的指令
+        @details 参数→指令的索引在首次查找时建立，重新加载icd后重建；
+        send列表中直接引用参数，或通过{{字段序列}}引用参数的指令均计入
+        @param parm_name: 参数名/指令名，为指令名时返回该指令本身
+        @return 指令名元组
+        """
         if parm_name in self.command:
-            command_list.append(parm_name)
-        else:
-            for command in self.command:
-                if parm_name in self.command[command]["send"]:
-                    command_list.append(command)
-        for cmd in command_list:
-            self.execute(cmd)
+            return parm_name,
+        index = self._param_index
+        if index is None:
+            index = self._param_index = self.__build_param_index()
+        return index.get(parm_name, ())
+
+    def __build_param_index(self) -> dict:
+        index = {}
+
+        def add_registers(cname, registers, expanding):
+            for register in registers:
+                if not isinstance(register, str):
+                    continue
+                if register.startswith('{{') and register.endswith('}}'):
+                    sub_name = register[2:-2]
+                    if sub_name in self.sequence and sub_name not in expanding \
+                            and not self.is_command_sequence(sub_name):
+                        add_registers(cname, self.sequence[sub_name], expanding | {sub_name})
+                    continue
+                commands = index.setdefault(register, [])
+                if not commands or commands[-1] != cname:
+                    commands.append(cname)
+
+        for cname, cmap in self.command.items():
+            add_registers(cname, cmap.get("send", ()), frozenset())
+        return {name: tuple(commands) for name, commands in index.items()}
 
     def send_and_check(self, cname, array=None):
         if len(self.command[cname]["recv"]) < 5:
             # 接收包头, id, 序号, 指令长度, 结果参数
             raise RuntimeError(f"The {cname} recv register is not define, or recv register<5.")
-        else:
-            send_cmd = self.fmt_command(command_name=cname, command_type="send", arrays=array)
+        with self.kit.itf_cs.transaction_lock:
+            send_cmd, total_len = self.fmt_command_parts(command_name=cname, command_type="send", arrays=array)
             recv_cmd = self.fmt_command(command_name=cname, command_type="recv")
-            total_len = len(send_cmd)
-            send_len = self.kit.itf_cs.send_bytes(send_cmd)
+            send_len = self.kit.itf_cs.send_buffers(send_cmd)
             self.kit.itf_cs.send_down()
             if total_len != send_len:
                 raise RuntimeError(f"{cname} total_len is {total_len}, but just send {send_len}!")
@@ -372,22 +1461,16 @@ class ICDRegMw(BaseRegMw):
             self.enable_param(cname, recv)
 
     def send_and_not_check(self, cname, array=None):
-        t_idx = self.FPack_TIdx
-        send_cmd = self.fmt_command(command_name=cname, command_type="send", arrays=array)
-        recv_length = 0
-        for index, fpack in enumerate(self.command[cname]["recv"]):
-            if isinstance(fpack, list):
-                recv_length += type_size[fpack[t_idx]]
-            elif isinstance(fpack, str):
-                recv_length += type_size[self.param[fpack][t_idx]]
-        total_len = len(send_cmd)
-        send_len = self.kit.itf_cs.send_bytes(send_cmd)
-        self.kit.itf_cs.send_down()
-        if total_len != send_len:
-            raise RuntimeError(f"{cname} total_len is {total_len}, but just send {send_len}!")
-        recv = self.kit.itf_cs.recv_bytes(recv_length)
-        self.kit.itf_cs.recv_down()
-        self.enable_param(cname, recv)
+        with self.kit.itf_cs.transaction_lock:
+            send_cmd, total_len = self.fmt_command_parts(command_name=cname, command_type="send", arrays=array)
+            recv_length = self.__recv_length(cname, b'')
+            send_len = self.kit.itf_cs.send_buffers(send_cmd)
+            self.kit.itf_cs.send_down()
+            if total_len != send_len:
+                raise RuntimeError(f"{cname} total_len is {total_len}, but just send {send_len}!")
+            recv = self.kit.itf_cs.recv_bytes(recv_length)
+            self.kit.itf_cs.recv_down()
+            self.enable_param(cname, recv)
 
     def enable_param(self, cname: str, recv: bytes):
         """!
@@ -396,16 +1479,30 @@ class ICDRegMw(BaseRegMw):
         @param recv: 接收到的反馈数据
         @return 无
         """
-        t_idx = self.FPack_TIdx
-        length = 0
-        for index, fpack in enumerate(self.command[cname]["recv"]):
-            if isinstance(fpack, list):
-                length += type_size[fpack[t_idx]]
-            elif isinstance(fpack, str):
-                data_size = type_size[self.param[fpack][t_idx]]
-                data_type = value_type[self.param[fpack][t_idx]]
-                self.set_param(fpack, struct.unpack(f"={data_type}", recv[length:length + data_size])[0])
-                length += data_size
+        reply = self.get_reply_layout(cname)
+        values = reply.layout.unpack_from(recv)
+        for index, record in reply.fields:
+            record.value = values[index]
+        if not self.dirty_tracking or self.__reply_status(cname) != 0:
+            return
+        # 反馈的结果参数为0视为指令执行成功，记录本次发送时的参数版本
+        plan = self._plans.get((cname, "send"), None)
+        if plan is not None:
+            self._acked[cname] = plan.versions
+
+    def __reply_status(self, cname: str):
+        """!
+        @brief 反馈中结果参数的值
+        @details 检查反馈包头时，recv的第5个字段(包头、ID、序号、长度之后)为结果参数，非0表示设备拒绝了指令；
+        不检查包头或没有结果参数时返回0
+        @param cname: 指令名
+        @return 结果参数的值
+        """
+        fields = self.command.get(cname, {}).get("recv", ())
+        if not self.check_recv_head or len(fields) < 5 or not isinstance(fields[4], str):
+            return 0
+        record = self.param.record(fields[4])
+        return 0 if record is None else record.value
 
     @staticmethod
     def check_recv(recv_cmd, recv, command):
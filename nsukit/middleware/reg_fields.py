@@ -0,0 +1,220 @@
+# Copyright (c) [2023] [NaiShu]
+# [NSUKit] is licensed under Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#          http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND,
+# EITHER EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT,
+# MERCHANTABILITY OR FIT FOR A PARTICULAR PURPOSE.
+# See the Mulan PSL v2 for more details.
+
+"""!
+@brief 寄存器位域的读写
+@file reg_fields.py
+"""
+
+import json
+import struct
+from typing import TYPE_CHECKING, Union, Dict, Iterable, List
+
+import numpy as np
+
+from .base import UMiddleware
+from ..tools.check_func import InvalidRegisterValueError
+
+if TYPE_CHECKING:
+    from .. import NSUSoc
+
+REG_ACCESS = ('rw', 'ro', 'wo')
+
+
+class RegField:
+    """!
+    @brief 寄存器中的一个位域
+    """
+    __slots__ = ('reg', 'name', 'lsb', 'width', 'mask')
+
+    def __init__(self, reg: "RegDef", name: str, bits: Union[str, int]):
+        msb, _, lsb = str(bits).partition(':')
+        msb, lsb = int(msb), int(lsb or msb)
+        if not 0 <= lsb <= msb < 32:
+            raise ValueError(f'Invalid bits {bits} of field {reg.name}.{name}')
+        self.reg = reg
+        self.name = name
+        self.lsb = lsb
+        self.width = msb - lsb + 1
+        self.mask = ((1 << self.width) - 1) << lsb
+
+    def encode(self, value: int) -> int:
+        if not 0 <= value < 1 << self.width:
+            raise InvalidRegisterValueError(
+                f'The value of {self.reg.name}.{self.name} must fit in {self.width} bits, not {value=}.')
+        return value << self.lsb
+
+    def decode(self, value: Union[int, np.ndarray]) -> Union[int, np.ndarray]:
+        return (value & self.mask) >> self.lsb
+
+
+class RegDef:
+    """!
+    @brief 寄存器表中的一个寄存器
+    """
+    __slots__ = ('name', 'addr', 'access', 'reset', 'fields', 'mask')
+
+    def __init__(self, name: str, desc: dict):
+        self.name = name
+        self.addr = int(desc['addr'], 0) if isinstance(desc['addr'], str) else int(desc['addr'])
+        self.access = desc.get('access', 'rw')
+        if self.access not in REG_ACCESS:
+            raise ValueError(f'Invalid access {self.access} of register {name}, should be one of {REG_ACCESS}')
+        reset = desc.get('reset', 0)
+        self.reset = int(reset, 0) if isinstance(reset, str) else int(reset)
+        self.fields: Dict[str, RegField] = {}
+        self.mask = 0
+        for field_name, bits in desc.get('fields', {}).items():
+            field = RegField(self, field_name, bits['bits'] if isinstance(bits, dict) else bits)
+            if self.mask & field.mask:
+                raise ValueError(f'Field {name}.{field_name} overlaps other fields')
+            self.mask |= field.mask
+            self.fields[field_name] = field
+
+
+class RegFieldMw(UMiddleware):
+    """!
+    @brief 按寄存器表读写寄存器位域
+    @details
+    1. 寄存器表与[RegShadow](#nsukit.tools.reg_shadow.RegShadow)共用一个JSON文件，位域描述在registers中，
+    bits为"高位:低位"或单个位号，access为rw/ro/wo，reset为寄存器复位值
+    @code
+    {
+        "registers": {
+            "ctrl": {"addr": "0x100", "access": "rw", "fields": {"enable": "0", "mode": "3:1"}},
+            "status": {"addr": "0x104", "access": "ro", "fields": {"locked": "0", "temp": "27:16"}}
+        }
+    }
+    @endcode
+    2. 位域以"寄存器名.位域名"指定，update按寄存器分组，以一次读取取回需要合并的寄存器，
+    在内存中合并后每个寄存器只写一次
+    3. 更新覆盖了寄存器的全部32位时不读取；wo寄存器不可回读，以影子缓存中的值或复位值为合并基准
+    4. 一次update的读取与写入期间持有指令接口的transaction_lock，其他线程的读写不会插入其间
+    """
+
+    def __init__(self, kit: "NSUSoc"):
+        super(RegFieldMw, self).__init__(kit)
+        self.registers: Dict[str, RegDef] = {}
+
+    def load(self, reg_map: Union[str, dict]) -> None:
+        """!
+        加载寄存器表
+        @details 由[NSUSoc.load_reg_map](#nsukit.base_kit.NSUSoc.load_reg_map)调用，link_cmd时按link_param.reg_map_path加载
+        @param reg_map: 寄存器表文件路径，或已解析的寄存器表
+        @return:
+        """
+        if isinstance(reg_map, str):
+            with open(reg_map, 'r', encoding='utf-8') as fp:
+                reg_map = json.load(fp)
+        self.registers = {name: RegDef(name, desc) for name, desc in reg_map.get('registers', {}).items()}
+
+    def field(self, name: str) -> RegField:
+        """!
+        按"寄存器名.位域名"查找位域
+        """
+        reg_name, _, field_name = name.partition('.')
+        try:
+            return self.registers[reg_name].fields[field_name]
+        except KeyError:
+            raise KeyError(f'Unknown register field {name}') from None
+
+    def update(self, values: Dict[str, int]) -> None:
+        """!
+        @brief 批量更新位域
+        @details 未涉及的位保持原值
+        @param values: "寄存器名.位域名"->值
+        @return:
+
+        ---
+        @code
+        >>> kit: NSUSoc
+        >>> kit.fields.update({'ctrl.enable': 1, 'ctrl.mode': 5, 'gain.dac0': 0x20})
+        @endcode
+        """
+        pending: Dict[str, List[int]] = {}      # 寄存器名 -> [更新的位, 更新的值]
+        for name, value in values.items():
+            field = self.field(name)
+            if field.reg.access == 'ro':
+                raise InvalidRegisterValueError(f'Register {field.reg.name} is read-only')
+            merged = pending.setdefault(field.reg.name, [0, 0])
+            merged[0] |= field.mask
+            merged[1] = merged[1] & ~field.mask | field.encode(int(value))
+        regs = [self.registers[_n] for _n in pending]
+        with self.kit.itf_cr.transaction_lock:
+            base = self._base_values([_r for _r in regs if pending[_r.name][0] != 0xFFFFFFFF])
+            addr, data = [], []
+            for reg in regs:
+                mask, value = pending[reg.name]
+                addr.append(reg.addr)
+                data.append(struct.pack('=I', base.get(reg.name, 0) & ~mask | value))
+            if addr:
+                self.kit.write(addr, data)
+
+    def _base_values(self, regs: List[RegDef]) -> Dict[str, int]:
+        """!
+        获取读-改-写合并所需的寄存器当前值，rw寄存器以一次读取取回
+        """
+        base = {}
+        readable = []
+        shadow = self.kit.reg_shadow
+        for reg in regs:
+            if reg.access == 'rw':
+                readable.append(reg)
+                continue
+            cached = None if shadow is None else shadow.get(reg.addr)
+            base[reg.name] = reg.reset if cached is None else struct.unpack('=I', cached)[0]
+        if readable:
+            for reg, value in zip(readable, self.kit.read([_r.addr for _r in readable])):
+                base[reg.name] = struct.unpack('=I', value)[0]
+        return base
+
+    def read(self, names: Iterable[str]) -> Dict[str, int]:
+        """!
+        @brief 读取位域
+        @details 涉及的寄存器以一次读取取回
+        @param names: "寄存器名.位域名"，或寄存器名(读取其全部位域)
+        @return: "寄存器名.位域名"->值
+        """
+        fields: List[RegField] = []
+        for name in names:
+            if '.' in name:
+                fields.append(self.field(name))
+            else:
+                fields.extend(self.registers[name].fields.values())
+        addr = list(dict.fromkeys(_f.reg.addr for _f in fields))
+        values = dict(zip(addr, (struct.unpack('=I', _v)[0] for _v in self.kit.read(addr))))
+        return {f'{_f.reg.name}.{_f.name}': _f.decode(values[_f.reg.addr]) for _f in fields}
+
+    def decode(self, reg_name: str, values: Union[int, Iterable[int], np.ndarray]) -> Dict[str, Union[int, np.ndarray]]:
+        """!
+        @brief 将寄存器值解码为各位域的值
+        @details 传入数组时对整个数组向量化解码，可用于解析轮询得到的状态寄存器序列
+        @param reg_name: 寄存器名
+        @param values: 寄存器值，整数或uint32数组
+        @return: 位域名->值，传入数组时值为同形状的数组
+        """
+        reg = self.registers[reg_name]
+        if not isinstance(values, int):
+            values = np.asarray(values, dtype=np.uint32)
+        return {name: field.decode(values) for name, field in reg.fields.items()}
+
+    def encode(self, reg_name: str, values: Dict[str, int]) -> int:
+        """!
+        @brief 由各位域的值组成寄存器值，未给出的位取复位值
+        @param reg_name: 寄存器名
+        @param values: 位域名->值
+        @return: 寄存器值
+        """
+        reg = self.registers[reg_name]
+        value = reg.reset
+        for name, field_value in values.items():
+            field = reg.fields[name]
+            value = value & ~field.mask | field.encode(int(field_value))
+        return value
@@ -0,0 +1,199 @@
+# Copyright (c) [2023] [NaiShu]
+# [NSUKit] is licensed under Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#          http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND,
+# EITHER EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT,
+# MERCHANTABILITY OR FIT FOR A PARTICULAR PURPOSE.
+# See the Mulan PSL v2 for more details.
+
+"""!
+@brief 后台遥测轮询
+@file telemetry.py
+"""
+
+import time
+import threading
+from typing import TYPE_CHECKING, Union, Dict, Iterable, Optional, Tuple, List
+
+import numpy as np
+
+from .base import UMiddleware
+from ..tools.logging import logging
+
+if TYPE_CHECKING:
+    from .. import NSUSoc
+
+
+class TelemetryMw(UMiddleware):
+    """!
+    @brief 在后台线程中按固定频率采集寄存器与ICD查询结果
+    @details
+    1. 寄存器信号以地址或"寄存器名.位域名"(见[RegFieldMw](#nsukit.middleware.reg_fields.RegFieldMw))指定，
+    每次采样以一次read_array读回全部寄存器；也可指定一条ICD查询指令，执行后记录其中的参数
+    2. 每个信号一个预分配的numpy环形缓冲区，与时间戳共用写位置，满后覆盖最旧的样本；
+    缓冲区比depth多一个槽位，正在写入的槽位不在最近depth个样本之内
+    3. 采样线程是唯一的写者，样本写完后才更新计数；snapshot不加锁，复制期间被覆盖的样本会被丢弃
+    4. 采样直接经指令接口读寄存器、经ICD中间件执行查询，不经过NSUSoc的写批次与寄存器影子，
+    不会提前下发调用者在with kit.batch()中收集的写入；寄存器读取与查询各自持有对应指令接口的transaction_lock
+
+    ---
+    示例代码如下
+    @code
+    >>> kit: NSUSoc
+    >>> kit.telemetry.configure({'temp': 0x104, 'locked': 'status.locked'}, rate=10)
+    >>> kit.telemetry.start()
+    >>> times, values = kit.telemetry.snapshot()
+    >>> values['temp'][-1]
+    >>> kit.telemetry.stop()
+    @endcode
+    """
+
+    def __init__(self, kit: "NSUSoc"):
+        super(TelemetryMw, self).__init__(kit)
+        self.rate = 1.
+        self.depth = 0
+        self.query: Optional[str] = None
+        self.params: Tuple[str, ...] = ()
+        self.times = np.zeros(0, dtype=np.float64)
+        self.signals: Dict[str, np.ndarray] = {}
+        self.errors = 0
+        self._count = 0
+        self._addr = np.zeros(0, dtype=np.uint32)
+        self._decoders: List[Tuple[str, int, int, int]] = []     # (信号名, 寄存器序号, 掩码, 低位)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def count(self) -> int:
+        """!
+        累计采样次数
+        """
+        return self._count
+
+    def configure(self, signals: Optional[Dict[str, Union[int, str]]] = None, rate: float = 1., depth: int = 4096,
+                  query: Optional[str] = None, params: Iterable[str] = ()) -> None:
+        """!
+        @brief 配置遥测信号
+        @details 重新配置会清空已有的样本，运行中不可配置
+        @param signals: 信号名->寄存器地址或"寄存器名.位域名"
+        @param rate: 采样频率，单位Hz
+        @param depth: 每个信号保存的样本数
+        @param query: 每次采样时执行的ICD查询指令名
+        @param params: 查询指令执行后记录的参数名，信号名与参数名相同
+        @return:
+        """
+        if self.running:
+            raise RuntimeError(f'{self.__class__.__name__}: stop telemetry before reconfiguring')
+        if rate <= 0 or depth <= 0:
+            raise ValueError(f'rate and depth must be positive, not {rate=}, {depth=}')
+        signals = {} if signals is None else signals
+        addr: Dict[int, int] = {}
+        decoders = []
+        for name, source in signals.items():
+            if isinstance(source, str):
+                field = self.kit.fields.field(source)
+                reg_addr, mask, lsb = field.reg.addr, field.mask, field.lsb
+            else:
+                reg_addr, mask, lsb = int(source), 0xFFFFFFFF, 0
+            decoders.append((name, addr.setdefault(reg_addr, len(addr)), mask, lsb))
+        self.rate = float(rate)
+        self.depth = int(depth)
+        self.query = query
+        self.params = tuple(params)
+        self._addr = np.fromiter(addr, dtype=np.uint32, count=len(addr))
+        self._decoders = decoders
+        slots = self.depth + 1
+        self.times = np.zeros(slots, dtype=np.float64)
+        self.signals = {name: np.zeros(slots, dtype=np.uint32) for name, *_ in decoders}
+        self.signals.update({name: np.zeros(slots, dtype=np.float64) for name in self.params})
+        self.errors = 0
+        self._count = 0
+
+    def sample(self) -> None:
+        """!
+        @brief 立即采样一次
+        @details 采样线程按频率调用，也可在未启动时手动调用
+        """
+        if not self.signals:
+            return
+        raw = None
+        if len(self._addr):
+            itf = self.kit.itf_cr
+            with itf.transaction_lock:
+                raw = itf.read_array(self._addr)
+        params = []
+        if self.query is not None:
+            self.kit.mw_cmd.execute(self.query)
+            params = [self.kit.mw_cmd.get_param(name) for name in self.params]
+        count = self._count
+        slot = count % len(self.times)
+        self.times[slot] = time.time()
+        for name, index, mask, lsb in self._decoders:
+            self.signals[name][slot] = (int(raw[index]) & mask) >> lsb
+        for name, value in zip(self.params, params):
+            self.signals[name][slot] = value
+        self._count = count + 1
+
+    def start(self) -> None:
+        """!
+        @brief 启动后台采样线程
+        """
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f'{self.__class__.__name__}', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """!
+        @brief 停止后台采样线程
+        @param timeout: 等待线程退出的时间，为None时一直等待
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        period = 1. / self.rate
+        deadline = time.monotonic()
+        while not self._stop.wait(max(deadline - time.monotonic(), 0.)):
+            try:
+                self.sample()
+            except Exception as e:
+                self.errors += 1
+                logging.error(msg=f'{self.__class__.__name__}: {e}')
+            deadline += period
+            now = time.monotonic()
+            if deadline < now:
+                # 采样耗时超过周期时跳过错过的时刻，不连续补采
+                deadline = now
+
+    def snapshot(self, last: Optional[int] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """!
+        @brief 获取最近的样本
+        @details 不加锁，返回的是副本，按时间顺序排列
+        @param last: 最多返回的样本数，为None时返回缓冲区中的全部样本
+        @return: (时间戳数组, 信号名->样本数组)
+        """
+        count = self._count
+        n = min(count, self.depth) if last is None else max(min(last, count, self.depth), 0)
+        index = np.arange(count - n, count) % max(len(self.times), 1)
+        times = self.times[index]
+        values = {name: ring[index] for name, ring in self.signals.items()}
+        # 复制期间采样线程写入的样本可能覆盖了最旧的几个样本
+        drop = max(self._count - self.depth - (count - n), 0)
+        return times[drop:], {name: value[drop:] for name, value in values.items()}
+
+    def latest(self) -> Dict[str, Union[int, float]]:
+        """!
+        @brief 最近一次样本中各信号的值
+        """
+        times, values = self.snapshot(1)
+        return {name: value[-1].item() for name, value in values.items() if len(value)}
@@ -15,7 +15,10 @@
 
 import collections.abc as abc
 import struct
-from typing import Union, Iterable
+from array import array
+from typing import Union, Iterable, Optional, Tuple, Any
+
+import numpy as np
 
 
 def head_check(send_cmd: bytes, recv_cmd: bytes):
@@ -42,9 +45,59 @@ class InvalidRegisterValueError(ValueError):
     ...
 
 
+def _addr_bounds(addr: Any) -> Optional[Tuple[int, int]]:
+    """!
+    向量化获取一组寄存器地址的最小、最大值
+    @param addr: range、整数numpy数组或整数格式的连续缓冲区(memoryview、array.array)
+    @return (最小值, 最大值)，地址为空时返回(0, 0)，不支持向量化检查的类型返回None
+    """
+    if isinstance(addr, range):
+        if not len(addr):
+            return 0, 0
+        return min(addr[0], addr[-1]), max(addr[0], addr[-1])
+    if isinstance(addr, (memoryview, array)):
+        addr = np.asarray(addr)
+    if not isinstance(addr, np.ndarray) or addr.dtype.kind == 'O':
+        return None
+    if addr.ndim != 1 or addr.dtype.kind not in 'iu':
+        raise InvalidRegisterValueError(f'addr must be a one-dimensional integer array, not {addr.dtype}{addr.shape}.')
+    if not addr.size:
+        return 0, 0
+    return int(addr.min()), int(addr.max())
+
+
+def _check_count(addr: Any, value: Any) -> None:
+    """!
+    检查地址与值的个数是否一致，不可取长度的迭代器不检查
+    """
+    if isinstance(addr, abc.Sized) and isinstance(value, abc.Sized) and len(addr) != len(value):
+        raise InvalidRegisterValueError(
+            f'The number of values must match the number of addr, not {len(value)} values for {len(addr)} addr.')
+
+
+def _check_values(value: Iterable[bytes]) -> None:
+    """!
+    向量化检查一组bytes值的长度
+    @details bytes列表整体转为numpy字节串数组，其项长度即最长值的长度；无法整体转为字节串数组的值逐个检查
+    """
+    try:
+        rows = np.asarray(value if isinstance(value, abc.Sized) else list(value))
+    except ValueError:
+        rows = None
+    if rows is None or rows.ndim != 1 or rows.dtype.kind != 'S':
+        for _v in value:
+            check_reg_schema(0, _v)
+    elif rows.size and rows.dtype.itemsize > 4:
+        raise InvalidRegisterValueError(
+            f'The length of the value must be less than or equal to 4, not {rows.dtype.itemsize}.')
+
+
 def check_reg_schema(addr: Union[int, Iterable[int]], value: Union[bytes, Iterable[bytes], None] = None) -> None:
     """!
     检查寄存器地址和值是否合法
+    @details 地址与值个数不一致时报错；地址为range、整数numpy数组或整数格式的连续缓冲区时只检查一次最小值，
+    此时bytes值列表整体转为numpy字节串数组，只检查一次最大长度；
+    值为numpy二维字节数组(每行为一个寄存器的值)时只检查一次行宽；其余可迭代对象逐个检查
     @param addr: 寄存器地址，或寄存器地址列表
     @param value: 寄存器地址或寄存器地址
     @return None
@@ -58,12 +111,80 @@ def check_reg_schema(addr: Union[int, Iterable[int]], value: Union[bytes, Iterab
     elif isinstance(addr, int) and value is None:
         if addr < 0:
             raise InvalidRegisterValueError(f'The value of addr should be greater than 0, not {addr=}.')
-    elif isinstance(addr, abc.Iterable) and value is None:
-        for _a in addr:
-            check_reg_schema(_a, value)
-    elif isinstance(addr, abc.Iterable) and isinstance(value, abc.Iterable):
-        for _a, _v in zip(addr, value):
-            check_reg_schema(_a, _v)
+    elif isinstance(addr, abc.Iterable) and isinstance(value, np.ndarray):
+        if value.ndim != 2 or value.dtype.itemsize != 1:
+            raise InvalidRegisterValueError(f'value must be a two-dimensional byte array, not {value.dtype}{value.shape}.')
+        if value.shape[1] > 4:
+            raise InvalidRegisterValueError(
+                f'The length of the value must be less than or equal to 4, not {value.shape[1]=}.')
+        _check_count(addr, value)
+        check_reg_schema(addr)
+    elif isinstance(addr, abc.Iterable) and (value is None or isinstance(value, abc.Iterable)):
+        if value is not None:
+            _check_count(addr, value)
+        bounds = _addr_bounds(addr)
+        if bounds is not None:
+            if bounds[0] < 0:
+                raise InvalidRegisterValueError(f'The value of addr should be greater than 0, not {bounds[0]}.')
+            if value is not None:
+                _check_values(value)
+        elif value is None:
+            for _a in addr:
+                check_reg_schema(_a, value)
+        else:
+            for _a, _v in zip(addr, value):
+                check_reg_schema(_a, _v)
     else:
         raise InvalidRegisterValueError(
             f'Unsupported combination of parameter types value[{type(value)}, {value}], addr[{type(addr)}, {addr}]')
+
+
+def check_reg_u32(addr: int, value: Optional[int] = None) -> None:
+    """!
+    检查以整数给出的寄存器地址和值是否合法
+    @param addr: 寄存器地址
+    @param value: 寄存器值，须在uint32范围内
+    @return None
+    """
+    if addr < 0:
+        raise InvalidRegisterValueError(f'The value of addr should be greater than 0, not {addr=}.')
+    if value is not None and not 0 <= value <= 0xFFFFFFFF:
+        raise InvalidRegisterValueError(f'The value must be within the uint32 range, not {value=}.')
+
+
+def check_reg_array(addr: Iterable[int], value: Optional[Iterable[int]] = None
+                    ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """!
+    检查以数组给出的寄存器地址和值是否合法，并转为uint32数组
+    @param addr: 寄存器地址数组
+    @param value: 寄存器值数组，长度须与地址一致
+    @return (地址数组, 值数组)，均为本机字节序的uint32数组
+    """
+    addr = np.asarray(addr)
+    if addr.ndim != 1:
+        raise InvalidRegisterValueError(f'addr must be one-dimensional, not {addr.shape=}.')
+    if addr.size and (addr.dtype.kind not in 'iu' or addr.min() < 0 or addr.max() > 0xFFFFFFFF):
+        raise InvalidRegisterValueError(f'Every addr must be an integer within the uint32 range.')
+    addr = addr.astype(np.uint32, copy=False)
+    if value is None:
+        return addr, None
+    value = np.asarray(value)
+    if value.shape != addr.shape:
+        raise InvalidRegisterValueError(f'The shape of value {value.shape} does not match addr {addr.shape}.')
+    if value.size and value.dtype != np.uint32 and (
+            value.dtype.kind not in 'iu' or value.min() < 0 or value.max() > 0xFFFFFFFF):
+        raise InvalidRegisterValueError(f'Every value must be an integer within the uint32 range.')
+    return addr, np.ascontiguousarray(value, dtype=np.uint32)
+
+
+def reg_rows_u32(value: np.ndarray) -> np.ndarray:
+    """!
+    将每行为一个寄存器值的二维字节数组转为uint32数组，不足4字节的行在高位补0
+    @param value: 已通过check_reg_schema检查的二维字节数组
+    @return uint32数组
+    """
+    if value.shape[1] == 4:
+        return np.ascontiguousarray(value).view(np.uint32).ravel()
+    rows = np.zeros((len(value), 4), dtype=np.uint8)
+    rows[:, :value.shape[1]] = value
+    return rows.view(np.uint32).ravel()
@@ -0,0 +1,207 @@
+# Copyright (c) [2023] [NaiShu]
+# [NSUKit] is licensed under Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#          http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND,
+# EITHER EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT,
+# MERCHANTABILITY OR FIT FOR A PARTICULAR PURPOSE.
+# See the Mulan PSL v2 for more details.
+
+"""!
+@brief 寄存器指令的本地模拟设备
+@details 实现VirtualRegCmdMixin使用的全部寄存器指令，作为设备端的参考实现，并可用于无板卡时的联调与测试
+@file device_emulator.py
+"""
+
+import socket
+import struct
+import threading
+from typing import Dict, Optional
+
+from ..interface.base import REG_BATCH_WRITE, REG_BATCH_READ, REG_CAPS_QUERY, REG_CAP_BATCH
+from .logging import logging
+
+REG_WRITE = 0x31001000
+REG_READ = 0x31001001
+REG_INCREMENT_WRITE = 0x31001010
+REG_INCREMENT_READ = 0x31001011
+REG_LOOP_WRITE = 0x31001020
+REG_LOOP_READ = 0x31001021
+
+
+class RegDeviceEmulator:
+    """!
+    @brief 寄存器指令模拟设备
+    @details
+    1. registers为 地址->4字节值 的寄存器表，未写过的寄存器读出为0
+    2. readonly中的地址写入失败，forbidden中的地址读写均失败，用于测试错误处理
+    3. batch为False时模拟不支持批量寄存器指令的旧设备：能力查询与批量指令均应答失败
+    4. feed按指令长度字段从字节流中切分指令，可直接接在任意字节流传输之后
+    """
+
+    def __init__(self, batch: bool = True):
+        self.batch = batch
+        self.registers: Dict[int, bytes] = {}
+        self.readonly = set()
+        self.forbidden = set()
+        self.frames = []
+        self._buffer = b''
+
+    def feed(self, data: bytes) -> bytes:
+        """!
+        @brief 输入主机发来的字节流
+        @param data: 收到的数据
+        @return: 需要回复的数据
+        """
+        self._buffer += bytes(data)
+        replies = []
+        while len(self._buffer) >= 16:
+            length = struct.unpack('=I', self._buffer[12:16])[0]
+            if length < 16:
+                raise RuntimeError(f'Invalid command length {length}')
+            if len(self._buffer) < length:
+                break
+            frame, self._buffer = self._buffer[:length], self._buffer[length:]
+            replies.append(self.handle(frame))
+        return b''.join(replies)
+
+    def handle(self, frame: bytes) -> bytes:
+        """!
+        @brief 执行一条指令
+        @param frame: 完整的指令
+        @return: 反馈
+        """
+        self.frames.append(frame)
+        _, cid, seq, _ = struct.unpack('=IIII', frame[:16])
+        body = frame[16:]
+        if cid == REG_WRITE:
+            payload = struct.pack('=I', self._write(*struct.unpack('=I', body[:4]), body[4:8]))
+        elif cid == REG_READ:
+            addr = struct.unpack('=I', body[:4])[0]
+            ok = self._readable(addr)
+            payload = struct.pack('=I', 0 if ok else 1) + self._read(addr)
+        elif cid in (REG_INCREMENT_WRITE, REG_LOOP_WRITE):
+            addr, length = struct.unpack('=II', body[:8])
+            data = body[8:8 + length]
+            status = 0
+            for _n in range(0, length, 4):
+                status |= self._write(addr + _n if cid == REG_INCREMENT_WRITE else addr, data[_n:_n + 4])
+            payload = struct.pack('=I', status)
+        elif cid in (REG_INCREMENT_READ, REG_LOOP_READ):
+            addr, length = struct.unpack('=II', body[:8])
+            addrs = [addr + _n if cid == REG_INCREMENT_READ else addr for _n in range(0, length, 4)]
+            status = 0 if all(self._readable(_a) for _a in addrs) else 1
+            payload = struct.pack('=I', status) + b''.join(self._read(_a) for _a in addrs)
+        elif cid == REG_CAPS_QUERY:
+            payload = struct.pack('=II', 0, REG_CAP_BATCH) if self.batch else struct.pack('=I', 1)
+        elif cid == REG_BATCH_WRITE and self.batch:
+            count = struct.unpack('=I', body[:4])[0]
+            payload = struct.pack('=II', 0, 0)
+            for _n in range(count):
+                addr, = struct.unpack('=I', body[4 + 8 * _n:8 + 8 * _n])
+                if self._write(addr, body[8 + 8 * _n:12 + 8 * _n]):
+                    payload = struct.pack('=II', 1, _n)
+                    break
+        elif cid == REG_BATCH_READ and self.batch:
+            count = struct.unpack('=I', body[:4])[0]
+            addrs = struct.unpack(f'={count}I', body[4:4 + 4 * count])
+            failed = [_n for _n, _a in enumerate(addrs) if not self._readable(_a)]
+            payload = struct.pack('=II', 1 if failed else 0, failed[0] if failed else 0)
+            payload += b''.join(self._read(_a) for _a in addrs)
+        else:
+            payload = struct.pack('=I', 1)
+        return struct.pack('=IIII', 0xCFCFCFCF, cid, seq, 16 + len(payload)) + payload
+
+    def _readable(self, addr: int) -> bool:
+        return addr not in self.forbidden
+
+    def _read(self, addr: int) -> bytes:
+        return self.registers.get(addr, b'\x00' * 4)
+
+    def _write(self, addr: int, value: bytes) -> int:
+        if addr in self.readonly or addr in self.forbidden:
+            return 1
+        self.registers[addr] = bytes(value).ljust(4, b'\x00')
+        return 0
+
+
+class TCPDeviceEmulator:
+    """!
+    @brief 以TCP服务端形式运行的模拟设备
+    @details 在后台线程中监听端口，将收到的数据交给RegDeviceEmulator并回复，一次服务一个连接
+
+    ---
+    示例代码如下
+    @code
+    >>> from nsukit import NSUSoc, InitParamSet
+    >>> from nsukit.interface import TCPCmdUItf, TCPStreamUItf
+    >>> with TCPDeviceEmulator() as device:
+    >>>     param = InitParamSet(cmd_ip='127.0.0.1', cmd_tcp_port=device.port, cmd_reg_caps=True)
+    >>>     kit = NSUSoc(TCPCmdUItf, TCPStreamUItf, param)
+    >>>     kit.link_cmd()
+    >>>     kit.write(0x10, b'\\x01\\x00\\x00\\x00')
+    @endcode
+    """
+
+    def __init__(self, ip: str = '127.0.0.1', port: int = 0, device: Optional[RegDeviceEmulator] = None):
+        self.device = RegDeviceEmulator() if device is None else device
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((ip, port))
+        self._server.listen(1)
+        self.port = self._server.getsockname()[1]
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> "TCPDeviceEmulator":
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        try:
+            # shutdown唤醒阻塞在accept中的服务线程
+            self._server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._server.close()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def __enter__(self) -> "TCPDeviceEmulator":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.stop()
+
+    def _serve(self) -> None:
+        while not self._stop.is_set():
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            with conn:
+                self._serve_connection(conn)
+
+    def _serve_connection(self, conn: socket.socket) -> None:
+        while not self._stop.is_set():
+            try:
+                data = conn.recv(64 * 1024)
+            except OSError:
+                return
+            if not data:
+                return
+            try:
+                reply = self.device.feed(data)
+            except Exception as e:
+                logging.error(msg=f'{self.__class__.__name__}: {e}')
+                return
+            if reply:
+                try:
+                    conn.sendall(reply)
+                except OSError:
+                    # 主机已断开连接(如能力查询超时后重连)，丢弃反馈
+                    return
+
@@ -0,0 +1,88 @@
+# Copyright (c) [2023] [NaiShu]
+# [NSUKit] is licensed under Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#          http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND,
+# EITHER EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT,
+# MERCHANTABILITY OR FIT FOR A PARTICULAR PURPOSE.
+# See the Mulan PSL v2 for more details.
+
+"""!
+@brief ICD字段计算表达式的受限求值器
+@file expr_eval.py
+"""
+
+import ast
+import math
+from functools import lru_cache
+from typing import Callable, Any
+
+expr_functions = {
+    'min': min,
+    'max': max,
+    'abs': abs,
+    'round': round,
+    'int': int,
+    'float': float,
+    'floor': math.floor,
+    'ceil': math.ceil,
+    'sqrt': math.sqrt,
+    'exp': math.exp,
+    'log': math.log,
+    'log2': math.log2,
+    'log10': math.log10,
+    'sin': math.sin,
+    'cos': math.cos,
+    'tan': math.tan,
+    'pi': math.pi,
+    'e': math.e,
+}
+
+_allowed_nodes = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp, ast.Call,
+    ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.LShift, ast.RShift, ast.BitAnd, ast.BitOr, ast.BitXor,
+    ast.UAdd, ast.USub, ast.Invert, ast.Not, ast.And, ast.Or,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+)
+
+
+class InvalidExpressionError(ValueError):
+    """!
+    自定义异常类，用于表示ICD中不被支持的计算表达式
+    """
+    ...
+
+
+@lru_cache(maxsize=None)
+def compile_expr(source: str) -> Callable[[Any], Any]:
+    """!
+    将ICD字段中的计算表达式编译为以x为参数的函数
+
+    表达式只允许使用算术、位运算、比较运算、条件表达式以及expr_functions中的函数与常量，
+    相同的表达式只编译一次
+    @param source: 计算表达式，如 "min(max(0, (63-(40-2*x))), 63)"
+    @return: 函数 f(x)
+    """
+    if not isinstance(source, str):
+        raise InvalidExpressionError(f'The expression should be a str, not {source!r}')
+    try:
+        tree = ast.parse(source.strip(), mode='eval')
+    except SyntaxError as e:
+        raise InvalidExpressionError(f'Invalid expression {source!r}: {e}')
+    for node in ast.walk(tree):
+        if not isinstance(node, _allowed_nodes):
+            raise InvalidExpressionError(f'Unsupported syntax {node.__class__.__name__} in expression {source!r}')
+        if isinstance(node, ast.Name) and node.id != 'x' and node.id not in expr_functions:
+            raise InvalidExpressionError(f'Unsupported name {node.id!r} in expression {source!r}')
+        if isinstance(node, ast.Call) and (not isinstance(node.func, ast.Name) or node.keywords):
+            raise InvalidExpressionError(f'Unsupported call in expression {source!r}')
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise InvalidExpressionError(f'Unsupported constant {node.value!r} in expression {source!r}')
+    func = ast.Expression(ast.Lambda(
+        args=ast.arguments(posonlyargs=[], args=[ast.arg(arg='x')], kwonlyargs=[], kw_defaults=[], defaults=[]),
+        body=tree.body))
+    code = compile(ast.fix_missing_locations(func), '<icd expr>', 'eval')
+    return eval(code, {'__builtins__': {}, **expr_functions})
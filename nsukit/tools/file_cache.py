@@ -0,0 +1,96 @@
+# Copyright (c) [2023] [NaiShu]
+# [NSUKit] is licensed under Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#          http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND,
+# EITHER EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT,
+# MERCHANTABILITY OR FIT FOR A PARTICULAR PURPOSE.
+# See the Mulan PSL v2 for more details.
+
+"""!
+@brief 文件内容缓存
+@file file_cache.py
+"""
+
+import os
+import mmap
+from threading import Lock
+from collections import OrderedDict
+from typing import Tuple, Union
+
+FileData = Union[bytes, mmap.mmap]
+
+
+class FileCache:
+    """!
+    @brief 以路径为键、以mtime与文件大小校验的LRU文件缓存
+    @details
+    1. 文件被修改(mtime或大小变化)后再次获取时会重新读取
+    2. 超过mmap_threshold的文件以只读mmap的方式映射，不占用缓存的字节预算
+    3. 缓存条目数超过max_entries，或常规读入的字节数超过max_bytes时，淘汰最久未使用的条目
+    """
+
+    def __init__(self, max_entries: int = 16, max_bytes: int = 256 * 1024 ** 2, mmap_threshold: int = 16 * 1024 ** 2):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.mmap_threshold = mmap_threshold
+        self._entries: "OrderedDict[str, Tuple[tuple, FileData]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+
+    def get(self, path: str) -> Tuple[FileData, int]:
+        """!
+        获取文件内容
+        @param path: 文件路径
+        @return: (文件内容, 文件长度)，文件内容为bytes或只读mmap对象
+        """
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(path, None)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(path)
+                return entry[1], stat.st_size
+        data = self._read(path, stat.st_size)
+        with self._lock:
+            self._pop(path)
+            self._entries[path] = (key, data)
+            if isinstance(data, bytes):
+                self._bytes += len(data)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._pop(next(iter(self._entries)))
+        return data, stat.st_size
+
+    @staticmethod
+    def size(path: str) -> int:
+        """!
+        获取文件长度，不读取文件内容
+        @param path: 文件路径
+        @return: 文件长度
+        """
+        return os.stat(path).st_size
+
+    def invalidate(self, path: str = None) -> None:
+        """!
+        清除缓存
+        @param path: 要清除的文件路径，为None时清除全部
+        @return: None
+        """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                self._pop(path)
+
+    def _pop(self, path: str) -> None:
+        entry = self._entries.pop(path, None)
+        if entry is not None and isinstance(entry[1], bytes):
+            self._bytes -= len(entry[1])
+
+    def _read(self, path: str, size: int) -> FileData:
+        with open(path, 'rb') as fp:
+            if 0 < self.mmap_threshold <= size:
+                return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            return fp.read()
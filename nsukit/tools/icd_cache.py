@@ -0,0 +1,176 @@
+# Copyright (c) [2023] [NaiShu]
+# [NSUKit] is licensed under Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#          http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND,
+# EITHER EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT,
+# MERCHANTABILITY OR FIT FOR A PARTICULAR PURPOSE.
+# See the Mulan PSL v2 for more details.
+
+"""!
+@brief ICD解析结果的二进制缓存
+@file icd_cache.py
+"""
+
+import os
+import json
+import marshal
+import hashlib
+import struct
+import tempfile
+from array import array
+from collections.abc import MutableMapping
+from typing import Optional, Any, Iterator
+
+from .logging import logging
+
+CACHE_VERSION = 1
+CACHE_MAGIC = b'NSUICD'
+CACHE_HEAD = CACHE_MAGIC + struct.pack('<H', CACHE_VERSION)
+LAZY_SECTIONS = ('param', 'command')     # 按条目延迟反序列化的icd段
+
+
+def default_cache_dir() -> str:
+    """!
+    默认缓存目录，可通过环境变量NSUKIT_CACHE_DIR指定
+    @return: 缓存目录
+    """
+    path = os.environ.get('NSUKIT_CACHE_DIR', None)
+    if path:
+        return path
+    base = os.environ.get('XDG_CACHE_HOME', None) or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'nsukit')
+
+
+class LazyTable(MutableMapping):
+    """!
+    @brief 延迟反序列化的icd段
+    @details 只在加载时建立 名称->条目位置 的索引，条目在首次访问时才从缓存数据中解出，
+    之后的读写与普通dict一致
+    """
+
+    def __init__(self, names: list, offsets: array, blob: memoryview):
+        self._index = dict(zip(names, range(len(names))))
+        self._offsets = offsets
+        self._blob = blob
+        self._items = {}
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return self._items[key]
+        except KeyError:
+            pass
+        pos = self._index[key]
+        value = marshal.loads(self._blob[self._offsets[pos]:self._offsets[pos + 1]])
+        self._items[key] = value
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._index.setdefault(key, None)
+        self._items[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self._index[key]
+        self._items.pop(key, None)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({len(self)} items)'
+
+
+class ICDCache:
+    """!
+    @brief 以文件内容哈希为键的ICD解析缓存
+    @details
+    1. 缓存文件名为icd文件内容的哈希值，icd内容变化后自然失效
+    2. 缓存以marshal格式保存，文件头带有魔数与缓存版本号，版本不一致时重新解析
+    3. param与command段以LazyTable返回，加载时只建立索引，条目在首次访问时反序列化
+    4. 缓存目录不可写时只记录日志，不影响icd加载
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = default_cache_dir() if cache_dir is None else cache_dir
+
+    @staticmethod
+    def digest(raw: bytes) -> str:
+        return hashlib.blake2b(raw, digest_size=20).hexdigest()
+
+    def cache_path(self, raw: bytes) -> str:
+        return os.path.join(self.cache_dir, f'{self.digest(raw)}.icd')
+
+    def load(self, path: str) -> dict:
+        """!
+        加载icd文件
+        @details 缓存命中时从缓存建立索引，否则按JSON解析并写入缓存
+        @param path: icd文件路径
+        @return: 解析后的icd数据
+        """
+        with open(path, 'rb') as fp:
+            raw = fp.read()
+        cache_path = self.cache_path(raw)
+        data = self._read(cache_path)
+        if data is None:
+            data = json.loads(raw.decode('utf-8'))
+            self._write(cache_path, data)
+        return data
+
+    @staticmethod
+    def _read(cache_path: str) -> Optional[dict]:
+        try:
+            with open(cache_path, 'rb') as fp:
+                blob = memoryview(fp.read())
+        except OSError:
+            return None
+        if bytes(blob[:len(CACHE_HEAD)]) != CACHE_HEAD:
+            return None
+        try:
+            index_end = len(CACHE_HEAD) + 8 + struct.unpack_from('<Q', blob, len(CACHE_HEAD))[0]
+            data, index = marshal.loads(blob[len(CACHE_HEAD) + 8:index_end])
+            blob = blob[index_end:]
+            for section, (names, offsets) in index.items():
+                table = array('Q')
+                table.frombytes(offsets)
+                data[section] = LazyTable(names, table, blob)
+        except (ValueError, EOFError, TypeError, struct.error) as e:
+            logging.warning(msg=f'{e}, ICD cache {cache_path} unavailable')
+            return None
+        return data
+
+    def _write(self, cache_path: str, data: dict) -> None:
+        data = dict(data)
+        index, parts, offset = {}, [], 0
+        for section in LAZY_SECTIONS:
+            table = data.get(section, None)
+            if not isinstance(table, dict):
+                continue
+            offsets = array('Q', [offset])
+            for value in table.values():
+                part = marshal.dumps(value)
+                parts.append(part)
+                offset += len(part)
+                offsets.append(offset)
+            index[section] = (list(table), offsets.tobytes())
+            del data[section]
+        try:
+            index_blob = marshal.dumps((data, index))
+            os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as fp:
+                    fp.write(CACHE_HEAD + struct.pack('<Q', len(index_blob)) + index_blob)
+                    fp.writelines(parts)
+                os.replace(tmp_path, cache_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except (OSError, ValueError) as e:
+            logging.debug(msg=f'{e}, ICD cache {cache_path} not saved')
@@ -0,0 +1,132 @@
+# Copyright (c) [2023] [NaiShu]
+# [NSUKit] is licensed under Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#          http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND,
+# EITHER EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT,
+# MERCHANTABILITY OR FIT FOR A PARTICULAR PURPOSE.
+# See the Mulan PSL v2 for more details.
+
+"""!
+@brief 延迟写寄存器的合并
+@file reg_batch.py
+"""
+
+from typing import Iterable, List, Dict, Tuple, Any, Union
+
+import numpy as np
+
+REG_LEN = 4
+
+
+def _contiguous(addr: Union[List[int], np.ndarray], min_run: int) -> Iterable[Tuple[int, int]]:
+    if isinstance(addr, np.ndarray):
+        edges = np.flatnonzero(np.diff(addr.astype(np.int64)) != REG_LEN) + 1
+        starts = np.concatenate(([0], edges))
+        ends = np.concatenate((edges, [len(addr)]))
+        keep = ends - starts >= min_run
+        return zip(starts[keep].tolist(), ends[keep].tolist())
+    runs = []
+    start = 0
+    for _n in range(1, len(addr) + 1):
+        if _n < len(addr) and addr[_n] == addr[_n - 1] + REG_LEN:
+            continue
+        if _n - start >= min_run:
+            runs.append((start, _n))
+        start = _n
+    return runs
+
+
+def split_runs(addr: Union[List[int], np.ndarray], min_run: int = 2) -> List[Tuple[bool, int, int]]:
+    """!
+    按给定顺序将一组寄存器地址切分为连续段与零散段
+    @details 相邻且地址依次递增REG_LEN、不少于min_run个的寄存器为一个连续段，连续段之间的寄存器为零散段
+    @param addr: 寄存器地址列表或数组，为数组时向量化检测
+    @param min_run: 连续段的最小寄存器个数
+    @return: (是否连续段, 起始序号, 结束序号)的列表，各段按序首尾相接
+    """
+    segments = []
+    loose = 0
+    for start, end in _contiguous(addr, min_run):
+        if loose < start:
+            segments.append((False, loose, start))
+        segments.append((True, start, end))
+        loose = end
+    if loose < len(addr):
+        segments.append((False, loose, len(addr)))
+    return segments
+
+
+class RegWriteBatch:
+    """!
+    @brief 收集一段时间内的寄存器写入，退出时合并下发
+    @details
+    1. 对同一地址的多次写入只保留最后一次的值
+    2. 合并后地址连续且不少于min_run个的寄存器以一次increment_write下发，其余以一次multi_write下发
+    3. side_effects中的地址写入即产生动作(如启动、清零)，每次写入都保留，并作为顺序屏障：
+    屏障之前收集的写入先下发，之后的写入在其后下发；循环写(BulkMode.LOOP)同样作为屏障
+    4. 屏障之间的写入不保证原有顺序
+    """
+
+    def __init__(self, side_effects: Iterable[int] = (), min_run: int = 2):
+        self.side_effects = set(side_effects)
+        self.min_run = min_run
+        self._ops: List[Tuple[str, Any, Any]] = []
+        self._pending: Dict[int, bytes] = {}
+
+    def __len__(self) -> int:
+        return len(self._ops) + len(self._pending)
+
+    def write(self, addr: int, value: bytes) -> None:
+        """!
+        收集一次单寄存器写入
+        """
+        value = value.ljust(REG_LEN, b'\x00')
+        if addr in self.side_effects:
+            self._barrier(('write', addr, value))
+        else:
+            self._pending[addr] = value
+
+    def increment_write(self, base: int, value: bytes) -> None:
+        """!
+        收集一次连续寄存器写入，按寄存器拆分后与其余写入一同合并
+        """
+        for _n in range(0, len(value), REG_LEN):
+            self.write(base + _n, value[_n:_n + REG_LEN])
+
+    def loop_write(self, base: int, value: bytes) -> None:
+        """!
+        收集一次循环写入
+        """
+        self._barrier(('loop', base, value))
+
+    def _barrier(self, op: Tuple[str, Any, Any]) -> None:
+        self._close_segment()
+        self._ops.append(op)
+
+    def _close_segment(self) -> None:
+        if not self._pending:
+            return
+        addr = sorted(self._pending)
+        value = [self._pending[_a] for _a in addr]
+        self._pending.clear()
+        singles = []
+        for is_run, start, end in split_runs(addr, self.min_run):
+            if is_run:
+                self._ops.append(('increment', addr[start], b''.join(value[start:end])))
+            else:
+                singles.extend(range(start, end))
+        if len(singles) == 1:
+            self._ops.append(('write', addr[singles[0]], value[singles[0]]))
+        elif singles:
+            self._ops.append(('multi', [addr[_n] for _n in singles], [value[_n] for _n in singles]))
+
+    def take(self) -> List[Tuple[str, Any, Any]]:
+        """!
+        取出合并后的写操作并清空已收集的写入
+        @return: (操作, 地址, 值)的列表，操作为write/multi/increment/loop之一
+        """
+        self._close_segment()
+        ops, self._ops = self._ops, []
+        return ops
@@ -0,0 +1,140 @@
+# Copyright (c) [2023] [NaiShu]
+# [NSUKit] is licensed under Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#          http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND,
+# EITHER EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT,
+# MERCHANTABILITY OR FIT FOR A PARTICULAR PURPOSE.
+# See the Mulan PSL v2 for more details.
+
+"""!
+@brief 寄存器影子缓存
+@file reg_shadow.py
+"""
+
+import enum
+import json
+from bisect import bisect_right
+from typing import Union, Iterable, Optional, Dict, List, Tuple
+
+
+def _reg_int(value: Union[int, str]) -> int:
+    return int(value, 0) if isinstance(value, str) else int(value)
+
+
+class RegPolicy(str, enum.Enum):
+    """!
+    寄存器地址段的缓存策略
+
+    **VOLATILE**: 寄存器值可能被设备改变，每次读取都访问设备
+
+    **CACHEABLE**: 寄存器值只由本机写入，读取结果与写入值均缓存，命中时不访问设备
+
+    **WRITE_ONLY**: 寄存器不可回读，读取时返回最近一次写入的值，未写入过时访问设备且不缓存结果
+    """
+
+    VOLATILE = 'volatile'
+    CACHEABLE = 'cacheable'
+    WRITE_ONLY = 'write_only'
+
+
+class RegShadow:
+    """!
+    @brief 按地址段策略缓存寄存器值的影子表
+    @details
+    1. 寄存器表为JSON文件或同结构的dict，格式如下，base与length可为十六进制字符串，length单位为字节
+    @code
+    {
+        "default": "volatile",
+        "ranges": [
+            {"base": "0x1000", "length": "0x100", "policy": "cacheable"},
+            {"base": "0x2000", "length": 4, "policy": "write_only"}
+        ]
+    }
+    @endcode
+    2. 未被任何地址段覆盖的地址使用default策略，缺省为volatile
+    3. 影子表只记录值，不负责与设备通信，由NSUSoc在读写寄存器时维护
+    """
+
+    def __init__(self, reg_map: Union[str, dict, None] = None):
+        self.default = RegPolicy.VOLATILE
+        self._bases: List[int] = []
+        self._ranges: List[Tuple[int, int, RegPolicy]] = []
+        self._values: Dict[int, bytes] = {}
+        if reg_map is not None:
+            self.load(reg_map)
+
+    def load(self, reg_map: Union[str, dict]) -> None:
+        """!
+        加载寄存器表，已缓存的值全部失效
+        @param reg_map: 寄存器表文件路径，或已解析的寄存器表
+        @return:
+        """
+        if isinstance(reg_map, str):
+            with open(reg_map, 'r', encoding='utf-8') as fp:
+                reg_map = json.load(fp)
+        ranges = []
+        for item in reg_map.get('ranges', []):
+            base, length = _reg_int(item['base']), _reg_int(item['length'])
+            ranges.append((base, base + length, RegPolicy(item['policy'])))
+        ranges.sort()
+        for (_, end, _), (base, _, _) in zip(ranges, ranges[1:]):
+            if base < end:
+                raise ValueError(f'Overlapping register ranges at {hex(base)}')
+        self.default = RegPolicy(reg_map.get('default', RegPolicy.VOLATILE))
+        self._ranges = ranges
+        self._bases = [_r[0] for _r in ranges]
+        self._values.clear()
+
+    def policy(self, addr: int) -> RegPolicy:
+        """!
+        查询地址的缓存策略
+        @param addr: 寄存器地址
+        @return: 缓存策略
+        """
+        pos = bisect_right(self._bases, addr) - 1
+        if pos >= 0:
+            base, end, policy = self._ranges[pos]
+            if addr < end:
+                return policy
+        return self.default
+
+    def get(self, addr: int) -> Optional[bytes]:
+        """!
+        获取可直接返回给调用者的寄存器值
+        @param addr: 寄存器地址
+        @return: 缓存的值，未命中或地址为volatile时返回None
+        """
+        value = self._values.get(addr, None)
+        if value is None or self.policy(addr) is RegPolicy.VOLATILE:
+            return None
+        return value
+
+    def on_write(self, addr: int, value: bytes) -> None:
+        """!
+        记录一次成功的写入
+        """
+        if self.policy(addr) is not RegPolicy.VOLATILE:
+            self._values[addr] = value.ljust(4, b'\x00')
+
+    def on_read(self, addr: int, value: bytes) -> None:
+        """!
+        记录一次从设备读出的值，只有cacheable地址会缓存
+        """
+        if self.policy(addr) is RegPolicy.CACHEABLE:
+            self._values[addr] = value
+
+    def invalidate(self, addr: Union[int, Iterable[int], None] = None) -> None:
+        """!
+        使缓存的值失效
+        @param addr: 寄存器地址或地址列表，为None时清空全部缓存
+        @return:
+        """
+        if addr is None:
+            self._values.clear()
+        elif isinstance(addr, int):
+            self._values.pop(addr, None)
+        else:
+            for _a in addr:
+                self._values.pop(_a, None)
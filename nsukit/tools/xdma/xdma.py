@@ -17,6 +17,7 @@
 ############################
 
 from . import xdma_base
+import numpy as np
 from nsukit.tools.logging import logging
 import time
 from threading import Lock
@@ -154,6 +155,37 @@ class Xdma(object):
             logging.error(msg=e)
             return False, 0
 
+    """
+    连续寄存器块写入
+        参数：addr: 起始地址; data: uint32数组，依次写入addr, addr+4, ...; board: fpga_id
+        返回值：True/False
+    """
+
+    @staticmethod
+    def alite_write_block(addr, data, board=0):
+        try:
+            xdma_base.fpga_wr_lite_block(board, addr, np.ascontiguousarray(data, dtype=np.uint32))
+            return True
+        except Exception as e:
+            logging.error(msg=e)
+            logging.warning(msg=xdma_base.fpga_err_msg())
+            return False
+
+    """
+    连续寄存器块读出
+        参数：addr: 起始地址; length: 寄存器个数; board: fpga_id
+        返回值：[True/False, uint32数组]
+    """
+
+    @staticmethod
+    def alite_read_block(addr, length, board=0):
+        try:
+            return True, xdma_base.fpga_rd_lite_block(board, addr, length)
+        except Exception as e:
+            logging.error(msg=e)
+            logging.warning(msg=xdma_base.fpga_err_msg())
+            return False, np.zeros(length, dtype=np.uint32)
+
     @staticmethod
     def wait_irq(idx, board, timeout=0):
         try:
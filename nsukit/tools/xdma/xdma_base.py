@@ -46,6 +46,7 @@ if libxdma is None:
     raise RuntimeError(f'xdma_api load Failed')
 
 libxdma.fpga_info_string.argtypes = [ctypes.c_uint]
+libxdma.fpga_info_bar_alite.argtypes = [ctypes.c_uint]
 libxdma.fpga_open.argtypes = [ctypes.c_uint, ctypes.c_uint]
 libxdma.fpga_close.argtypes = [ctypes.c_uint]
 libxdma.fpga_alloc_dma.argtypes = [ctypes.c_uint, ctypes.c_ulonglong, ctypes.c_void_p, ctypes.c_void_p]
@@ -75,17 +76,23 @@ libxdma.fpga_recv.restype = ctypes.c_ulonglong
 libxdma.fpga_wait_dma.restype = ctypes.c_ulonglong
 libxdma.fpga_poll_dma.restype = ctypes.c_ulonglong
 libxdma.fpga_break_dma.restype = ctypes.c_ulonglong
+libxdma.fpga_wr_lite.restype = None
 libxdma.fpga_rd_lite.restype = ctypes.c_uint
 libxdma.fpga_wait_irq.restype = ctypes.c_uint
 libxdma.fpga_err_msg.restype = ctypes.c_char_p
 libxdma.fpga_get_dma_speed.restype = ctypes.c_double
 libxdma.fpga_info_string.restype = ctypes.c_char_p
+libxdma.fpga_info_bar_alite.restype = ctypes.c_int
 
 
 def fpga_info_string(board):
     return libxdma.fpga_info_string(board).decode()
 
 
+def fpga_info_bar_alite(board):
+    return libxdma.fpga_info_bar_alite(board)
+
+
 def fpga_open(board, poll_interval_ms=0):
     return libxdma.fpga_open(board, poll_interval_ms)
 
@@ -139,6 +146,37 @@ def fpga_rd_lite(board, addr):
     return libxdma.fpga_rd_lite(board, addr)
 
 
+def fpga_wr_lite_block(board, addr, data):
+    """
+    将uint32数组依次写入从addr开始的连续寄存器
+    libxdma_api未提供块传输接口，此处直接循环调用fpga_wr_lite，每次调用期间ctypes释放GIL
+    fpga_wr_lite没有返回值，其失败条件只有板卡的alite bar无效，因此在写入前统一检查，失败时整块不写入
+    """
+    _check_lite(board)
+    wr_lite = libxdma.fpga_wr_lite
+    for _a, _v in zip(range(addr, addr + 4 * len(data), 4), data.tolist()):
+        wr_lite(board, _a, _v)
+
+
+def fpga_rd_lite_block(board, addr, length):
+    """
+    从addr开始读取length个连续寄存器，返回uint32数组
+    0xFFFFFFFF是合法的寄存器值，失败只以alite bar的状态判断
+    """
+    _check_lite(board)
+    rd_lite = libxdma.fpga_rd_lite
+    return np.fromiter((rd_lite(board, _a) for _a in range(addr, addr + 4 * length, 4)),
+                       dtype=np.uint32, count=length)
+
+
+def _check_lite(board):
+    """
+    fpga_wr_lite/fpga_rd_lite在板卡的alite bar无效时不访问寄存器，只记录错误信息
+    """
+    if libxdma.fpga_info_bar_alite(board) < 0:
+        raise RuntimeError(f'board {board} has no valid alite bar')
+
+
 def fpga_wait_irq(board, num, timeout):
     return libxdma.fpga_wait_irq(board, num, timeout)
 
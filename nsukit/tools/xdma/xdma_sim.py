@@ -74,6 +74,18 @@ class Xdma(object):
         logging.debug(msg=f"板卡{board}, 接收读寄存器，地址：{addr}, 返回值：{val}")
         return True, val
 
+    def alite_write_block(self, addr, data, board=0):
+        for _a, _v in zip(range(addr, addr + 4 * len(data), 4), np.asarray(data, dtype='u4').tolist()):
+            self.reg[_a] = _v
+        logging.debug(msg=f"板卡{board}, 接收块写寄存器，起始地址：{addr}, 个数：{len(data)}")
+        return True
+
+    def alite_read_block(self, addr, length, board=0):
+        val = np.array([self.reg.get(_a, random.randint(0, 10)) for _a in range(addr, addr + 4 * length, 4)],
+                       dtype='u4')
+        logging.debug(msg=f"板卡{board}, 接收块读寄存器，起始地址：{addr}, 个数：{length}")
+        return True, val
+
     def reset_board(self, board):
         logging.debug(msg=f"接收到板卡{board}复位")
         return True
@@ -0,0 +1,146 @@
+# Copyright (c) [2023] [Mulan PSL v2]
+# [NSUKit] is licensed under Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#          http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND,
+# EITHER EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT,
+# MERCHANTABILITY OR FIT FOR A PARTICULAR PURPOSE.
+# See the Mulan PSL v2 for more details.
+
+import json
+import asyncio
+import socket
+import struct
+
+import numpy as np
+
+from nsukit import AsyncNSUSoc, InitParamSet
+
+
+async def device(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """!
+    模拟设备：寄存器读写按ICD约定回复，其余指令回复 包头、ID、序号、长度、结果0
+    """
+    regs = {}
+    while True:
+        try:
+            head = await reader.readexactly(16)
+        except asyncio.IncompleteReadError:
+            return
+        _, cid, seq, length = struct.unpack('=IIII', head)
+        body = await reader.readexactly(length - 16)
+        if cid == 0x31001000:
+            addr, value = struct.unpack('=II', body)
+            regs[addr] = value
+            writer.write(struct.pack('=IIIII', 0xCFCFCFCF, cid, seq, 20, 0))
+        elif cid == 0x31001001:
+            addr = struct.unpack('=I', body)[0]
+            writer.write(struct.pack('=IIIIII', 0xCFCFCFCF, cid, seq, 24, 0, regs.get(addr, 0)))
+        else:
+            writer.write(struct.pack('=IIIII', 0xCFCFCFCF, cid, seq, 20, 0))
+        await writer.drain()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_async_kit():
+    """!
+    @brief 异步指令与数据流测试
+    @details 一个事件循环同时驱动多张模拟板卡
+    @return:
+    """
+    async def main():
+        server = await asyncio.start_server(device, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        kits = [AsyncNSUSoc(link_param=InitParamSet(cmd_ip='127.0.0.1', cmd_tcp_port=port,
+                                                    stream_ip='127.0.0.1', stream_tcp_port=free_port()))
+                for _ in range(4)]
+        await asyncio.gather(*(kit.link_cmd() for kit in kits))
+        await asyncio.gather(*(kit.write(0x10, struct.pack('=I', idx + 1)) for idx, kit in enumerate(kits)))
+        assert [struct.unpack('=I', one)[0] for one in await kits[0].read([0x10, 0x14])] == [1, 0]
+        await asyncio.gather(*(kit.execute('系统停止') for kit in kits))
+        assert kits[0].get_param('系统停止结果') == 0
+
+        kit = kits[0]
+        await kit.link_stream()
+        fd = kit.alloc_buffer(4096)
+        recv = asyncio.ensure_future(kit.stream_recv(0, fd, 4096))
+        _, writer = await asyncio.open_connection('127.0.0.1', kit.link_param.stream_tcp_port)
+        writer.write(np.arange(1024, dtype='u4').tobytes())
+        await writer.drain()
+        assert await recv
+        assert (kit.get_buffer(fd, 4096) == np.arange(1024, dtype='u4')).all()
+        writer.close()
+        await kit.unlink_stream()
+        await asyncio.gather(*(kit.unlink_cmd() for kit in kits))
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(main())
+
+
+ICD = {
+    "param": {"结果": ["uint32", 0]},
+    "command": {
+        "配置": {
+            "send": [["uint32", "0x5F5F5F5F"], ["uint32", "0x31000001"], ["uint32", 0], ["uint32", 0]],
+            "recv": [["uint32", "0xCFCFCFCF"], ["uint32", "0x31000001"], ["uint32", 0], ["uint32", 20], "结果"]
+        },
+        "查询": {
+            "query": True,
+            "ttl": 0,
+            "send": [["uint32", "0x5F5F5F5F"], ["uint32", "0x31000003"], ["uint32", 0], ["uint32", 0]],
+            "recv": [["uint32", "0xCFCFCFCF"], ["uint32", "0x31000003"], ["uint32", 0], ["uint32", 20], "结果"]
+        }
+    },
+    "sequence": {"配置序列": ["配置", "配置", "配置"]}
+}
+
+
+def test_async_execute(tmp_path, monkeypatch):
+    """!
+    @brief 异步执行指令序列与查询指令
+    @details 指令序列与同步接口一样连续发送；并发的同一查询只发送一次请求
+    @return:
+    """
+    monkeypatch.setenv('NSUKIT_CACHE_DIR', str(tmp_path / 'cache'))
+    path = tmp_path / 'icd.json'
+    path.write_text(json.dumps(ICD, ensure_ascii=False), encoding='utf-8')
+    frames = []
+
+    async def slow_device(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        while True:
+            try:
+                head = await reader.readexactly(16)
+            except asyncio.IncompleteReadError:
+                return
+            _, cid, seq, length = struct.unpack('=IIII', head)
+            await reader.readexactly(length - 16)
+            frames.append(cid)
+            if cid == 0x31000003:
+                await asyncio.sleep(0.05)
+            writer.write(struct.pack('=IIIII', 0xCFCFCFCF, cid, seq, 20, len(frames)))
+            await writer.drain()
+
+    async def main():
+        server = await asyncio.start_server(slow_device, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        kit = AsyncNSUSoc(link_param=InitParamSet(cmd_ip='127.0.0.1', cmd_tcp_port=port,
+                                                  icd_path=str(path), check_recv_head=True))
+        await kit.link_cmd()
+        await kit.execute('配置序列')
+        assert frames == [0x31000001] * 3 and kit.get_param('结果') == 3
+        await asyncio.gather(*(kit.execute('查询') for _ in range(8)))
+        assert frames.count(0x31000003) == 1 and kit.get_param('结果') == 4
+        await kit.execute('查询')
+        assert frames.count(0x31000003) == 2
+        await kit.unlink_cmd()
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(main())
@@ -0,0 +1,629 @@
+# Copyright (c) [2023] [Mulan PSL v2]
+# [NSUKit] is licensed under Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#          http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND,
+# EITHER EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT,
+# MERCHANTABILITY OR FIT FOR A PARTICULAR PURPOSE.
+# See the Mulan PSL v2 for more details.
+
+import time
+import threading
+import socket
+import struct
+
+import numpy as np
+import pytest
+
+from nsukit.interface import BaseCmdUItf, TCPCmdUItf, InitParamSet
+from nsukit.interface.base import VirtualRegCmdMixin
+from nsukit.interface.base import REG_CAP_BATCH, REG_BATCH_WRITE, REG_CAPS_QUERY
+from nsukit.tools.device_emulator import RegDeviceEmulator, TCPDeviceEmulator
+
+
+class RecordCmdUItf(BaseCmdUItf):
+    send_chunk_size = 8
+
+    def __init__(self):
+        self.sent = []
+
+    def send_bytes(self, data: bytes) -> int:
+        self.sent.append(data)
+        return len(data)
+
+
+class EmulatedCmdUItf(VirtualRegCmdMixin, BaseCmdUItf):
+    reg_window = 8
+
+    def __init__(self, device: RegDeviceEmulator):
+        self.device = device
+        self.replies = b''
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def send_bytes(self, data: bytes) -> int:
+        frames = len(self.device.frames)
+        self.replies += self.device.feed(data)
+        self.in_flight += len(self.device.frames) - frames
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return len(data)
+
+    def recv_bytes(self, size: int = 1024) -> bytes:
+        data, self.replies = self.replies[:size], self.replies[size:]
+        if size == 16:
+            self.in_flight -= 1
+        return data
+
+
+def test_send_buffers_chunked():
+    """!
+    @brief 默认聚集发送测试
+    @details 多个缓冲区按定长块拼接后发送
+    @return:
+    """
+    itf = RecordCmdUItf()
+    buffers = [b'\x01' * 5, memoryview(np.arange(3, dtype='u4')), b'', b'\x02' * 3]
+    assert itf.send_buffers(buffers) == 20
+    assert [len(one) for one in itf.sent] == [8, 8, 4]
+    assert b''.join(itf.sent) == b''.join(bytes(one) for one in buffers)
+
+
+def test_tcp_send_buffers():
+    """!
+    @brief 网络聚集发送测试
+    @return:
+    """
+    itf = TCPCmdUItf()
+    itf._tcp_server, peer = socket.socketpair()
+    try:
+        payload = np.arange(1024, dtype='u4')
+        assert itf.send_buffers([b'head', memoryview(payload), b'tail']) == 4104
+        recv = b''
+        while len(recv) < 4104:
+            recv += peer.recv(4104)
+        assert recv == b'head' + payload.tobytes() + b'tail'
+    finally:
+        itf._tcp_server.close()
+        peer.close()
+
+
+class ShortSendSocket:
+    """!
+    @brief 每次sendmsg只发送少量字节的socket
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.data = bytearray()
+        self.calls = 0
+
+    def sendmsg(self, views):
+        self.calls += 1
+        sent = 0
+        for view in views:
+            chunk = bytes(view[:self.limit - sent])
+            self.data += chunk
+            sent += len(chunk)
+            if sent == self.limit:
+                break
+        return sent
+
+
+def test_tcp_send_buffers_partial():
+    """!
+    @brief 网络聚集发送部分发送测试
+    @details sendmsg每次只发送部分数据时，从断点继续发送且数据顺序不变
+    @return:
+    """
+    itf = TCPCmdUItf()
+    itf._tcp_server = ShortSendSocket(7)
+    buffers = [bytes([_n]) * (_n % 5) for _n in range(200)]
+    assert itf.send_buffers(buffers) == sum(len(_b) for _b in buffers)
+    assert itf._tcp_server.data == b''.join(buffers)
+    assert itf._tcp_server.calls == -(-len(itf._tcp_server.data) // 7)
+
+
+@pytest.mark.parametrize('batch', [True, False])
+def test_batch_registers(batch):
+    """!
+    @brief 批量寄存器指令测试
+    @details 设备支持时500个寄存器以一帧读写，不支持时退化为逐个读写；失败时报告出错的地址
+    @return:
+    """
+    with TCPDeviceEmulator(device=RegDeviceEmulator(batch=batch)) as emulator:
+        itf = TCPCmdUItf()
+        itf.accept(InitParamSet(cmd_ip='127.0.0.1', cmd_tcp_port=emulator.port, cmd_reg_caps=True))
+        try:
+            assert bool(itf.reg_caps & REG_CAP_BATCH) == batch
+            addrs = list(range(0x1000, 0x1000 + 500 * 8, 8))
+            values = [struct.pack('=I', _n) for _n in range(500)]
+            frames = len(emulator.device.frames)
+            itf.multi_write(addrs, values)
+            assert itf.multi_read(addrs) == values
+            assert len(emulator.device.frames) - frames == (2 if batch else 1000)
+
+            emulator.device.forbidden.add(addrs[7])
+            with pytest.raises(RuntimeError, match=hex(addrs[7])):
+                itf.multi_read(addrs[:10])
+        finally:
+            itf.close()
+
+
+class LateLegacyDevice(RegDeviceEmulator):
+    """!
+    不识别能力查询、且在主机超时后才应答的旧设备
+    """
+
+    def __init__(self, delay: float):
+        super(LateLegacyDevice, self).__init__(batch=False)
+        self.delay = delay
+
+    def handle(self, frame: bytes) -> bytes:
+        if struct.unpack('=I', frame[4:8])[0] == REG_CAPS_QUERY:
+            time.sleep(self.delay)
+        return super(LateLegacyDevice, self).handle(frame)
+
+
+class BadReplyDevice(RegDeviceEmulator):
+    """!
+    读指定地址时反馈错误指令ID的设备
+    """
+
+    def __init__(self, addr: int):
+        super(BadReplyDevice, self).__init__(batch=False)
+        self.addr = addr
+
+    def handle(self, frame: bytes) -> bytes:
+        reply = super(BadReplyDevice, self).handle(frame)
+        if struct.unpack('=I', frame[4:8])[0] == 0x31001001 and struct.unpack('=I', frame[16:20])[0] == self.addr:
+            reply = reply[:4] + b'\x00' * 4 + reply[8:]
+        return reply
+
+
+def test_pipeline_error_recovery():
+    """!
+    @brief 流水线寄存器读出错测试
+    @details 窗口中途收到错误的反馈时报错，窗口内其余反馈被丢弃，不会被后续读写收到
+    @return:
+    """
+    addrs = list(range(0x2000, 0x2000 + 16 * 8, 8))
+    with TCPDeviceEmulator(device=BadReplyDevice(addrs[2])) as emulator:
+        itf = TCPCmdUItf()
+        itf.accept(InitParamSet(cmd_ip='127.0.0.1', cmd_tcp_port=emulator.port))
+        try:
+            emulator.device.registers[0x10] = struct.pack('=I', 7)
+            with pytest.raises(RuntimeError, match='返回ID错误'):
+                itf.multi_read(addrs)
+            assert itf.read(0x10) == struct.pack('=I', 7)
+            assert itf.multi_read(addrs[3:6]) == [b'\x00' * 4] * 3
+        finally:
+            itf.close()
+
+
+def test_reg_caps_negotiation():
+    """!
+    @brief 寄存器能力查询测试
+    @details 默认不查询；查询超时后重新连接，迟到的反馈不会被下一条读写收到；查询后恢复原超时时间
+    @return:
+    """
+    with TCPDeviceEmulator(device=LateLegacyDevice(0.3)) as emulator:
+        itf = TCPCmdUItf()
+        itf.accept(InitParamSet(cmd_ip='127.0.0.1', cmd_tcp_port=emulator.port))
+        try:
+            assert itf.reg_caps == 0 and not emulator.device.frames
+        finally:
+            itf.close()
+
+        itf = TCPCmdUItf()
+        itf.reg_caps_timeout = 0.1
+        itf.accept(InitParamSet(cmd_ip='127.0.0.1', cmd_tcp_port=emulator.port, cmd_reg_caps=True))
+        try:
+            assert itf.reg_caps == 0 and itf.get_timeout() == TCPCmdUItf._timeout
+            itf.write(0x10, struct.pack('=I', 7))
+            assert itf.read(0x10) == struct.pack('=I', 7)
+            itf.set_timeout(3.)
+            itf.negotiate_reg_caps()
+            assert itf.get_timeout() == 3.
+            assert itf.read(0x10) == struct.pack('=I', 7)
+        finally:
+            itf.close()
+
+
+def test_pipelined_registers():
+    """!
+    @brief 流水线寄存器读写测试
+    @details 在途指令数不超过窗口，反馈按序对应到各地址；失败时列出全部出错的地址且不打乱后续读写
+    @return:
+    """
+    device = RegDeviceEmulator(batch=False)
+    itf = EmulatedCmdUItf(device)
+    addrs = list(range(0x2000, 0x2000 + 100 * 8, 8))
+    values = [struct.pack('=I', _n * 3) for _n in range(100)]
+    itf.multi_write(addrs, values)
+    assert itf.multi_read(addrs) == values
+    assert 1 < itf.max_in_flight <= itf.reg_window
+
+    device.readonly.update((addrs[3], addrs[50]))
+    with pytest.raises(RuntimeError, match=f'{hex(addrs[3])}, {hex(addrs[50])}'):
+        itf.multi_write(addrs, values[::-1])
+    assert device.registers[addrs[4]] == values[95]
+    assert itf.replies == b'' and itf.multi_read(addrs[:2]) == values[::-1][:2]
+
+
+def test_reg_shadow():
+    """!
+    @brief 寄存器影子缓存测试
+    @details cacheable地址写后读与重复读不访问设备，volatile地址每次访问设备，write_only地址返回写入值
+    @return:
+    """
+    from nsukit import NSUSoc
+    from nsukit.interface import BaseStreamUItf
+    reg_map = {'ranges': [{'base': '0x1000', 'length': '0x100', 'policy': 'cacheable'},
+                          {'base': '0x2000', 'length': 4, 'policy': 'write_only'}]}
+    with TCPDeviceEmulator() as emulator:
+        kit = NSUSoc(TCPCmdUItf, ds_itf_class=BaseStreamUItf,
+                     link_param=InitParamSet(cmd_ip='127.0.0.1', cmd_tcp_port=emulator.port, cmd_reg_caps=True))
+        kit.link_cmd()
+        kit.load_reg_map(reg_map)
+        device = emulator.device
+        try:
+            device.registers[0x1004] = b'\x05\x00\x00\x00'
+            kit.write(0x1000, b'\x01\x00\x00\x00')
+            kit.write(0x2000, b'\x02\x00\x00\x00')
+            frames = len(device.frames)
+            assert kit.read(0x1000) == b'\x01\x00\x00\x00'
+            assert kit.read(0x2000) == b'\x02\x00\x00\x00'
+            assert [kit.read(0x1004) for _ in range(3)] == [b'\x05\x00\x00\x00'] * 3
+            assert len(device.frames) - frames == 1
+
+            device.registers[0x1004] = b'\x06\x00\x00\x00'
+            device.registers[0x3000] = b'\x07\x00\x00\x00'
+            assert kit.read([0x1000, 0x1004, 0x3000]) == [b'\x01\x00\x00\x00', b'\x05\x00\x00\x00',
+                                                          b'\x07\x00\x00\x00']
+            assert len(device.frames) - frames == 2
+            kit.invalidate()
+            assert kit.read(0x1004) == b'\x06\x00\x00\x00'
+
+            device.readonly.add(0x1008)
+            kit.read(0x1008)
+            with pytest.raises(RuntimeError):
+                kit.write(0x1008, b'\x01\x00\x00\x00')
+            frames = len(device.frames)
+            kit.read(0x1008)
+            assert len(device.frames) - frames == 1
+        finally:
+            kit.unlink_cmd()
+
+
+def test_write_batch():
+    """!
+    @brief 延迟写寄存器测试
+    @details 相邻寄存器合并为一条increment_write，重复写入只保留最后的值，带副作用的地址按顺序保留每次写入；
+    其他线程的读写不进入本线程的batch
+    @return:
+    """
+    from nsukit import NSUSoc
+    from nsukit.interface import BaseStreamUItf
+    from nsukit.tools.check_func import InvalidRegisterValueError
+    with TCPDeviceEmulator() as emulator:
+        kit = NSUSoc(TCPCmdUItf, ds_itf_class=BaseStreamUItf,
+                     link_param=InitParamSet(cmd_ip='127.0.0.1', cmd_tcp_port=emulator.port, cmd_reg_caps=True))
+        kit.link_cmd()
+        device = emulator.device
+        try:
+            frames = len(device.frames)
+            with kit.batch(side_effects=[0x100]):
+                for _n in range(256):
+                    kit.write(0x1000 + 4 * _n, struct.pack('=I', 0))
+                    kit.write(0x1000 + 4 * _n, struct.pack('=I', _n))
+                kit.write(0x100, b'\x01\x00\x00\x00')
+                kit.write([0x2000, 0x3000], [b'\x02\x00\x00\x00', b'\x03\x00\x00\x00'])
+                kit.write(0x100, b'\x00\x00\x00\x00')
+                kit.bulk_write(0x4000, b'\x04' * 6)
+                assert len(device.frames) == frames
+            ids = [struct.unpack('=I', _f[4:8])[0] for _f in device.frames[frames:]]
+            assert ids == [0x31001010, 0x31001000, REG_BATCH_WRITE, 0x31001000, 0x31001010]
+            assert kit.read(list(range(0x1000, 0x1400, 4))) == [struct.pack('=I', _n) for _n in range(256)]
+            assert kit.bulk_read(0x4000, 8) == b'\x04' * 6 + b'\x00\x00'
+
+            with kit.batch():
+                kit.write(0x5000, b'\x05\x00\x00\x00')
+                assert kit.read(0x5000) == b'\x05\x00\x00\x00'
+
+            # batch只属于打开它的线程
+            results = []
+
+            def other():
+                kit.write(0x7000, b'\x07\x00\x00\x00')
+                results.append(kit.read(0x7000))
+
+            with kit.batch():
+                kit.write(0x6000, b'\x06\x00\x00\x00')
+                thread = threading.Thread(target=other)
+                thread.start()
+                thread.join()
+                assert results == [b'\x07\x00\x00\x00']
+                assert device.registers[0x7000] == b'\x07\x00\x00\x00' and 0x6000 not in device.registers
+                with pytest.raises(InvalidRegisterValueError):
+                    kit.write(0x6004, None)
+            assert device.registers[0x6000] == b'\x06\x00\x00\x00'
+        finally:
+            kit.unlink_cmd()
+
+
+@pytest.mark.parametrize('batch', [True, False])
+def test_contiguous_registers(batch):
+    """!
+    @brief 连续寄存器检测测试
+    @details 给定顺序中的连续段以increment方式读写，其余寄存器按原方式读写，结果按给定顺序返回
+    @return:
+    """
+    device = RegDeviceEmulator(batch=batch)
+    itf = EmulatedCmdUItf(device)
+    itf.reg_caps = REG_CAP_BATCH if batch else 0
+    addrs = [0x40, 0x3000] + list(range(0x1000, 0x1100, 4)) + [0x20, 0x24] + list(range(0x2000, 0x2040, 4))
+    values = [struct.pack('=I', _n) for _n in range(len(addrs))]
+    itf.multi_write(addrs, values)
+    assert [device.registers[_a] for _a in addrs] == values
+    frames = len(device.frames)
+    assert itf.multi_read(addrs) == values
+    ids = [struct.unpack('=I', _f[4:8])[0] for _f in device.frames[frames:]]
+    single = [0x31001031] if batch else [0x31001001] * 2
+    assert ids == single + [0x31001011] + single + [0x31001011]
+
+
+class DictXdma:
+    def __init__(self):
+        self.registers = {}
+        self.blocks = 0
+        self.fail = False       # 为True时块传输返回失败
+
+    def alite_write(self, addr, data, board=0):
+        self.registers[addr] = data
+        return True
+
+    def alite_read(self, addr, board=0):
+        return addr in self.registers, self.registers.get(addr, 0)
+
+    def alite_write_block(self, addr, data, board=0):
+        self.blocks += 1
+        if self.fail:
+            return False
+        self.registers.update(zip(range(addr, addr + 4 * len(data), 4), data.tolist()))
+        return True
+
+    def alite_read_block(self, addr, length, board=0):
+        self.blocks += 1
+        if self.fail:
+            return False, np.zeros(length, dtype=np.uint32)
+        return True, np.array([self.registers.get(_a, 0) for _a in range(addr, addr + 4 * length, 4)], dtype=np.uint32)
+
+
+@pytest.mark.parametrize('batch', [True, False])
+def test_register_array(batch):
+    """!
+    @brief 整数与数组寄存器接口测试
+    @return:
+    """
+    from nsukit import NSUSoc
+    from nsukit.interface import BaseStreamUItf, PCIECmdUItf
+    from nsukit.tools.check_func import InvalidRegisterValueError
+    addrs = np.concatenate((np.arange(0x1000, 0x1400, 4), np.arange(0x3000, 0x3400, 12)))
+    values = np.arange(len(addrs), dtype=np.uint32) * 7
+    with TCPDeviceEmulator(device=RegDeviceEmulator(batch=batch)) as emulator:
+        kit = NSUSoc(TCPCmdUItf, ds_itf_class=BaseStreamUItf,
+                     link_param=InitParamSet(cmd_ip='127.0.0.1', cmd_tcp_port=emulator.port, cmd_reg_caps=True))
+        kit.link_cmd()
+        try:
+            kit.write_array(addrs, values)
+            assert np.array_equal(kit.read_array(addrs), values)
+            assert kit.read(int(addrs[-1])) == values[-1].tobytes()
+            kit.write(addrs[:4], values[:4, None].view(np.uint8)[:, :3])
+            assert kit.read(range(0x1000, 0x1010, 4)) == [(int(_v) & 0xFFFFFF).to_bytes(4, 'little')
+                                                          for _v in values[:4]]
+            kit.write_u32(0x10, 0xDEADBEEF)
+            assert kit.read_u32(0x10) == 0xDEADBEEF
+            kit.load_reg_map({'default': 'cacheable'})
+            kit.write_array([0x20, 0x24], [1, 2])
+            assert kit.read_array([0x24, 0x20]).tolist() == [2, 1]
+            with pytest.raises(InvalidRegisterValueError):
+                kit.write_array([0x20], [-1])
+            with pytest.raises(InvalidRegisterValueError):
+                kit.write_u32(0x20, 1 << 32)
+        finally:
+            kit.unlink_cmd()
+
+    itf = PCIECmdUItf()
+    itf.xdma = DictXdma()
+    itf.write_array(addrs, values)
+    assert itf.xdma.registers[int(addrs[3])] == values[3]
+    assert np.array_equal(itf.read_array(addrs), values)
+    assert itf.xdma.blocks == 2
+    itf.write(0x10, b'\x01\x00\x00\x00')
+    assert itf.read_u32(0x10) == 1 and itf.read(0x10) == b'\x01\x00\x00\x00'
+
+    # ICD指令的收发与连续寄存器读写各以一次块传输完成
+    itf.sent_base, itf.recv_base = 0x8000, 0x8000
+    assert itf._send(b'\x01\x02\x03\x04\x05') == 8 and itf.sent_ptr == 8
+    assert itf._recv(5) == b'\x01\x02\x03\x04\x05' and itf.recv_ptr == 8
+    itf.increment_write(0x9000, b'\xAA' * 4096)
+    assert itf.increment_read(0x9000, 4095) == b'\xAA' * 4095
+    assert itf.xdma.blocks == 6
+
+
+def test_pcie_lite_errors(monkeypatch):
+    """!
+    @brief PCIe块传输失败测试
+    @details ICD指令收发的块传输失败时报错且不移动读写位置；块传输以alite bar的状态判断失败，
+    读到0xFFFFFFFF是合法的值
+    @return:
+    """
+    from nsukit.interface import PCIECmdUItf
+    from nsukit.tools.xdma import xdma_base
+    from nsukit.tools.xdma.xdma import Xdma
+
+    itf = PCIECmdUItf()
+    itf.xdma = DictXdma()
+    itf.sent_base, itf.recv_base = 0x8000, 0x8000
+    itf.xdma.fail = True
+    with pytest.raises(RuntimeError):
+        itf._recv(8)
+    assert itf.recv_ptr == 0 and itf.open_flag
+    with pytest.raises(RuntimeError):
+        itf._send(b'\x01\x02\x03\x04')
+    assert itf.sent_ptr == 0 and not itf.open_flag
+
+    class FakeLib:
+        bar = 0
+        registers = {}
+
+        @classmethod
+        def fpga_info_bar_alite(cls, board):
+            return cls.bar
+
+        @classmethod
+        def fpga_wr_lite(cls, board, addr, data):
+            cls.registers[addr] = data
+
+        @classmethod
+        def fpga_rd_lite(cls, board, addr):
+            return cls.registers.get(addr, 0)
+
+        @staticmethod
+        def fpga_err_msg():
+            return b'lite failed'
+
+    monkeypatch.setattr(xdma_base, 'libxdma', FakeLib)
+    data = np.array([1, 0xFFFFFFFF], dtype=np.uint32)
+    assert Xdma.alite_write_block(0x100, data)
+    ok, res = Xdma.alite_read_block(0x100, 2)
+    assert ok and res.tolist() == [1, 0xFFFFFFFF]
+    FakeLib.bar = -1
+    assert not Xdma.alite_write_block(0x200, data) and 0x200 not in FakeLib.registers
+    assert not Xdma.alite_read_block(0x100, 2)[0]
+
+
+def test_check_reg_schema():
+    """!
+    @brief 寄存器参数检查测试
+    @details range、numpy数组、连续缓冲区的地址与二维字节数组、bytes列表的值走向量化检查，其余逐个检查；
+    地址与值个数不一致时报错
+    @return:
+    """
+    from array import array
+    from nsukit.tools.check_func import check_reg_schema, InvalidRegisterValueError
+    addrs = np.arange(0, 400000, 4, dtype=np.uint32)
+    check_reg_schema(addrs)
+    check_reg_schema(range(0, 400000, 4))
+    check_reg_schema(memoryview(addrs))
+    check_reg_schema(array('I', [0, 4]), [b'\x00', b'\x01\x02\x03\x04'])
+    check_reg_schema(addrs, np.zeros((len(addrs), 4), dtype=np.uint8))
+    check_reg_schema(addrs, [b'\x01\x02\x03\x04'] * len(addrs))
+    for addr, value in [(np.array([4, -4]), None), (range(8, -8, -4), None), ([4, -4], None),
+                        (addrs, np.zeros((len(addrs), 5), dtype=np.uint8)), (np.array([1.5]), None),
+                        (range(0, 8, 4), [b'\x00', b'\x00' * 5]), (range(0, 8, 4), [b'\x00', bytearray(1)]),
+                        (addrs, [b'\x00'] * 3), ([4, 8], [b'\x00']),
+                        (addrs[:2], np.zeros((3, 4), dtype=np.uint8))]:
+        with pytest.raises(InvalidRegisterValueError):
+            check_reg_schema(addr, value)
+
+
+def test_reg_fields():
+    """!
+    @brief 寄存器位域测试
+    @details 多个位域的更新以一次读取、一次写入完成，未涉及的位保持原值；状态寄存器可按数组解码
+    @return:
+    """
+    from nsukit import NSUSoc
+    from nsukit.interface import BaseStreamUItf
+    from nsukit.tools.check_func import InvalidRegisterValueError
+    reg_map = {'registers': {
+        'ctrl': {'addr': '0x100', 'fields': {'enable': '0', 'mode': '3:1'}},
+        'gain': {'addr': '0x200', 'fields': {'dac0': '7:0', 'dac1': '15:8'}},
+        'trig': {'addr': '0x300', 'access': 'wo', 'reset': '0xF0', 'fields': {'start': '0'}},
+        'status': {'addr': '0x104', 'access': 'ro', 'fields': {'locked': '0', 'temp': '27:16'}},
+    }}
+    with TCPDeviceEmulator() as emulator:
+        kit = NSUSoc(TCPCmdUItf, ds_itf_class=BaseStreamUItf,
+                     link_param=InitParamSet(cmd_ip='127.0.0.1', cmd_tcp_port=emulator.port, cmd_reg_caps=True))
+        kit.link_cmd()
+        kit.load_reg_map(reg_map)
+        device = emulator.device
+        try:
+            device.registers[0x100] = struct.pack('=I', 0x80000000)
+            device.registers[0x200] = struct.pack('=I', 0x00AA0000)
+            device.registers[0x104] = struct.pack('=I', 0x00230001)
+            frames = len(device.frames)
+            kit.fields.update({'ctrl.enable': 1, 'ctrl.mode': 5, 'gain.dac1': 0x12, 'trig.start': 1})
+            assert len(device.frames) - frames == 2
+            assert struct.unpack('=I', device.registers[0x100])[0] == 0x8000000B
+            assert struct.unpack('=I', device.registers[0x200])[0] == 0x00AA1200
+            assert struct.unpack('=I', device.registers[0x300])[0] == 0xF1
+            assert kit.fields.read(['status', 'ctrl.mode']) == {'status.locked': 1, 'status.temp': 0x23,
+                                                                 'ctrl.mode': 5}
+            with pytest.raises(InvalidRegisterValueError):
+                kit.fields.update({'status.locked': 0})
+            with pytest.raises(InvalidRegisterValueError):
+                kit.fields.update({'ctrl.mode': 8})
+        finally:
+            kit.unlink_cmd()
+
+    decoded = kit.fields.decode('status', np.array([0x00230001, 0x00240000], dtype=np.uint32))
+    assert decoded['locked'].tolist() == [1, 0] and decoded['temp'].tolist() == [0x23, 0x24]
+    assert kit.fields.encode('ctrl', {'mode': 2}) == 4
+
+
+def test_telemetry():
+    """!
+    @brief 后台遥测测试
+    @details 环形缓冲区写满后保留最近的样本；后台采样与主线程的寄存器读写共用一条链路时互不干扰；
+    采样不经过寄存器影子，也不会提前下发调用者with kit.batch()中收集的写入
+    @return:
+    """
+    from nsukit import NSUSoc
+    from nsukit.interface import BaseStreamUItf
+    reg_map = {'ranges': [{'base': '0x100', 'length': 8, 'policy': 'cacheable'}],
+               'registers': {'status': {'addr': '0x104', 'access': 'ro', 'fields': {'temp': '27:16'}}}}
+    with TCPDeviceEmulator() as emulator:
+        kit = NSUSoc(TCPCmdUItf, ds_itf_class=BaseStreamUItf,
+                     link_param=InitParamSet(cmd_ip='127.0.0.1', cmd_tcp_port=emulator.port, cmd_reg_caps=True))
+        kit.link_cmd()
+        kit.load_reg_map(reg_map)
+        device = emulator.device
+        try:
+            kit.telemetry.configure({'counter': 0x100, 'temp': 'status.temp'}, rate=200, depth=4)
+            for _n in range(6):
+                device.registers[0x100] = struct.pack('=I', _n)
+                device.registers[0x104] = struct.pack('=I', (0x20 + _n) << 16)
+                kit.telemetry.sample()
+            times, values = kit.telemetry.snapshot()
+            assert kit.telemetry.count == 6 and np.all(np.diff(times) >= 0)
+            assert values['counter'].tolist() == [2, 3, 4, 5]
+            assert values['temp'].tolist() == [0x22, 0x23, 0x24, 0x25]
+            assert kit.telemetry.latest() == {'counter': 5, 'temp': 0x25}
+
+            kit.telemetry.configure({'counter': 0x100}, rate=200, depth=64)
+            kit.telemetry.start()
+            with pytest.raises(RuntimeError):
+                kit.telemetry.configure({'counter': 0x100})
+            for _n in range(200):
+                kit.write(0x200, struct.pack('=I', _n))
+                assert kit.read(0x200) == struct.pack('=I', _n)
+            kit.telemetry.stop()
+            assert kit.telemetry.count > 0 and kit.telemetry.errors == 0
+            assert set(kit.telemetry.snapshot()[1]['counter'].tolist()) == {5}
+
+            kit.telemetry.start()
+            with kit.batch():
+                kit.write(0x300, b'\x03\x00\x00\x00')
+                count = kit.telemetry.count
+                while kit.telemetry.count < count + 3:
+                    time.sleep(0.005)
+                assert 0x300 not in device.registers
+            kit.telemetry.stop()
+            assert device.registers[0x300] == b'\x03\x00\x00\x00'
+            assert kit.telemetry.errors == 0
+        finally:
+            kit.unlink_cmd()
+    assert not kit.telemetry.running
@@ -0,0 +1,533 @@
+# Copyright (c) [2023] [Mulan PSL v2]
+# [NSUKit] is licensed under Mulan PSL v2.
+# You can use this software according to the terms and conditions of the Mulan PSL v2.
+# You may obtain a copy of Mulan PSL v2 at:
+#          http://license.coscl.org.cn/MulanPSL2
+# THIS SOFTWARE IS PROVIDED ON AN "AS IS" BASIS, WITHOUT WARRANTIES OF ANY KIND,
+# EITHER EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO NON-INFRINGEMENT,
+# MERCHANTABILITY OR FIT FOR A PARTICULAR PURPOSE.
+# See the Mulan PSL v2 for more details.
+
+import json
+import time
+import struct
+import threading
+
+import numpy as np
+import pytest
+
+from nsukit.interface import BaseCmdUItf
+from nsukit.middleware.icd_parser import ICDRegMw, ParamRecord
+from nsukit.tools.icd_cache import ICDCache, LazyTable
+
+ICD = {
+    "param": {
+        "参数1": ["uint32", "0x51"],
+        "参数2": ["float", 10.5],
+        "参数3": ["int8", 1],
+        "衰减": ["uint8", 0, "min(max(0, (63-(40-2*x))), 63)"],
+    },
+    "command": {
+        "指令1": {
+            "send": [
+                ["uint32", "0x5F5F5F5F"],
+                ["uint32", "0x31000001"],
+                ["uint32", "0x00000000"],
+                ["uint32", 0],
+                "参数2",
+                "参数1",
+                "衰减"
+            ],
+            "recv": [
+                ["uint32", "0xCFCFCFCF"],
+                ["uint32", "0x31000001"],
+                ["uint32", "0x00000000"],
+                ["uint32", 17],
+                "参数3"
+            ]
+        },
+        "指令2": {
+            "send": [
+                ["uint32", "0x5F5F5F5F"],
+                ["uint32", "0x31000002"],
+                ["uint32", "0x00000000"],
+                ["uint32", 0],
+                "{{字段序列}}"
+            ],
+            "recv": []
+        },
+        "数组指令": {
+            "send": [
+                ["uint32", "0x5F5F5F5F"],
+                ["uint32", "0x31000004"],
+                ["uint32", "0x00000000"],
+                ["uint32", 0],
+                "__arraylength__[0]",
+                "__arraylength__[all]",
+                "__array__[0]",
+                "__array__[1]"
+            ],
+            "recv": []
+        },
+        "查询指令": {
+            "query": True,
+            "ttl": 60,
+            "send": [
+                ["uint32", "0x5F5F5F5F"],
+                ["uint32", "0x31000003"],
+                ["uint32", "0x00000000"],
+                ["uint32", 0]
+            ],
+            "recv": [
+                ["uint32", "0xCFCFCFCF"],
+                ["uint32", "0x31000003"],
+                ["uint32", "0x00000000"],
+                ["uint32", 17],
+                "参数3"
+            ]
+        }
+    },
+    "sequence": {
+        "配置序列": ["指令1", "指令1", "指令1"],
+        "字段序列": ["参数3", ["uint16", "0x0102"]]
+    }
+}
+
+
+class EchoCmdUItf(BaseCmdUItf):
+    """!
+    按ICD约定对每条指令回复 包头、ID、序号、长度、参数3 的模拟设备
+    """
+    pipelined = True
+
+    def __init__(self):
+        self.received = b''
+        self.replies = b''
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.commands = []
+        self.status = None      # 回复的参数3，为None时回复序号%100
+
+    def send_bytes(self, data: bytes) -> int:
+        self.received += bytes(data)
+        while len(self.received) >= 16:
+            length = struct.unpack('=I', self.received[12:16])[0]
+            if len(self.received) < length:
+                break
+            frame, self.received = self.received[:length], self.received[length:]
+            self.commands.append(frame)
+            _, cid, seq, _ = struct.unpack('=IIII', frame[:16])
+            self.replies += struct.pack('=IIIIb', 0xCFCFCFCF, cid, seq, 17,
+                                        seq % 100 if self.status is None else self.status)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return len(data)
+
+    def recv_bytes(self, size: int) -> bytes:
+        data, self.replies = self.replies[:size], self.replies[size:]
+        self.in_flight = len(self.replies) // 17
+        return data
+
+
+class Kit:
+    def __init__(self):
+        self.itf_cs = EchoCmdUItf()
+
+
+@pytest.fixture
+def icd_mw(tmp_path, monkeypatch):
+    monkeypatch.setenv('NSUKIT_CACHE_DIR', str(tmp_path / 'cache'))
+    path = tmp_path / 'icd.json'
+    path.write_text(json.dumps(ICD, ensure_ascii=False), encoding='utf-8')
+    mw = ICDRegMw(Kit(), str(path))
+    assert mw.load()
+    mw.check_recv_head = True
+    return mw
+
+
+def test_fmt_command_plan(icd_mw):
+    """!
+    @brief 预编译指令打包测试
+    @details 指令长度字段回填，参数变化后重新打包
+    @return:
+    """
+    expect = struct.pack('=IIIIfIB', 0x5F5F5F5F, 0x31000001, 0, 25, 10.5, 0x51, 23)
+    assert icd_mw.fmt_command('指令1') == expect
+    icd_mw.set_param('参数1', '0x10')
+    icd_mw.set_param('衰减', 30)
+    expect = struct.pack('=IIIIfIB', 0x5F5F5F5F, 0x31000001, 0, 25, 10.5, 0x10, 63)
+    assert icd_mw.fmt_command('指令1') == expect
+    assert icd_mw.fmt_command('指令1', 'recv') == struct.pack('=IIIIb', 0xCFCFCFCF, 0x31000001, 0, 17, 1)
+
+
+def test_compile_expr():
+    """!
+    @brief 受限表达式编译测试
+    @return:
+    """
+    from nsukit.tools.expr_eval import compile_expr, InvalidExpressionError
+    assert compile_expr('min(max(0, (63-(40-x))), 63)')(10) == 33
+    assert compile_expr('int(x * 2**32 / 1e9) & 0xFFFF')(1e6) == 35127
+    for source in ('__import__("os")', 'x.__class__', 'open("icd.json")', '[x]'):
+        with pytest.raises(InvalidExpressionError):
+            compile_expr(source)
+
+
+def test_file_cache(tmp_path):
+    """!
+    @brief 文件缓存测试
+    @details 文件修改后重新读取，大文件以mmap方式映射
+    @return:
+    """
+    import os
+    from nsukit.tools.file_cache import FileCache
+    path = tmp_path / 'wave.dat'
+    path.write_bytes(b'\x01' * 8)
+    cache = FileCache(max_entries=2, mmap_threshold=16)
+    data, length = cache.get(str(path))
+    assert (bytes(data), length) == (b'\x01' * 8, 8)
+    assert cache.get(str(path))[0] is data
+    path.write_bytes(b'\x02' * 32)
+    os.utime(path, ns=(0, 1))
+    data, length = cache.get(str(path))
+    assert length == 32 and not isinstance(data, bytes) and data[:] == b'\x02' * 32
+    assert FileCache.size(str(path)) == 32
+
+
+def test_execute_many_pipelined(icd_mw):
+    """!
+    @brief 流水线执行测试
+    @details 每条指令写入唯一序号，在途指令数不超过window
+    @return:
+    """
+    itf = icd_mw.kit.itf_cs
+    icd_mw.execute_many(['指令1'] * 10, window=4)
+    seqs = [struct.unpack('=I', frame[8:12])[0] for frame in itf.commands]
+    assert len(set(seqs)) == 10 and 0 not in seqs
+    assert itf.max_in_flight == 4
+    assert icd_mw.get_param('参数3') == seqs[-1] % 100
+
+
+def test_execute_many_errors(icd_mw):
+    """!
+    @brief 流水线执行出错测试
+    @details 发送不完整或收到序号不匹配的反馈时报错，报错前收完在途指令的反馈；
+    只有序号为0的反馈按发送顺序匹配
+    @return:
+    """
+    itf = icd_mw.kit.itf_cs
+    send_bytes = itf.send_bytes
+    sent = []
+
+    def short_send(data):
+        sent.append(data)
+        return send_bytes(data[:-1] if len(sent) == 3 else data)
+
+    itf.send_bytes = short_send
+    with pytest.raises(RuntimeError, match='total_len'):
+        icd_mw.execute_many(['指令1'] * 6, window=4)
+    assert len(sent) == 3 and itf.replies == b''
+    itf.send_bytes, itf.received = send_bytes, b''
+
+    def reply_seq(seq, frame=None):
+        # 将第frame条(为None时每条)指令反馈中的序号改为seq
+        sent.clear()
+
+        def send(data):
+            sent.append(data)
+            send_bytes(data)
+            if frame is None or len(sent) == frame:
+                itf.replies = itf.replies[:-9] + struct.pack('=I', seq) + itf.replies[-5:]
+            return len(data)
+        return send
+
+    itf.send_bytes = reply_seq(0)
+    icd_mw.execute_many(['指令1'] * 3, window=4)
+    itf.send_bytes = reply_seq(0xFFFF, frame=2)
+    with pytest.raises(RuntimeError, match='Unexpected feedback'):
+        icd_mw.execute_many(['指令1'] * 3, window=4)
+    assert itf.replies == b''
+    itf.send_bytes = send_bytes
+    icd_mw.execute_many(['指令1'] * 3, window=4)
+
+
+def test_execute_sequence(icd_mw):
+    """!
+    @brief 指令序列测试
+    @details 指令序列一次发送、一次接收；字段序列展开到指令中
+    @return:
+    """
+    itf = icd_mw.kit.itf_cs
+    sent = []
+    send_buffers = itf.send_buffers
+    itf.send_buffers = lambda buffers: sent.append(1) or send_buffers(buffers)
+    icd_mw.execute('配置序列')
+    assert len(sent) == 1 and len(itf.commands) == 3
+    assert icd_mw.get_param('参数3') == struct.unpack('=I', itf.commands[-1][8:12])[0] % 100
+    assert icd_mw.fmt_command('指令2') == struct.pack('=IIIIbH', 0x5F5F5F5F, 0x31000002, 0, 19,
+                                                                 icd_mw.get_param('参数3'), 0x0102)
+
+
+def test_reply_layout(icd_mw):
+    """!
+    @brief 反馈格式预编译测试
+    @details 反馈一次解析，只有参数字段写回参数表
+    @return:
+    """
+    reply = icd_mw.get_reply_layout('指令1')
+    assert reply.size == 17
+    assert [(index, record) for index, record in reply.fields] == [(4, ['int8', 1])]
+    assert reply.fields[0][1] is icd_mw.param['参数3']
+    icd_mw.enable_param('指令1', struct.pack('=IIIIb', 0xCFCFCFCF, 0x31000001, 0, 17, -5))
+    assert icd_mw.get_param('参数3') == -5
+    assert icd_mw.get_reply_layout('指令2').size == 0
+
+
+def test_icd_cache(tmp_path):
+    """!
+    @brief icd解析缓存测试
+    @details 内容不变时命中缓存，内容变化后重新解析
+    @return:
+    """
+    path = tmp_path / 'icd.json'
+    path.write_text(json.dumps(ICD, ensure_ascii=False), encoding='utf-8')
+    cache = ICDCache(str(tmp_path / 'cache'))
+    assert cache.load(str(path)) == ICD
+    cache_file = cache.cache_path(path.read_bytes())
+    with open(cache_file, 'rb') as fp:
+        blob = fp.read()
+    assert blob.startswith(b'NSUICD')
+    cached = cache.load(str(path))
+    assert isinstance(cached['param'], LazyTable)
+    assert cached == ICD
+    cached['param']['参数1'][1] = 1
+    cached['param']['参数5'] = ['uint8', 5]
+    assert list(cached['param'])[-1] == '参数5'
+    assert json.loads(json.dumps(cached, default=dict))['param']['参数1'] == ['uint32', 1]
+
+    changed = dict(ICD, param={**ICD['param'], '参数4': ['uint16', 4]})
+    path.write_text(json.dumps(changed, ensure_ascii=False), encoding='utf-8')
+    assert cache.load(str(path))['param']['参数4'] == ['uint16', 4]
+    assert len(list((tmp_path / 'cache').iterdir())) == 2
+
+    with open(cache_file, 'wb') as fp:
+        fp.write(b'NSUICD\xff\xff')
+    path.write_text(json.dumps(ICD, ensure_ascii=False), encoding='utf-8')
+    assert cache.load(str(path)) == ICD
+
+
+def test_param_store(icd_mw):
+    """!
+    @brief 参数表测试
+    @details 参数值在加载与设置时按类型规范化，新增参数后重新编译指令
+    @return:
+    """
+    assert icd_mw.get_param('参数1') == 0x51
+    assert isinstance(icd_mw.param['参数1'], ParamRecord)
+    assert icd_mw.param['衰减'] == ['uint8', 0, 'min(max(0, (63-(40-2*x))), 63)']
+    icd_mw.set_param('参数1', '0b101')
+    assert icd_mw.get_param('参数1') == 5
+    icd_mw.set_param('参数2', '2')
+    assert icd_mw.get_param('参数2') == 2.0 and isinstance(icd_mw.get_param('参数2'), float)
+    icd_mw.set_param('参数3', '7.9')
+    assert icd_mw.get_param('参数3') == 7
+    with pytest.raises(ValueError):
+        icd_mw.set_param('参数3', 'abc')
+    assert icd_mw.fmt_command('指令1')[16:] == struct.pack('=fIB', 2.0, 5, 23)
+
+    plan = icd_mw.get_plan('指令1', 'send')
+    assert icd_mw.get_param('参数9', 3) == 3
+    assert '参数9' not in icd_mw.param and icd_mw.get_plan('指令1', 'send') is plan
+    icd_mw.set_param('参数10', '0x10')
+    assert icd_mw.param['参数10'] == ['uint32', 16]
+
+
+def test_save_after_execute(icd_mw):
+    """!
+    @brief 执行指令后保存icd
+    @details 反馈写入的参数值与set_param设置的值都随icd保存
+    @return:
+    """
+    icd_mw.kit.itf_cs.status = 123
+    icd_mw.set_param('参数2', 2)
+    icd_mw.execute('指令1')
+    assert icd_mw.get_param('参数3') == 123
+    assert icd_mw.save()
+    with open(icd_mw._file_name.split('.')[0] + '_run.json', encoding='utf-8') as fp:
+        saved = json.load(fp)['param']
+    assert saved['参数3'] == ['int8', 123]
+    assert saved['参数2'] == ['float', 2.0]
+    assert saved['衰减'] == ICD['param']['衰减']
+
+
+def test_execute_from_pnames(icd_mw):
+    """!
+    @brief 参数→指令索引测试
+    @details 参数涉及的指令去重后只执行一次，字段序列中的参数同样计入
+    @return:
+    """
+    assert icd_mw.commands_of_param('参数1') == ('指令1', )
+    assert icd_mw.commands_of_param('参数3') == ('指令2', )
+    assert icd_mw.commands_of_param('指令2') == ('指令2', )
+    assert icd_mw.commands_of_param('参数9') == ()
+    icd_mw.execute_from_pnames(['参数1', '参数2', '衰减', '参数9'])
+    assert len(icd_mw.kit.itf_cs.commands) == 1
+
+
+def test_dirty_tracking(icd_mw):
+    """!
+    @brief 脏标记测试
+    @details 参数未变化的指令不重复发送，sync只发送参数变化的指令；结果参数非0的反馈不清除脏标记；
+    未开启dirty_tracking时保持原有行为
+    @return:
+    """
+    itf = icd_mw.kit.itf_cs
+    itf.status = 0
+    icd_mw.execute('指令1', only_if_dirty=True)
+    assert len(itf.commands) == 1 and icd_mw.is_dirty('指令1')
+    with pytest.raises(RuntimeError):
+        icd_mw.sync()
+    itf.commands.clear()
+    icd_mw.dirty_tracking = True
+    itf.status = 1
+    icd_mw.execute('指令1', only_if_dirty=True)
+    assert icd_mw.is_dirty('指令1')
+    itf.commands.clear()
+    itf.status = 0
+    icd_mw.execute('指令1', only_if_dirty=True)
+    icd_mw.execute('指令1', only_if_dirty=True)
+    assert len(itf.commands) == 1 and not icd_mw.is_dirty('指令1')
+    icd_mw.set_param('参数1', 0x51)
+    icd_mw.sync()
+    assert len(itf.commands) == 1
+    icd_mw.set_param('参数1', 2)
+    icd_mw.set_param('衰减', 3)
+    assert icd_mw.is_dirty('指令1') and icd_mw.is_dirty('配置序列')
+    icd_mw.sync()
+    assert len(itf.commands) == 2 and struct.unpack('=I', itf.commands[-1][20:24])[0] == 2
+    icd_mw.sync()
+    icd_mw.execute('指令1', only_if_dirty=True)
+    assert len(itf.commands) == 2
+    icd_mw.execute('指令1')
+    assert len(itf.commands) == 3
+
+
+def test_query_single_flight(icd_mw):
+    """!
+    @brief 查询指令合并测试
+    @details 并发的同一查询只发送一次请求，ttl内直接使用上次结果
+    @return:
+    """
+    itf = icd_mw.kit.itf_cs
+    send_bytes = itf.send_bytes
+    itf.send_bytes = lambda data: time.sleep(0.05) or send_bytes(data)
+    threads = [threading.Thread(target=icd_mw.execute, args=('查询指令', )) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(itf.commands) == 1
+    icd_mw.execute('查询指令')
+    assert len(itf.commands) == 1
+    icd_mw.invalidate_query('查询指令')
+    icd_mw.execute('查询指令')
+    assert len(itf.commands) == 2
+
+
+def test_query_params(icd_mw):
+    """!
+    @brief 带输入参数的查询指令测试
+    @details ttl内修改查询指令的输入参数后重新发送请求，参数未变化时使用缓存结果
+    @return:
+    """
+    icd_mw.command['通道查询'] = dict(ICD['command']['查询指令'])
+    icd_mw.command['通道查询']['send'] = ICD['command']['查询指令']['send'] + ['参数1']
+    itf = icd_mw.kit.itf_cs
+    icd_mw.execute('通道查询')
+    icd_mw.execute('通道查询')
+    assert len(itf.commands) == 1
+    icd_mw.set_param('参数1', 2)
+    icd_mw.execute('通道查询')
+    assert len(itf.commands) == 2 and struct.unpack('=I', itf.commands[-1][16:20])[0] == 2
+    icd_mw.set_param('参数1', 2)
+    icd_mw.execute('通道查询')
+    assert len(itf.commands) == 2
+
+
+def test_kit_query_single_flight(tmp_path, monkeypatch):
+    """!
+    @brief 板卡级查询指令合并测试
+    @details 经NSUSoc.execute并发执行同一查询时，链路锁在合并之后获取，ttl为0时仍只发送一次请求
+    @return:
+    """
+    from nsukit import NSUSoc
+    from nsukit.interface import BaseStreamUItf, InitParamSet
+    monkeypatch.setenv('NSUKIT_CACHE_DIR', str(tmp_path / 'cache'))
+    icd = json.loads(json.dumps(ICD))
+    icd['command']['查询指令']['ttl'] = 0
+    path = tmp_path / 'icd.json'
+    path.write_text(json.dumps(icd, ensure_ascii=False), encoding='utf-8')
+    kit = NSUSoc(EchoCmdUItf, ds_itf_class=BaseStreamUItf)
+    kit.mw_cmd.config(InitParamSet(icd_path=str(path), check_recv_head=True))
+    itf = kit.itf_cs
+    send_bytes = itf.send_bytes
+    itf.send_bytes = lambda data: time.sleep(0.05) or send_bytes(data)
+    threads = [threading.Thread(target=kit.execute, args=('查询指令', )) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(itf.commands) == 1
+    kit.execute('查询指令')
+    assert len(itf.commands) == 2
+
+
+def test_sweep(icd_mw):
+    """!
+    @brief 参数扫描测试
+    @details 整列打包的指令帧与逐点打包一致，反馈按扫描点返回
+    @return:
+    """
+    itf = icd_mw.kit.itf_cs
+    gains = np.arange(100, dtype=np.float64) / 4
+    result = icd_mw.sweep('指令1', {'参数2': gains, '衰减': np.arange(100) % 40}, window=8)
+    assert len(itf.commands) == 100 and itf.max_in_flight <= 8
+    for point, frame in enumerate(itf.commands):
+        icd_mw.set_param('参数2', gains[point])
+        icd_mw.set_param('衰减', point % 40)
+        expect = icd_mw.fmt_command('指令1')
+        assert frame[:8] + frame[12:] == expect[:8] + expect[12:]
+    seqs = [struct.unpack('=I', frame[8:12])[0] for frame in itf.commands]
+    assert result.dtype.names == ('参数3', ) and result.shape == (100, )
+    assert result['参数3'].tolist() == [seq % 100 for seq in seqs]
+    assert icd_mw.get_param('参数3') == seqs[-1] % 100
+
+    with pytest.raises(ValueError):
+        icd_mw.sweep('指令1', {'参数3': gains})
+
+    # 超出字段范围的点报错，整数字段的浮点值与逐点执行一样转换
+    itf.commands.clear()
+    with pytest.raises(ValueError):
+        icd_mw.sweep('指令1', {'参数1': np.array([1, 2 ** 32])})
+    assert not itf.commands
+    icd_mw.sweep('指令1', {'参数1': np.array([1.7, -0.5])}, window=1)
+    assert [struct.unpack('=I', frame[20:24])[0] for frame in itf.commands] == [1, 0]
+
+
+def test_array_payload(icd_mw):
+    """!
+    @brief 数组载荷测试
+    @details 行连续的非连续数组逐行以memoryview发送，不复制数据
+    @return:
+    """
+    table = np.arange(8 * 2048, dtype=np.uint32).reshape(8, 2048)
+    rows = table[::2]
+    small = np.arange(6, dtype=np.int16)[::2]
+    parts, total = icd_mw.fmt_command_parts('数组指令', arrays=[rows, small])
+    assert total == 24 + rows.nbytes + small.nbytes
+    assert len(parts) == 1 + 4 + 1
+    for index, part in enumerate(parts[1:5]):
+        assert isinstance(part, memoryview) and np.shares_memory(np.asarray(part), table[index * 2])
+    frame = b''.join(parts)
+    assert struct.unpack('=IIII', frame[8:24]) == (0, total, rows.nbytes, rows.nbytes + small.nbytes)
+    assert frame[24:] == rows.tobytes() + small.tobytes()